@@ -0,0 +1,190 @@
+from datetime import datetime, time, timedelta
+
+# =====================================================================
+# DISPONIBILIDADE / TEMPO PARADO POR MÁQUINA E POR PERÍODO
+# =====================================================================
+#
+# Os períodos (hora, turno, dia, semana) são montados aqui — são poucos —
+# e toda a conta de intervalos fica numa única query no PostgreSQL:
+#   - paradas ainda abertas contam até "agora";
+#   - paradas sobrepostas da mesma máquina (ex.: AUTO + MANUAL) são
+#     unidas antes, para o mesmo minuto não contar duas vezes;
+#   - cada intervalo é recortado nas bordas de cada período
+#     (LEAST(fim) - GREATEST(início)).
+# Disponibilidade = 1 - parado / tempo do período (até agora).
+
+GRANULARIDADES = ("hora", "turno", "dia", "semana")
+
+TURNOS_PADRAO = "A=06:00-14:00,B=14:00-22:00,C=22:00-06:00"
+
+
+def ler_turnos(texto: str) -> list:
+    """'A=06:00-14:00,B=...' → [(nome, início, duração)]. Levanta ValueError."""
+    turnos = []
+    for item in texto.split(","):
+        nome, faixa = item.strip().split("=")
+        ini, fim = (datetime.strptime(h.strip(), "%H:%M").time() for h in faixa.split("-"))
+        inicio = timedelta(hours=ini.hour, minutes=ini.minute)
+        duracao = timedelta(hours=fim.hour, minutes=fim.minute) - inicio
+        if duracao <= timedelta(0):
+            duracao += timedelta(days=1)  # turno que vira a noite
+        turnos.append((nome.strip(), inicio, duracao))
+    return turnos
+
+
+def montar_periodos(desde: datetime, ate: datetime, granularidade: str, turnos: list) -> list:
+    """[(início, fim, rótulo)] cobrindo [desde, ate), recortados nas pontas."""
+    periodos = []
+    if granularidade == "turno":
+        dia = datetime.combine(desde.date(), time()) - timedelta(days=1)
+        while dia < ate:
+            for nome, inicio, duracao in turnos:
+                ini = dia + inicio
+                periodos.append((ini, ini + duracao, f"{ini:%Y-%m-%d} {nome}"))
+            dia += timedelta(days=1)
+    else:
+        if granularidade == "hora":
+            ini, passo = desde.replace(minute=0, second=0, microsecond=0), timedelta(hours=1)
+        elif granularidade == "dia":
+            ini, passo = datetime.combine(desde.date(), time()), timedelta(days=1)
+        else:  # semana começando na segunda
+            ini = datetime.combine(desde.date() - timedelta(days=desde.weekday()), time())
+            passo = timedelta(days=7)
+        while ini < ate:
+            periodos.append((ini, ini + passo, ini.isoformat()))
+            ini += passo
+
+    return sorted(
+        (max(ini, desde), min(fim, ate), rotulo)
+        for ini, fim, rotulo in periodos
+        if fim > desde and ini < ate
+    )
+
+
+# Usa ix_paradas_fim (migração 006) + ix_paradas_start_id para achar só as
+# paradas que encostam no intervalo pedido.
+SQL_TEMPO_PARADO = """
+    WITH periodos (inicio, fim) AS (
+        SELECT * FROM unnest(%(inicios)s::timestamp[], %(fins)s::timestamp[])
+    ),
+    p AS (
+        SELECT machine,
+               GREATEST(start_time, %(desde)s) AS ini,
+               LEAST(COALESCE(end_time, %(agora)s), %(ate)s) AS fim,
+               start_time
+        FROM paradas
+        WHERE start_time < %(ate)s
+          AND COALESCE(end_time, 'infinity'::timestamp) > %(desde)s
+          AND (%(maquinas)s::text[] IS NULL OR machine = ANY(%(maquinas)s::text[]))
+    ),
+    marcadas AS (
+        SELECT machine, ini, fim,
+               CASE WHEN ini <= MAX(fim) OVER (
+                        PARTITION BY machine ORDER BY ini, fim
+                        ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)
+                    THEN 0 ELSE 1 END AS nova_ilha
+        FROM p
+        WHERE fim > ini
+    ),
+    ilhas AS (
+        SELECT machine, ini, fim,
+               SUM(nova_ilha) OVER (PARTITION BY machine ORDER BY ini, fim) AS ilha
+        FROM marcadas
+    ),
+    unidas AS (
+        SELECT machine, MIN(ini) AS ini, MAX(fim) AS fim
+        FROM ilhas
+        GROUP BY machine, ilha
+    ),
+    parado AS (
+        SELECT u.machine, pr.inicio,
+               SUM(EXTRACT(EPOCH FROM LEAST(u.fim, pr.fim) - GREATEST(u.ini, pr.inicio))) / 60.0
+                   AS minutos
+        FROM unidas u
+        JOIN periodos pr ON u.ini < pr.fim AND u.fim > pr.inicio
+        GROUP BY u.machine, pr.inicio
+    ),
+    quantidade AS (
+        SELECT p.machine, pr.inicio, COUNT(*) AS qtd
+        FROM p
+        JOIN periodos pr ON p.start_time >= pr.inicio AND p.start_time < pr.fim
+        GROUP BY p.machine, pr.inicio
+    )
+    SELECT COALESCE(a.machine, q.machine), COALESCE(a.inicio, q.inicio),
+           COALESCE(a.minutos, 0), COALESCE(q.qtd, 0)
+    FROM parado a
+    FULL JOIN quantidade q ON q.machine = a.machine AND q.inicio = a.inicio
+"""
+
+
+def calcular_disponibilidade(cur, desde: datetime, ate: datetime, granularidade: str,
+                             agora: datetime, turnos: list, maquinas: list = None,
+                             max_periodos: int = 5000, cadastradas=()) -> dict:
+    """
+    {"maquinas": {machine: [por período]}, "totais": {machine: {...}}}.
+    Sem filtro de `maquinas`, saem as `cadastradas` mais as que tiveram
+    parada no intervalo. Levanta ValueError se o intervalo der mais de
+    max_periodos períodos.
+    """
+    periodos = montar_periodos(desde, ate, granularidade, turnos)
+    if len(periodos) > max_periodos:
+        raise ValueError(
+            f"{len(periodos)} períodos (máximo {max_periodos}); use uma granularidade maior"
+        )
+    cur.execute(
+        SQL_TEMPO_PARADO,
+        {
+            "inicios": [p[0] for p in periodos],
+            "fins": [p[1] for p in periodos],
+            "desde": desde,
+            "ate": ate,
+            "agora": agora,
+            "maquinas": maquinas,
+        },
+    )
+    parado = {(m, ini): (float(minutos), qtd) for m, ini, minutos, qtd in cur.fetchall()}
+
+    # Máquina sem nenhuma parada no intervalo também sai (100% disponível)
+    todas = sorted(set(maquinas or cadastradas) | {m for m, _ in parado})
+
+    # Tempo de cada período até agora (período futuro não conta)
+    planejados = [
+        max(0.0, (min(fim, agora) - ini).total_seconds() / 60.0) for ini, fim, _ in periodos
+    ]
+
+    por_maquina = {}
+    totais = {}
+    for m in todas:
+        linhas = []
+        soma_parado = soma_planejado = soma_qtd = 0
+        for (ini, fim, rotulo), planejado in zip(periodos, planejados):
+            minutos, qtd = parado.get((m, ini), (0.0, 0))
+            linhas.append(
+                {
+                    "periodo": rotulo,
+                    "inicio": ini.isoformat(),
+                    "fim": fim.isoformat(),
+                    "paradas": qtd,
+                    "minutos_parada": round(minutos, 2),
+                    "minutos_planejados": round(planejado, 2),
+                    "disponibilidade": _disponibilidade(minutos, planejado),
+                }
+            )
+            soma_parado += minutos
+            soma_planejado += planejado
+            soma_qtd += qtd
+        por_maquina[m] = linhas
+        totais[m] = {
+            "paradas": soma_qtd,
+            "minutos_parada": round(soma_parado, 2),
+            "minutos_planejados": round(soma_planejado, 2),
+            "disponibilidade": _disponibilidade(soma_parado, soma_planejado),
+        }
+
+    return {"maquinas": por_maquina, "totais": totais}
+
+
+def _disponibilidade(parado: float, planejado: float):
+    if planejado <= 0:
+        return None
+    return round(max(0.0, 1.0 - parado / planejado), 4)
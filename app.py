@@ -1,11 +1,96 @@
+import atexit
 import json
+import logging
+import os
+import queue
+import threading
+import time
 from datetime import datetime, timedelta
 
-from flask import Flask, request, jsonify, session
+from flask import Flask, Response, request, jsonify, session, g, has_app_context, has_request_context
 from flask_cors import CORS
 import psycopg2
+from psycopg2.extras import execute_values
 from werkzeug.security import generate_password_hash, check_password_hash
 
+from pool_pg import PoolEsgotado, PoolPostgres
+from configuracao import (
+    ARQUIVO_EVENTOS,
+    ARQUIVO_EVENTOS_DIR,
+    ARQUIVO_FSYNC_S,
+    ARQUIVO_MAX_IDADE_S,
+    ARQUIVO_MAX_MB,
+    CACHE_REAQUECER_S,
+    DASHBOARD_JANELA_DIAS,
+    DEDUP_EVENTOS,
+    DEDUP_MEMORIA,
+    DEDUP_RETER_DIAS,
+    ESTADO_BACKEND,
+    EVENTOS_BRUTOS,
+    EVENTOS_PUSH,
+    HISTORICO_LIMITE_MAX,
+    HISTORICO_LIMITE_PADRAO,
+    LOTE_MAX_EVENTOS,
+    MAQUINAS_VISTO_S,
+    PARADA_OSCILACAO_S,
+    PARADAS_PENDENTES_S,
+    PARAMETROS_PG,
+    PG_POOL_MAX,
+    PG_POOL_MAX_VIDA_S,
+    PG_POOL_MIN,
+    PG_POOL_OCIOSO_CHECK_S,
+    PG_POOL_TIMEOUT_S,
+    SEM_COMUNICACAO_S,
+    TURNOS,
+)
+from reprocessamento import ReprocessamentoEmAndamento, reprocessar_paradas
+from estado_compartilhado import CacheParadasAbertas, EstadoMaquinas, criar_backend
+from fila_eventos import FilaCheia, FilaEscrita, FilaParticionada, particao_de
+from analise_paradas import GRANULARIDADES, calcular_disponibilidade
+from linha_do_tempo import calcular_linha_do_tempo
+from arquivo_eventos import ArquivoEventos
+from cadastro_maquinas import RegistroMaquinas
+from deduplicacao import SQL_LIMPAR_CHAVES, FiltroDuplicados, registrar_chaves
+from gravacao_paradas import aplicar_gravado, instrucoes_plano, muda_paradas, planejar_pendentes
+from vigia_comunicacao import VigiaComunicacao
+from exportacao import FORMATOS, FormatoIndisponivel, gerar_exportacao, ler_blocos
+from instrumentacao import Metricas, combinar, configurar_log, parar_log, renderizar
+from maquina_estados import (
+    MAQUINA_PADRAO,
+    THRESHOLD_DESCARTE_MIN,
+    aberta_do_cache,
+    agrupar_eventos,
+    evento_sem_comunicacao,
+    eventos_reconexao,
+    planejar_paradas,
+    separar_por_maquina,
+    validar_evento,
+)
+from consultas_paradas import (
+    CHAVE_THRESHOLD,
+    CHAVE_VERSAO_DADOS,
+    SQL_AGREGADOS_JANELA,
+    SQL_ESTADOS_MAQUINAS,
+    SQL_INSERIR_MANUAL,
+    SQL_PARADAS_AUTO_ABERTAS,
+    SQL_SOMAR_AGREGADOS,
+    SQL_ULTIMAS_FECHADAS,
+    CacheDashboard,
+    decodificar_cursor,
+    etag_confere,
+    etag_dashboard as montar_etag_dashboard,
+    evento_estado,
+    eventos_agregados,
+    ler_corpo_lote,
+    ler_filtros_historico,
+    linhas_agregados,
+    montar_consulta_historico,
+    montar_payload_dashboard,
+    pagina_historico,
+)
+from migracoes import garantir_particoes, paradas_particionada
+import eventos_push
+
 # =====================================================================
 # FLASK / CORS / SESSÃO
 # =====================================================================
@@ -14,196 +99,785 @@ app.secret_key = "troque_esta_chave_por_algo_mais_secreto"
 CORS(app, supports_credentials=True)
 
 # =====================================================================
-# CONFIG POSTGRES
+# LOG E MÉTRICAS (ver instrumentacao.py e GET /metrics)
+# =====================================================================
+
+LOG_NIVEL = os.environ.get("LOG_NIVEL", "INFO")  # DEBUG mostra cada log do Arduino
+
+configurar_log(LOG_NIVEL)
+atexit.register(parar_log)  # registrado primeiro = roda por último
+log = logging.getLogger("maroni.app")
+
+metricas = Metricas()
+metricas.contador("maroni_http_requisicoes_total", "Requisições HTTP por endpoint, método e status")
+metricas.histograma("maroni_http_requisicao_segundos", "Tempo de resposta por endpoint")
+metricas.histograma("maroni_db_query_segundos", "Tempo de cada execute() no PostgreSQL, por endpoint")
+metricas.histograma("maroni_funcao_segundos", "Tempo das etapas principais (processar_eventos, dashboard)")
+metricas.contador("maroni_eventos_total", "Eventos do Arduino com estadoLed recebidos, por máquina")
+metricas.contador("maroni_eventos_ignorados_total", "Logs sem estadoLed")
+metricas.contador("maroni_eventos_duplicados_total", "Reenvios do mesmo evento descartados (deduplicacao.py)")
+metricas.contador("maroni_paradas_total", "Paradas abertas/fechadas/descartadas/manuais")
+metricas.contador("maroni_sem_comunicacao_total", "Máquinas marcadas sem comunicação pelo vigia")
+metricas.gauge("maroni_pool_conexoes", "Conexões do pool por situação")
+metricas.gauge("maroni_fila_eventos_pendentes", "Eventos aguardando a fila de escrita")
+metricas.gauge("maroni_fila_idade_mais_antigo_segundos", "Idade do evento mais antigo na fila")
+metricas.gauge("maroni_fila_atraso_ultimo_lote_segundos", "Atraso do último lote aplicado pela fila")
+metricas.contador("maroni_fila_eventos_total", "Eventos da fila de escrita por resultado")
+metricas.contador("maroni_fila_erros_total", "Falhas ao aplicar lotes da fila (repetidas ou descartadas)")
+metricas.gauge("maroni_sse_clientes", "Clientes conectados no /api/stream")
+metricas.gauge("maroni_arquivo_pendentes", "Lotes aguardando gravação no arquivo de eventos")
+metricas.contador("maroni_arquivo_eventos_total", "Eventos do arquivo bruto por resultado")
+
+# =====================================================================
+# CONEXÃO POSTGRES (parâmetros em configuracao.py)
 # =====================================================================
 
-PG_HOST = "localhost"
-PG_PORT = "5432"
-PG_USER = "postgres"
-PG_PASSWORD = "admin"
-PG_DB = "arduino_logs"
+class CursorContado(psycopg2.extensions.cursor):
+    """Cursor que conta (no app context atual) e cronometra as queries."""
+
+    def execute(self, query, vars=None):
+        if has_app_context():
+            g.db_queries = g.get("db_queries", 0) + 1
+        inicio = time.perf_counter()
+        try:
+            return super().execute(query, vars)
+        finally:
+            metricas.observar(
+                "maroni_db_query_segundos",
+                time.perf_counter() - inicio,
+                endpoint=request.endpoint if has_request_context() else "fundo",
+            )
 
 
 def conectar_pg():
-    return psycopg2.connect(
-        host=PG_HOST,
-        port=PG_PORT,
-        user=PG_USER,
-        password=PG_PASSWORD,
-        database=PG_DB,
+    return psycopg2.connect(**PARAMETROS_PG, cursor_factory=CursorContado)
+
+
+# =====================================================================
+# POOL DE CONEXÕES (uma conexão por requisição, devolvida no teardown)
+# =====================================================================
+
+pool_pg = PoolPostgres(
+    conectar_pg,
+    minimo=PG_POOL_MIN,
+    maximo=PG_POOL_MAX,
+    tempo_max_vida=PG_POOL_MAX_VIDA_S,
+    tempo_ocioso_check=PG_POOL_OCIOSO_CHECK_S,
+    timeout_checkout=PG_POOL_TIMEOUT_S,
+)
+atexit.register(pool_pg.fechar_todas)  # depois de drenar a fila (atexit roda ao contrário)
+
+
+def obter_conexao():
+    """
+    Retorna a conexão do pool associada ao app context atual.
+    A mesma conexão é reaproveitada por todas as funções chamadas durante
+    a requisição e volta para o pool em devolver_conexao().
+    """
+    if "pg_conn" not in g:
+        g.pg_conn = pool_pg.obter()
+    return g.pg_conn
+
+
+# Com CONTAR_QUERIES=1 cada resposta leva X-DB-Queries (usado pelo
+# benchmark_carga.py para medir queries por endpoint)
+CONTAR_QUERIES = os.environ.get("CONTAR_QUERIES", "0") == "1"
+
+
+@app.after_request
+def anotar_queries(resposta):
+    if CONTAR_QUERIES:
+        resposta.headers["X-DB-Queries"] = str(g.get("db_queries", 0))
+    return resposta
+
+
+@app.before_request
+def marcar_inicio_requisicao():
+    g.inicio_requisicao = time.perf_counter()
+
+
+@app.after_request
+def medir_requisicao(resposta):
+    endpoint = request.endpoint or "desconhecido"
+    inicio = g.get("inicio_requisicao")
+    if inicio is not None:
+        metricas.observar(
+            "maroni_http_requisicao_segundos", time.perf_counter() - inicio, endpoint=endpoint
+        )
+    metricas.incrementar(
+        "maroni_http_requisicoes_total",
+        endpoint=endpoint,
+        metodo=request.method,
+        status=resposta.status_code,
     )
+    return resposta
+
+
+@app.teardown_appcontext
+def devolver_conexao(exc):
+    conn = g.pop("pg_conn", None)
+    if conn is not None:
+        pool_pg.devolver(conn)
 
 
 # =====================================================================
-# LOG EM ARQUIVO (JSONL) - OPCIONAL, APENAS DEBUG
+# ARQUIVO DE EVENTOS BRUTOS (JSONL rotacionado, ver arquivo_eventos.py)
 # =====================================================================
+#
+# Todo log recebido em /log e /log/batch vai, como veio, para segmentos
+# JSONL em ARQUIVO_EVENTOS_DIR (comprimidos ao rotacionar). A gravação é
+# feita por uma thread de fundo; reprocessar_arquivo.py refaz a tabela
+# paradas a partir dele.
 
-LOG_FILE = "logs.jsonl"
+arquivo_eventos = ArquivoEventos(
+    ARQUIVO_EVENTOS_DIR,
+    max_bytes=int(ARQUIVO_MAX_MB * 1024 * 1024),
+    max_idade_s=ARQUIVO_MAX_IDADE_S,
+    fsync_s=ARQUIVO_FSYNC_S,
+)
+atexit.register(arquivo_eventos.fechar)
 
 
-def salvar_log_arquivo(dado: dict):
-    dado_enriquecido = {
-        "recebido_em": datetime.utcnow().isoformat() + "Z",
-        **dado,
-    }
-    with open(LOG_FILE, "a", encoding="utf-8") as f:
-        f.write(json.dumps(dado_enriquecido, ensure_ascii=False) + "\n")
-    print("[INFO] Log salvo em arquivo:", dado_enriquecido)
+def arquivar_eventos(dados: list):
+    if ARQUIVO_EVENTOS and not arquivo_eventos.registrar(dados):
+        log.warning("Arquivo de eventos: buffer cheio, %d evento(s) não arquivado(s)", len(dados))
 
 
 # =====================================================================
-# MAPA DE MOTIVOS (do Arduino → texto humano)
+# CACHE DE PARADAS AUTO ABERTAS (compartilhado entre workers)
 # =====================================================================
 
-MOTIVO_MAP = {
-    "SETUP": "Setup",
-    "MATERIAL": "Falta de Material",
-    "MANUTENCAO": "Manutenção",
-    "ALMOCO": "Almoço/Intervalo",
-    "ALMOÇO": "Almoço/Intervalo",
-    "SEM_MOTIVO": "Sem motivo",
-    "NONE": "Sem motivo",
-}
+cache_paradas = CacheParadasAbertas(
+    criar_backend(
+        ESTADO_BACKEND,
+        **({"parametros_conexao": PARAMETROS_PG} if ESTADO_BACKEND == "postgres" else {}),
+    ),
+    reaquecer_apos_s=CACHE_REAQUECER_S,
+)
 
 
-def traduz_motivo_bruto(motivo_bruto: str) -> str:
-    if not motivo_bruto:
-        return "Sem motivo"
-    motivo_bruto = motivo_bruto.upper()
-    return MOTIVO_MAP.get(motivo_bruto, motivo_bruto)
+def aquecer_cache_paradas():
+    """Recarrega do banco todas as paradas AUTO abertas para o cache."""
+    conn = obter_conexao()
+    cur = conn.cursor()
+    cur.execute(SQL_PARADAS_AUTO_ABERTAS)
+    total = cache_paradas.aquecer(cur.fetchall())
+    cur.close()
+    log.info("Cache de paradas abertas aquecido (%d abertas).", total)
+
+
+def parada_aberta_em_cache(machine: str):
+    """dict {id, reason, start_time} da parada AUTO aberta, ou None."""
+    if cache_paradas.precisa_aquecer():
+        aquecer_cache_paradas()
+    aberta = cache_paradas.obter(machine)
+    if aberta is CacheParadasAbertas.DESCONHECIDO:
+        aquecer_cache_paradas()
+        aberta = cache_paradas.obter(machine)
+    return aberta
 
 
 # =====================================================================
-# ESTADO ATUAL DAS MÁQUINAS (LED)
+# ESTADO ATUAL DAS MÁQUINAS (LED, compartilhado entre workers)
 # =====================================================================
 
-# Guarda o último estadoLed recebido por máquina
+# Último estadoLed recebido por máquina, igual para todos os workers:
 # 0 = verde (rodando), 1 = vermelho (parada), 2 = off (desligada)
-machine_states = {}  # ex: {"Máquina 01": 0}
+# Cada mudança também é gravada em machine_states (na transação do /log),
+# de onde o estado é restaurado quando o estado compartilhado está vazio.
+estado_maquinas = EstadoMaquinas(cache_paradas.backend)
+
+
+def aquecer_estado_maquinas():
+    cur = obter_conexao().cursor()
+    cur.execute(SQL_ESTADOS_MAQUINAS)
+    total = estado_maquinas.aquecer(cur.fetchall())
+    cur.close()
+    log.info("Estado das máquinas restaurado do banco (%d máquinas).", total)
 
 
 # =====================================================================
-# FUNÇÕES PARA MANIPULAR A TABELA paradas (AUTO)
+# VERSÃO DOS DADOS DO DASHBOARD (compartilhada entre workers)
 # =====================================================================
+#
+# Número que só cresce: é incrementado sempre que algo que aparece no
+# /api/data muda (parada aberta/fechada/motivo, parada manual, estado de
+# LED de alguma máquina). O cache do payload e o ETag dependem só dele.
 
-def obter_parada_aberta(machine: str):
-    """
-    Retorna (id, reason, start_time) da parada AUTO aberta para a máquina,
-    ou None se não houver.
-    """
-    conn = conectar_pg()
+def versao_dados() -> int:
+    return cache_paradas.backend.obter(CHAVE_VERSAO_DADOS) or 0
+
+
+def incrementar_versao_dados() -> int:
+    return cache_paradas.backend.incrementar(CHAVE_VERSAO_DADOS)
+
+
+# =====================================================================
+# CADASTRO DE MÁQUINAS (tabela machines, ver cadastro_maquinas.py)
+# =====================================================================
+#
+# Substitui a antiga lista fixa: máquina nova que aparece no /log é
+# cadastrada sozinha (sem linha/setor); linha, setor e turnos esperados
+# são editados pelo POST /api/machines.
+
+registro_maquinas = RegistroMaquinas(
+    cache_paradas.backend, TURNOS, recarregar_apos_s=CACHE_REAQUECER_S
+)
+
+
+def sincronizar_maquinas():
+    """Cadastro (se mudou) + estados de LED mudados por qualquer worker."""
+    cur = obter_conexao().cursor()
+    registro_maquinas.sincronizar(cur)
+    cur.close()
+    registro_maquinas.sincronizar_estados(estado_maquinas)
+
+
+def cadastrar_maquinas_novas(nomes):
+    """Cadastra (numa transação curta) máquinas que ainda não existem."""
+    sincronizar_maquinas()
+    if all(m in registro_maquinas for m in nomes):
+        return
+    conn = obter_conexao()
     cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, reason, start_time
-        FROM paradas
-        WHERE machine = %s
-          AND origem = 'AUTO'
-          AND end_time IS NULL
-        ORDER BY start_time DESC
-        LIMIT 1
-        """,
-        (machine,),
-    )
-    row = cur.fetchone()
+    novas = registro_maquinas.cadastrar_novas(cur, nomes)
+    conn.commit()
     cur.close()
-    conn.close()
-    return row  # (id, reason, start_time) ou None
+    if novas:
+        registro_maquinas.publicar_mudanca()
+        incrementar_versao_dados()
+        log.info("Máquina(s) nova(s) cadastrada(s): %s", ", ".join(novas))
 
 
-def abrir_parada_auto(machine: str, motivo_bruto: str, inicio: datetime):
-    """
-    Abre uma parada AUTO nova para a máquina com o motivo informado.
-    """
-    reason = traduz_motivo_bruto(motivo_bruto)
+def loop_gravar_vistos():
+    """Grava o last_seen das máquinas a cada MAQUINAS_VISTO_S."""
+    while True:
+        time.sleep(MAQUINAS_VISTO_S)
+        try:
+            with app.app_context():
+                conn = obter_conexao()
+                cur = conn.cursor()
+                registro_maquinas.gravar_vistos(cur)
+                conn.commit()
+                cur.close()
+        except psycopg2.Error as e:
+            log.warning("Não foi possível gravar o last_seen das máquinas: %s", e)
+
+
+# =====================================================================
+# STREAM AO VIVO (SSE) → /api/stream
+# =====================================================================
+#
+# Os eventos saem de processar_eventos() e register_stop() via NOTIFY do
+# Postgres (entregue no commit, para todos os workers); em cada processo
+# uma única thread faz LISTEN e repassa para os clientes conectados.
+
+SSE_KEEPALIVE_S = 15
 
-    conn = conectar_pg()
+difusor_eventos = eventos_push.Difusor(conectar_pg)
+
+
+def publicar_push(eventos: list):
+    """Publica eventos que não vieram junto com nenhuma escrita de paradas."""
+    if not (EVENTOS_PUSH and eventos):
+        return
+    conn = obter_conexao()
     cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO paradas (machine, reason, origem, start_time, end_time, duration_minutes)
-        VALUES (%s, %s, %s, %s, NULL, NULL)
-        """,
-        (machine, reason, "AUTO", inicio),
-    )
+    eventos_push.publicar(cur, eventos)
     conn.commit()
     cur.close()
-    conn.close()
 
-    print(f"[INFO] Parada AUTO ABERTA para {machine} em {inicio}, motivo={reason}")
 
+@app.route("/api/stream", methods=["GET"])
+def api_stream():
+    if not EVENTOS_PUSH:
+        return jsonify({"ok": False, "error": "push_desativado"}), 404
 
-def fechar_parada_auto(machine: str, fim: datetime, threshold_minutos: float = 0.1):
-    """
-    Fecha a parada AUTO aberta da máquina, se existir.
-    Se a duração for menor que threshold_minutos, descarta (deleta).
-    """
-    conn = conectar_pg()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, reason, start_time
-        FROM paradas
-        WHERE machine = %s
-          AND origem = 'AUTO'
-          AND end_time IS NULL
-        ORDER BY start_time DESC
-        LIMIT 1
-        """,
-        (machine,),
+    fila = difusor_eventos.assinar()
+
+    def gerar():
+        try:
+            yield f"retry: 3000\nevent: versao\ndata: {json.dumps({'versao': versao_dados()})}\n\n"
+            while True:
+                try:
+                    ev = fila.get(timeout=SSE_KEEPALIVE_S)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                if ev is None:
+                    break
+                yield f"event: {ev.get('tipo', 'mensagem')}\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n"
+        finally:
+            difusor_eventos.cancelar(fila)
+
+    return Response(
+        gerar(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
-    row = cur.fetchone()
 
-    if not row:
+
+# =====================================================================
+# TABELA paradas PARTICIONADA (opcional, ver migracoes.py)
+# =====================================================================
+
+PARTICOES_MESES_A_FRENTE = int(os.environ.get("PARTICOES_MESES_A_FRENTE", 3))
+_particionada = {"valor": None}
+
+
+def tabela_paradas_particionada() -> bool:
+    """Detectado uma vez por processo (não muda com o app no ar)."""
+    if _particionada["valor"] is None:
+        cur = obter_conexao().cursor()
+        _particionada["valor"] = paradas_particionada(cur)
         cur.close()
-        conn.close()
-        print(f"[INFO] Nenhuma parada AUTO aberta para {machine} ao fechar.")
+    return _particionada["valor"]
+
+
+def manter_particoes():
+    """Cria as partições dos próximos meses; reagenda para daqui a 1 dia."""
+    try:
+        with app.app_context():
+            if tabela_paradas_particionada():
+                conn = obter_conexao()
+                cur = conn.cursor()
+                garantir_particoes(cur, PARTICOES_MESES_A_FRENTE)
+                conn.commit()
+                cur.close()
+    except psycopg2.Error as e:
+        log.warning("Não foi possível garantir as partições de paradas: %s", e)
+
+    timer = threading.Timer(24 * 3600, manter_particoes)
+    timer.daemon = True
+    timer.start()
+
+
+def limpar_chaves_eventos():
+    """Apaga de eventos_chaves o que passou de DEDUP_RETER_DIAS; reagenda para daqui a 1 dia."""
+    try:
+        with app.app_context():
+            conn = obter_conexao()
+            cur = conn.cursor()
+            cur.execute(SQL_LIMPAR_CHAVES, (DEDUP_RETER_DIAS,))
+            if cur.rowcount:
+                log.info("%d chave(s) de eventos antigas apagadas.", cur.rowcount)
+            conn.commit()
+            cur.close()
+    except psycopg2.Error as e:
+        log.warning("Não foi possível limpar eventos_chaves: %s", e)
+
+    timer = threading.Timer(24 * 3600, limpar_chaves_eventos)
+    timer.daemon = True
+    timer.start()
+
+
+# =====================================================================
+# TAREFAS DE FUNDO POR PROCESSO (iniciadas na 1ª requisição de cada worker)
+# =====================================================================
+
+_processo_iniciado = {"pid": None}
+_lock_inicio_processo = threading.Lock()
+
+
+@app.before_request
+def iniciar_processo():
+    if _processo_iniciado["pid"] == os.getpid():
         return
+    with _lock_inicio_processo:
+        if _processo_iniciado["pid"] == os.getpid():
+            return
+        _processo_iniciado["pid"] = os.getpid()
+    pool_pg.aquecer()  # PG_POOL_MIN conexões já abertas neste worker
+    if estado_maquinas.precisa_aquecer():
+        aquecer_estado_maquinas()
+    manter_particoes()
+    if DEDUP_EVENTOS:
+        limpar_chaves_eventos()
+    threading.Thread(target=loop_publicar_metricas, name="publicar-metricas", daemon=True).start()
+    threading.Thread(target=loop_gravar_vistos, name="gravar-vistos", daemon=True).start()
+    if not (FILA_ESCRITA and FILA_PARTICOES):
+        # Com a fila particionada, cada processo dela cuida das suas máquinas
+        threading.Thread(target=loop_paradas_pendentes, name="paradas-pendentes", daemon=True).start()
+    if VIGIA_COMUNICACAO:
+        sincronizar_maquinas()
+        vigia_comunicacao.acompanhar(registro_maquinas.nomes())
 
-    parada_id, reason_open, start_time = row
-    duracao_min = (fim - start_time).total_seconds() / 60.0
 
-    if duracao_min < threshold_minutos:
-        # descarta parada muito curta
-        cur.execute("DELETE FROM paradas WHERE id = %s", (parada_id,))
-        print(
-            f"[INFO] Parada AUTO id={parada_id} DESCARTADA ({duracao_min:.2f} min) para {machine}"
-        )
-    else:
-        cur.execute(
-            """
-            UPDATE paradas
-            SET end_time = %s,
-                duration_minutes = %s
-            WHERE id = %s
-            """,
-            (fim, duracao_min, parada_id),
-        )
-        print(
-            f"[INFO] Parada AUTO id={parada_id} FECHADA para {machine}: {duracao_min:.2f} min ({reason_open})"
+# =====================================================================
+# AGREGADOS DE PARADAS (mantidos incrementalmente)
+# =====================================================================
+#
+# paradas_agregado guarda, por bucket de hora e de dia (pela hora de
+# início), máquina e motivo: quantidade de paradas e minutos parados.
+# É atualizada na MESMA transação em que uma parada é gravada fechada
+# (AUTO ao fechar, MANUAL ao registrar). Parada descartada pelo threshold
+# nunca chega a ser somada.
+
+def somar_agregados(cur, paradas):
+    """
+    paradas: iterável de (machine, reason, start_time, duration_minutes)
+    já fechadas. Não faz commit.
+    """
+    linhas = linhas_agregados(paradas)
+    if linhas:
+        execute_values(cur, SQL_SOMAR_AGREGADOS, linhas, page_size=len(linhas))
+
+
+# =====================================================================
+# FUNÇÕES PARA MANIPULAR A TABELA paradas (AUTO)
+# =====================================================================
+
+# Eventos como chegaram (já normalizados), fonte do reprocessamento
+# (reprocessamento.py). Gravados na mesma transação que as paradas
+# (EVENTOS_BRUTOS).
+#
+# Reenvio do mesmo evento (retry do Arduino/gateway) é descartado antes de
+# mexer nas paradas (deduplicacao.py). DEDUP_MEMORIA: chaves no LRU de
+# cada processo; DEDUP_RETER_DIAS: quanto tempo eventos_chaves as guarda.
+
+filtro_duplicados = FiltroDuplicados(DEDUP_MEMORIA)
+
+# Parada nova fica pendente (só no cache) até durar o threshold: piscada
+# curta do LED não vira INSERT + DELETE. Com PARADA_OSCILACAO_S > 0, o LED
+# voltando ao vermelho até essa quantidade de segundos depois do verde
+# continua a mesma parada (sensor oscilando = uma parada só). Uma thread
+# por processo grava a cada PARADAS_PENDENTES_S o que venceu sem evento.
+
+
+def threshold_descarte() -> float:
+    """
+    Threshold de descarte em uso: o último /api/reprocess_paradas grava o
+    que usou, para o /log continuar com a mesma regra (todos os workers).
+    """
+    valor = cache_paradas.backend.obter(CHAVE_THRESHOLD)
+    return THRESHOLD_DESCARTE_MIN if valor is None else float(valor)
+
+
+@metricas.medir("maroni_funcao_segundos", funcao="processar_eventos")
+def processar_eventos(dados: list, threshold_minutos: float = None) -> dict:
+    """
+    Aplica um ou mais logs (de uma ou várias máquinas) numa única transação.
+    Os eventos são ordenados por data_hora (ts_ms desempata), reduzidos
+    por máquina e gravados por gravar_plano(). Com EVENTOS_BRUTOS os
+    eventos também vão para eventos_brutos; sem ele, evento que não muda
+    nada (ou só mexe numa parada pendente) não gera nenhuma query.
+    """
+    if threshold_minutos is None:
+        threshold_minutos = threshold_descarte()
+
+    eventos, por_maquina, ignorados = agrupar_eventos(dados)
+
+    if ignorados:
+        metricas.incrementar("maroni_eventos_ignorados_total", ignorados)
+
+    chaves, duplicados = {}, 0
+    if DEDUP_EVENTOS:
+        eventos, chaves, duplicados = filtro_duplicados.filtrar(eventos)
+
+    if por_maquina:
+        cadastrar_maquinas_novas(list(por_maquina))
+        registro_maquinas.marcar_visto(por_maquina, datetime.utcnow() - timedelta(hours=3))
+
+    # Depois do commit do cadastro: a chave entra na transação das paradas
+    gravadas = []
+    if chaves:
+        cur = obter_conexao().cursor()
+        eventos, gravadas, repetidos = registrar_chaves(cur, eventos, chaves)
+        cur.close()
+        duplicados += repetidos
+    if duplicados:
+        por_maquina = separar_por_maquina(eventos)
+        metricas.incrementar("maroni_eventos_duplicados_total", duplicados)
+
+    anteriores = {}  # entradas do cache de paradas abertas, antes do lote
+    abertas = {}
+    push = []  # eventos para o stream ao vivo (/api/stream)
+    estados = []  # estados de LED que mudaram → machine_states e estado_maquinas
+    for machine, evs in por_maquina.items():
+        metricas.incrementar("maroni_eventos_total", len(evs), machine=machine)
+
+        # Último estado conhecido da máquina: só compara aqui; gravar_plano()
+        # grava no estado compartilhado depois do commit
+        if estado_maquinas.mudou(machine, evs[-1]["estado_led"]):
+            estados.append((machine, evs[-1]["estado_led"], evs[-1]["agora"]))
+            push.append(evento_estado(machine, evs[-1]["estado_led"]))
+
+        anteriores[machine] = parada_aberta_em_cache(machine)
+        abertas[machine] = aberta_do_cache(anteriores[machine])
+
+    agora = datetime.utcnow() - timedelta(hours=3)
+    if eventos:
+        agora = max(agora, eventos[-1]["agora"])
+    plano = planejar_paradas(por_maquina, abertas, threshold_minutos, PARADA_OSCILACAO_S, agora)
+
+    brutos = []
+    if EVENTOS_BRUTOS:
+        brutos = [
+            (ev["machine"], ev["agora"], ev["ts_ms"], ev["tipo"], ev["estado_led"], ev["motivo_bruto"])
+            for ev in eventos
+            if isinstance(ev["estado_led"], int)
+        ]
+
+    resumo = {"eventos": len(eventos), "ignorados": ignorados, "duplicados": duplicados}
+    return gravar_plano(plano, anteriores, resumo, brutos, push, estados, gravadas)
+
+
+def gravar_plano(plano: dict, anteriores: dict, resumo: dict, brutos=(), push=None, estados=(),
+                 chaves=()) -> dict:
+    """
+    Grava o resultado de planejar_paradas() numa única transação (as
+    instruções saem de gravacao_paradas.instrucoes_plano). Depois do
+    commit, aplicar_gravado() deixa o cache igual à parada final de cada
+    máquina, grava os `estados` de LED em estado_maquinas e passa as
+    `chaves` (já inseridas em eventos_chaves na mesma transação) para o
+    filtro de duplicados.
+    """
+    push = push if push is not None else []
+    resumo.update(
+        {"fechadas": len(plano["fechadas"]), "descartadas": plano["descartadas"], "abertas": 0}
+    )
+
+    abertas_gravadas = []
+    if muda_paradas(plano) or brutos or chaves or push or estados:
+        conn = obter_conexao()
+        cur = conn.cursor()
+        particionada = muda_paradas(plano) and tabela_paradas_particionada()
+        abertas_gravadas = executar_instrucoes(
+            cur, instrucoes_plano(plano, resumo, brutos, estados, push, particionada, EVENTOS_PUSH)
         )
+        conn.commit()
+        cur.close()
 
-    conn.commit()
-    cur.close()
-    conn.close()
+    # Só depois do commit o cache reflete o banco
+    resumo["abertas"] = aplicar_gravado(
+        cache_paradas, estado_maquinas, filtro_duplicados,
+        plano, anteriores, abertas_gravadas, estados, chaves,
+    )
+
+    for evento in ("aberta", "fechada", "descartada"):
+        if resumo[evento + "s"]:
+            metricas.incrementar("maroni_paradas_total", resumo[evento + "s"], evento=evento)
 
+    if push:
+        incrementar_versao_dados()
+    return resumo
 
-def obter_agora_do_log(dado: dict) -> datetime:
+
+def executar_instrucoes(cur, instrucoes):
+    """Roda um gerador de gravacao_paradas no cursor. Não faz commit; retorna o valor final dele."""
+    retorno = None
+    while True:
+        try:
+            instrucao = instrucoes.send(retorno)
+        except StopIteration as fim:
+            return fim.value
+        if instrucao.lote:
+            retorno = execute_values(
+                cur,
+                instrucao.sql,
+                instrucao.linhas,
+                template=instrucao.template,
+                page_size=len(instrucao.linhas),
+                fetch=instrucao.fetch,
+            )
+        else:
+            cur.execute(instrucao.sql, instrucao.linhas)
+            retorno = None
+
+
+@metricas.medir("maroni_funcao_segundos", funcao="processar_pendentes")
+def processar_pendentes(dono=None) -> dict:
     """
-    Tenta usar data_hora enviada pelo Arduino.
-    Formato esperado: 'YYYY-MM-DD HH:MM:SS' (hora local Brasil).
-    Se não vier ou der erro, cai num fallback.
+    Grava o que venceu sem chegar evento novo: paradas pendentes que já
+    passaram do threshold (abre no banco) e fechamentos provisórios cuja
+    janela de oscilação acabou (fecha ou descarta). dono(machine): só as
+    máquinas deste processo (fila particionada). None se não havia nada.
     """
-    s = dado.get("data_hora")
-    if s:
+    agora = datetime.utcnow() - timedelta(hours=3)
+    pendentes = planejar_pendentes(
+        cache_paradas, agora, threshold_descarte(), PARADA_OSCILACAO_S, dono
+    )
+    if pendentes is None:
+        return None
+    plano, anteriores = pendentes
+    return gravar_plano(plano, anteriores, {"eventos": 0, "ignorados": 0})
+
+
+def loop_paradas_pendentes(dono=None):
+    while True:
+        time.sleep(PARADAS_PENDENTES_S)
         try:
-            # Hora local que o Arduino já calculou via NTP
-            return datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
+            with app.app_context():
+                resumo = processar_pendentes(dono)
+            if resumo:
+                log.debug("Paradas pendentes gravadas: %s", resumo)
         except Exception as e:
-            print("[WARN] data_hora inválido no log, usando fallback:", s, e)
+            log.warning("Falha ao gravar paradas pendentes: %s", e)
+
+
+# =====================================================================
+# FILA DE ESCRITA (write-behind): /log responde sem esperar o banco
+# =====================================================================
+
+FILA_ESCRITA = os.environ.get("FILA_ESCRITA", "1") == "1"
+FILA_CAPACIDADE = int(os.environ.get("FILA_CAPACIDADE", 10000))
+FILA_LOTE_MAX = int(os.environ.get("FILA_LOTE_MAX", 500))
+FILA_SPOOL = os.environ.get("FILA_SPOOL", "")  # ex: /var/lib/maroni/fila.spool
+FILA_FSYNC = os.environ.get("FILA_FSYNC", "0") == "1"
+
+# > 0: a fila aplica os lotes em N processos, cada máquina sempre no mesmo
+# (hash do nome) — ver FilaParticionada. Use com um worker HTTP só (com
+# threads): cada worker teria os seus N processos. Sem spool.
+FILA_PARTICOES = int(os.environ.get("FILA_PARTICOES", 0))
+
+# Só estes erros seguram o lote na fila (banco fora do ar, pool esgotado,
+# deadlock/serialização): qualquer outro é do conteúdo e o item que o
+# causa é descartado (ver aplicar_itens em fila_eventos.py).
+ERROS_TRANSITORIOS = (psycopg2.OperationalError, psycopg2.InterfaceError, PoolEsgotado)
+
+
+def aplicar_lote_fila(dados: list):
+    # Roda na thread da fila: precisa de app context para obter_conexao()
+    with app.app_context():
+        resumo = processar_eventos(dados)
+    log.debug("Lote da fila aplicado: %s", resumo)
+
+
+def iniciar_particao(indice: int, total: int):
+    """Sobe um processo da fila particionada: métricas e as pendentes só das suas máquinas."""
+    _processo_iniciado["pid"] = os.getpid()  # não atende HTTP: sem vigia
+    threading.Thread(target=loop_publicar_metricas, name="publicar-metricas", daemon=True).start()
+    threading.Thread(
+        target=loop_paradas_pendentes,
+        args=(lambda machine: particao_de(machine, total) == indice,),
+        name="paradas-pendentes",
+        daemon=True,
+    ).start()
+    log.info("Partição %d/%d da fila de escrita pronta.", indice + 1, total)
+
+
+if FILA_PARTICOES > 0:
+    fila_escrita = FilaParticionada(
+        "app:aplicar_lote_fila",
+        FILA_PARTICOES,
+        iniciar="app:iniciar_particao",
+        capacidade=FILA_CAPACIDADE,
+        lote_max=FILA_LOTE_MAX,
+        transitorios=ERROS_TRANSITORIOS,
+        maquina_de=lambda dado: dado.get("machine") or MAQUINA_PADRAO,
+    )
+else:
+    fila_escrita = FilaEscrita(
+        aplicar_lote_fila,
+        capacidade=FILA_CAPACIDADE,
+        lote_max=FILA_LOTE_MAX,
+        arquivo_spool=FILA_SPOOL or None,
+        fsync_spool=FILA_FSYNC,
+        transitorios=ERROS_TRANSITORIOS,
+    )
+
+
+@atexit.register
+def drenar_fila_escrita():
+    if FILA_ESCRITA and not fila_escrita.drenar(timeout=10.0):
+        log.warning("Fila de escrita não esvaziou antes de encerrar.")
+
+
+def despachar_eventos(dados: list):
+    """
+    Com a fila ligada: enfileira e responde 202 na hora (503 se cheia).
+    Sem a fila: aplica na própria requisição e devolve o resumo.
+    """
+    if not FILA_ESCRITA:
+        resumo = processar_eventos(dados)
+        return jsonify({"status": "ok", **resumo}), 200
+
+    try:
+        fila_escrita.enfileirar(dados)
+    except FilaCheia as e:
+        log.warning("%s", e)
+        resposta = jsonify({"status": "erro", "msg": "Servidor ocupado, tente novamente"})
+        resposta.headers["Retry-After"] = "1"
+        return resposta, 503
+
+    return jsonify({"status": "ok", "enfileirados": len(dados)}), 202
+
+
+@app.route("/api/fila", methods=["GET"])
+def api_fila():
+    return jsonify({"ativa": FILA_ESCRITA, **fila_escrita.metricas()})
+
+
+# =====================================================================
+# MÉTRICAS PROMETHEUS → /metrics
+# =====================================================================
+#
+# Cada worker publica o seu snapshot no estado compartilhado a cada
+# METRICAS_PUBLICAR_S; o /metrics soma os snapshots recentes de todos
+# (o do próprio worker vai atualizado na hora). Worker que morreu para de
+# publicar e sai da soma depois de METRICAS_EXPIRA_S — os contadores dele
+# somem e o Prometheus trata como reset.
+
+METRICAS_PUBLICAR_S = float(os.environ.get("METRICAS_PUBLICAR_S", 5))
+METRICAS_EXPIRA_S = float(os.environ.get("METRICAS_EXPIRA_S", 60))
+PREFIXO_METRICAS = "metricas:"
+
+
+def atualizar_gauges():
+    """Lê pool, fila, SSE e arquivo deste processo para os gauges."""
+    for situacao, valor in pool_pg.estatisticas().items():
+        metricas.definir("maroni_pool_conexoes", valor, situacao=situacao)
+
+    fila = fila_escrita.metricas()
+    metricas.definir("maroni_fila_eventos_pendentes", fila["profundidade"])
+    metricas.definir("maroni_fila_idade_mais_antigo_segundos", fila["idade_mais_antigo_s"])
+    metricas.definir("maroni_fila_atraso_ultimo_lote_segundos", fila["atraso_ultimo_lote_s"])
+    metricas.definir("maroni_fila_eventos_total", fila["processados_total"], resultado="processado")
+    metricas.definir("maroni_fila_eventos_total", fila["rejeitados_total"], resultado="rejeitado")
+    metricas.definir("maroni_fila_eventos_total", fila["descartados_total"], resultado="descartado")
+    metricas.definir("maroni_fila_erros_total", fila["erros_total"])
+    metricas.definir("maroni_sse_clientes", difusor_eventos.total_assinantes())
+
+    arquivo = arquivo_eventos.metricas()
+    metricas.definir("maroni_arquivo_pendentes", arquivo["pendentes"])
+    metricas.definir("maroni_arquivo_eventos_total", arquivo["gravados_total"], resultado="gravado")
+    metricas.definir("maroni_arquivo_eventos_total", arquivo["descartados_total"], resultado="descartado")
+
+
+def publicar_metricas() -> dict:
+    atualizar_gauges()
+    snapshot = metricas.snapshot()
+    cache_paradas.backend.gravar(
+        PREFIXO_METRICAS + str(os.getpid()), {"em": time.time(), "metricas": snapshot}
+    )
+    return snapshot
+
 
-    # Fallback: UTC-3 (aprox. Belém), coerente com ajuste do Arduino
-    return datetime.utcnow() - timedelta(hours=3)
+def loop_publicar_metricas():
+    while True:
+        time.sleep(METRICAS_PUBLICAR_S)
+        try:
+            publicar_metricas()
+        except Exception as e:
+            log.warning("Falha ao publicar métricas: %s", e)
+
+
+@app.route("/metrics", methods=["GET"])
+def api_metrics():
+    proprio = publicar_metricas()
+    snapshots = [proprio]
+    limite = time.time() - METRICAS_EXPIRA_S
+    for chave, valor in cache_paradas.backend.itens(PREFIXO_METRICAS).items():
+        if chave == PREFIXO_METRICAS + str(os.getpid()):
+            continue
+        if valor["em"] < limite:
+            cache_paradas.backend.apagar(chave)
+            continue
+        snapshots.append(valor["metricas"])
+
+    return Response(
+        renderizar(combinar(snapshots)), mimetype="text/plain; version=0.0.4; charset=utf-8"
+    )
 
 
 # =====================================================================
@@ -216,142 +890,433 @@ def receber_log():
     try:
         dado = request.get_json(force=True)
     except Exception as e:
-        print("[ERRO] JSON inválido:", e)
+        log.error("JSON inválido: %s", e)
         return jsonify({"status": "erro", "msg": "JSON inválido"}), 400
 
-    print("\n=== LOG DO ARDUINO ===")
-    print(json.dumps(dado, indent=2, ensure_ascii=False))
-    print("=======================\n")
+    # Com a fila o lote só é aplicado depois do 202: o que o banco recusaria
+    # (tipo/tamanho) tem que voltar 400 aqui
+    erro = validar_evento(dado)
+    if erro:
+        log.warning("Log inválido: %s", erro)
+        return jsonify({"status": "erro", "msg": erro}), 400
+
+    arquivar_eventos([dado])
+    sinalizar_comunicacao([dado])
 
-    machine = dado.get("machine") or "Máquina 01"
-    tipo = (dado.get("tipo") or "").upper()
-    motivo_bruto = (dado.get("motivo") or "NONE").upper()
-    estado_led = dado.get("estadoLed")
-    agora = obter_agora_do_log(dado)
+    # Só serializa o log inteiro se alguém for ler (LOG_NIVEL=DEBUG)
+    if log.isEnabledFor(logging.DEBUG):
+        log.debug("Log do Arduino: %s", json.dumps(dado, ensure_ascii=False))
 
     # Se vier sem estadoLed, não quebremos a API
-    if estado_led is None:
-        print("[WARN] Log sem estadoLed, ignorando para contagem.")
+    if dado.get("estadoLed") is None:
+        log.warning("Log sem estadoLed, ignorando para contagem.")
+        metricas.incrementar("maroni_eventos_ignorados_total")
         return jsonify({"status": "ok"}), 200
 
-    # Atualiza o último estado conhecido da máquina
-    machine_states[machine] = estado_led
+    # LED 0 (verde) / 2 (off) → fecha parada; LED 1 (vermelho) → abre/atualiza.
+    # Evento que não muda a parada aberta (cache) nem vai ao banco.
+    return despachar_eventos([dado])
 
-    # =====================================================================
-    # 1) LED VERDE → máquina EM FUNCIONAMENTO → fechar qualquer parada
-    # =====================================================================
-    if estado_led == 0:
-        print("[LED VERDE] Máquina em funcionamento → fechar parada automática, se existir.")
-        fechar_parada_auto(machine, agora)
-        return jsonify({"status": "ok"}), 200
 
-    # =====================================================================
-    # 2) LED DESLIGADO → máquina DESLIGADA → fechar parada e não contar
-    # =====================================================================
-    if estado_led == 2:
-        print("[LED OFF] Sistema desligado → fechar parada automática, se existir.")
-        fechar_parada_auto(machine, agora)
-        return jsonify({"status": "ok"}), 200
+# =====================================================================
+# ENDPOINT EM LOTE → /log/batch (gateways / firmware com buffer)
+# =====================================================================
 
-    # =====================================================================
-    # 3) LED VERMELHO (1) → máquina PARADA
-    #    - se não tiver parada aberta, abre uma "sem motivo"
-    #    - se for log de MOTIVO, atualiza reason da parada aberta
-    # =====================================================================
-    if estado_led == 1:
-        # Garante que existe uma parada aberta
-        parada = obter_parada_aberta(machine)
-        if not parada:
-            print("[LED VERMELHO] Nenhuma parada aberta. Abrindo parada sem motivo (NONE).")
-            abrir_parada_auto(machine, "NONE", agora)
-
-        # Se o tipo do log é MOTIVO, atualiza o motivo da parada
-        if tipo == "MOTIVO":
-            motivo_humano = traduz_motivo_bruto(motivo_bruto)
-            print(f"[MOTIVO] Atualizando motivo da parada para {motivo_humano}.")
-
-            conn = conectar_pg()
-            cur = conn.cursor()
-            cur.execute(
-                """
-                UPDATE paradas
-                SET reason = %s
-                WHERE machine = %s
-                  AND origem = 'AUTO'
-                  AND end_time IS NULL
-                """,
-                (motivo_humano, machine),
-            )
-            conn.commit()
-            cur.close()
-            conn.close()
+def ler_eventos_lote():
+    """Lista de dicts do corpo (array JSON ou NDJSON) ou ValueError."""
+    return ler_corpo_lote(request.get_data(as_text=True), request.mimetype)
 
-        return jsonify({"status": "ok"}), 200
 
-    # Se vier algum valor de estado_led que não conhecemos
-    print(f"[WARN] estadoLed inesperado: {estado_led}. Ignorando para contagem.")
-    return jsonify({"status": "ok"}), 200
+@app.route("/log/batch", methods=["POST"])
+def receber_log_lote():
+    try:
+        dados = ler_eventos_lote()
+    except ValueError as e:
+        log.error("Lote inválido: %s", e)
+        return jsonify({"status": "erro", "msg": "JSON/NDJSON inválido"}), 400
+
+    if not all(isinstance(d, dict) for d in dados):
+        return jsonify({"status": "erro", "msg": "Cada evento deve ser um objeto JSON"}), 400
+
+    if len(dados) > LOTE_MAX_EVENTOS:
+        return (
+            jsonify(
+                {
+                    "status": "erro",
+                    "msg": f"Lote muito grande (máximo {LOTE_MAX_EVENTOS} eventos)",
+                }
+            ),
+            413,
+        )
+
+    for i, dado in enumerate(dados):
+        erro = validar_evento(dado)
+        if erro:
+            log.warning("Lote inválido: evento %d: %s", i, erro)
+            return jsonify({"status": "erro", "msg": f"Evento {i}: {erro}"}), 400
+
+    arquivar_eventos(dados)
+    sinalizar_comunicacao(dados)
+    return despachar_eventos(dados)
+
+
+# =====================================================================
+# HEARTBEAT E MÁQUINAS SEM COMUNICAÇÃO → /heartbeat (ver vigia_comunicacao.py)
+# =====================================================================
+#
+# Todo /log, /log/batch e /heartbeat conta como sinal de vida. Máquina
+# ligada (último LED 0/1), ativa e em turno que fica SEM_COMUNICACAO_S
+# sem sinal ganha uma parada AUTO "Sem comunicação" a partir do último
+# log; o próximo sinal fecha a parada. Os dois eventos são gerados aqui
+# e seguem o caminho normal (arquivo, eventos_brutos, fila), então o
+# reprocessamento chega no mesmo resultado. SEM_COMUNICACAO_S=0 desliga.
+
+VIGIA_COMUNICACAO = SEM_COMUNICACAO_S > 0
+
+
+def aplicar_eventos_servidor(dados: list):
+    """Eventos gerados pelo servidor: mesmo caminho dos logs, sem resposta HTTP."""
+    arquivar_eventos(dados)
+    if FILA_ESCRITA:
+        try:
+            fila_escrita.enfileirar(dados)
+        except FilaCheia as e:
+            log.warning("Evento do vigia perdido: %s", e)
+    elif has_app_context():
+        processar_eventos(dados)
+    else:
+        with app.app_context():
+            processar_eventos(dados)
+
+
+def ao_silenciar(machine: str, registro: dict):
+    # Roda na thread do vigia
+    metricas.incrementar("maroni_sem_comunicacao_total", machine=machine)
+    aplicar_eventos_servidor([evento_sem_comunicacao(machine, registro)])
+
+
+def deve_vigiar(machine: str) -> bool:
+    dados = registro_maquinas.obter(machine)
+    if dados is None:
+        return True
+    agora = datetime.utcnow() - timedelta(hours=3)
+    return dados["ativa"] and registro_maquinas.em_turno(machine, agora)
+
+
+vigia_comunicacao = VigiaComunicacao(
+    cache_paradas.backend, SEM_COMUNICACAO_S, ao_silenciar, deve_vigiar=deve_vigiar
+)
+
+
+def sinalizar_comunicacao(dados: list):
+    """
+    Passa ao vigia o último log de cada máquina. Máquina que estava sem
+    comunicação e voltou só com log sem estadoLed / heartbeat ganha um
+    evento RECONEXAO (com o LED de antes) para fechar a parada.
+    """
+    if not VIGIA_COMUNICACAO:
+        return
+    agora_texto = (datetime.utcnow() - timedelta(hours=3)).strftime("%Y-%m-%d %H:%M:%S")
+    reconexoes = eventos_reconexao(vigia_comunicacao.sinalizar(dados, MAQUINA_PADRAO, agora_texto))
+    if reconexoes:
+        aplicar_eventos_servidor(reconexoes)
+
+
+@app.route("/heartbeat", methods=["POST"])
+def heartbeat():
+    """
+    {"machine": "Máquina 03"} (ou uma lista deles). Opcionais: data_hora,
+    ts_ms. Não vai ao banco, exceto quando fecha uma "Sem comunicação".
+    """
+    dados = request.get_json(silent=True)
+    if isinstance(dados, dict):
+        dados = [dados]
+    if not isinstance(dados, list) or not all(isinstance(d, dict) for d in dados):
+        return jsonify({"status": "erro", "msg": "JSON inválido"}), 400
+    sinalizar_comunicacao([{k: v for k, v in d.items() if k != "estadoLed"} for d in dados])
+    return Response(status=204)
 
 
 # =====================================================================
 # CONSULTAR ÚLTIMAS PARADAS (/ultimos) - agora em cima de paradas
 # =====================================================================
 
-@app.route("/ultimos", methods=["GET"])
-def ultimos_logs():
-    limit = int(request.args.get("limit", 20))
+def consultar_historico(filtros: dict, limit: int, cursor=None):
+    """
+    Página de paradas em ordem (start_time, id) decrescente.
+    Keyset: a próxima página começa logo depois do (start_time, id) do
+    último item, então o custo não cresce com a profundidade da página.
+    Retorna (itens, proximo_cursor ou None).
+    """
+    limit = max(1, min(limit, HISTORICO_LIMITE_MAX))
+    sql, params = montar_consulta_historico(filtros, limit, cursor)
 
-    conn = conectar_pg()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT id, machine, reason, origem, start_time, end_time, duration_minutes
-        FROM paradas
-        ORDER BY start_time DESC
-        LIMIT %s
-        """,
-        (limit,),
-    )
+    cur = obter_conexao().cursor()
+    cur.execute(sql, params)
     linhas = cur.fetchall()
     cur.close()
-    conn.close()
+    return pagina_historico(linhas, limit)
 
-    resultado = []
-    for pid, machine, reason, origem, start_time, end_time, duration in linhas:
-        status = "Aberta" if end_time is None else "Fechada"
 
-        resultado.append(
-            {
-                "id": pid,
-                "machine": machine,
-                "reason": reason,
-                "origem": origem,  # AUTO / MANUAL
-                "start_time": start_time.isoformat(),
-                "end_time": end_time.isoformat() if end_time else None,
-                "duration_minutes": float(duration) if duration is not None else None,
-                "status": status,
-            }
-        )
+@app.route("/ultimos", methods=["GET"])
+def ultimos_logs():
+    try:
+        limit = int(request.args.get("limit", 20))
+        filtros = ler_filtros_historico(request.args)
+    except ValueError as e:
+        return jsonify({"ok": False, "error": "parametro_invalido", "message": str(e)}), 400
 
+    resultado, _ = consultar_historico(filtros, limit)
     return jsonify(resultado)
 
 
+@app.route("/api/historico", methods=["GET"])
+def api_historico():
+    """
+    Histórico paginado: ?machine=&reason=&origem=&desde=&ate=&limit=&cursor=
+    Para a próxima página, repita a consulta com cursor=next_cursor.
+    """
+    try:
+        limit = int(request.args.get("limit", HISTORICO_LIMITE_PADRAO))
+        filtros = ler_filtros_historico(request.args)
+        cursor = request.args.get("cursor")
+        cursor = decodificar_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return jsonify({"ok": False, "error": "parametro_invalido", "message": str(e)}), 400
+
+    itens, proximo = consultar_historico(filtros, limit, cursor)
+    return jsonify({"items": itens, "next_cursor": proximo})
+
+
+# =====================================================================
+# ANÁLISE: DISPONIBILIDADE E TEMPO PARADO → /api/analytics
+# =====================================================================
+
+ANALYTICS_MAX_PERIODOS = int(os.environ.get("ANALYTICS_MAX_PERIODOS", 5000))
+
+
+@app.route("/api/analytics", methods=["GET"])
+def api_analytics():
+    """
+    ?desde=&ate= (ISO, hora local; padrão: últimos 7 dias)
+    &granularidade=hora|turno|dia|semana (padrão dia)
+    &machine=...&machine=... (opcional; padrão: as ativas + as que pararam)
+    """
+    agora = datetime.utcnow() - timedelta(hours=3)
+    granularidade = request.args.get("granularidade", "dia")
+    try:
+        if granularidade not in GRANULARIDADES:
+            raise ValueError(f"granularidade deve ser uma de: {', '.join(GRANULARIDADES)}")
+        ate = request.args.get("ate")
+        ate = datetime.fromisoformat(ate) if ate else agora
+        desde = request.args.get("desde")
+        desde = datetime.fromisoformat(desde) if desde else ate - timedelta(days=7)
+        if desde >= ate:
+            raise ValueError("desde deve ser anterior a ate")
+
+        maquinas = request.args.getlist("machine") or None
+        if not maquinas:
+            sincronizar_maquinas()
+        cur = obter_conexao().cursor()
+        resultado = calcular_disponibilidade(
+            cur,
+            desde,
+            ate,
+            granularidade,
+            agora,
+            TURNOS,
+            maquinas=maquinas,
+            max_periodos=ANALYTICS_MAX_PERIODOS,
+            cadastradas=registro_maquinas.nomes(),
+        )
+        cur.close()
+    except ValueError as e:
+        return jsonify({"ok": False, "error": "parametro_invalido", "message": str(e)}), 400
+
+    return jsonify(
+        {
+            "desde": desde.isoformat(),
+            "ate": ate.isoformat(),
+            "granularidade": granularidade,
+            "gerado_em": agora.isoformat(),
+            **resultado,
+        }
+    )
+
+
+# =====================================================================
+# LINHA DO TEMPO RUN/STOP/OFF → /api/timeline (ver linha_do_tempo.py)
+# =====================================================================
+
+TIMELINE_MAX_LARGURA = int(os.environ.get("TIMELINE_MAX_LARGURA", 4000))
+
+
+@app.route("/api/timeline", methods=["GET"])
+def api_timeline():
+    """
+    ?desde=&ate= (ISO, hora local; padrão: últimas 24 h)
+    &largura=800 (baldes = pixels da barra; máx TIMELINE_MAX_LARGURA)
+    &machine=...&machine=... (opcional; padrão: todas as ativas)
+    """
+    agora = datetime.utcnow() - timedelta(hours=3)
+    try:
+        largura = int(request.args.get("largura", 800))
+        if not 1 <= largura <= TIMELINE_MAX_LARGURA:
+            raise ValueError(f"largura deve estar entre 1 e {TIMELINE_MAX_LARGURA}")
+        ate = request.args.get("ate")
+        ate = datetime.fromisoformat(ate) if ate else agora
+        desde = request.args.get("desde")
+        desde = datetime.fromisoformat(desde) if desde else ate - timedelta(days=1)
+        if desde >= ate:
+            raise ValueError("desde deve ser anterior a ate")
+
+        maquinas = request.args.getlist("machine")
+        if not maquinas:
+            sincronizar_maquinas()
+            maquinas = registro_maquinas.nomes()
+        cur = obter_conexao().cursor()
+        resultado = calcular_linha_do_tempo(cur, desde, ate, largura, agora, maquinas)
+        cur.close()
+    except ValueError as e:
+        return jsonify({"ok": False, "error": "parametro_invalido", "message": str(e)}), 400
+
+    return jsonify(
+        {
+            "desde": desde.isoformat(),
+            "ate": ate.isoformat(),
+            "largura": largura,
+            "gerado_em": agora.isoformat(),
+            **resultado,
+        }
+    )
+
+
+# =====================================================================
+# EXPORTAÇÃO DE PARADAS → /api/export (ver exportacao.py)
+# =====================================================================
+
+EXPORTACAO_BLOCO = int(os.environ.get("EXPORTACAO_BLOCO", 10000))
+EXPORTACAO_MAX_SIMULTANEAS = int(os.environ.get("EXPORTACAO_MAX_SIMULTANEAS", 2))
+
+# Por processo: exportações longas não podem ocupar todas as threads do worker
+_exportacoes = threading.BoundedSemaphore(EXPORTACAO_MAX_SIMULTANEAS)
+
+
+@app.route("/api/export", methods=["GET"])
+def api_export():
+    """
+    ?formato=csv|parquet|arrow (padrão csv)
+    &desde=&ate= (ISO, hora local, sobre start_time; ate exclusivo)
+    &machine=...&machine=... &origem=AUTO|MANUAL &sep=; (só CSV)
+    """
+    formato = request.args.get("formato", "csv")
+    try:
+        if formato not in FORMATOS:
+            raise ValueError(f"formato deve ser um de: {', '.join(FORMATOS)}")
+        filtros = {
+            "machines": request.args.getlist("machine") or None,
+            "origem": request.args.get("origem") or None,
+            "desde": datetime.fromisoformat(request.args["desde"]) if request.args.get("desde") else None,
+            "ate": datetime.fromisoformat(request.args["ate"]) if request.args.get("ate") else None,
+        }
+        if filtros["origem"] not in (None, "AUTO", "MANUAL"):
+            raise ValueError("origem deve ser AUTO ou MANUAL")
+        separador = request.args.get("sep", ",")
+        if len(separador) != 1:
+            raise ValueError("sep deve ter um caractere")
+    except ValueError as e:
+        return jsonify({"ok": False, "error": "parametro_invalido", "message": str(e)}), 400
+
+    if not _exportacoes.acquire(blocking=False):
+        resposta = jsonify({"ok": False, "error": "ocupado", "message": "Exportações demais em andamento"})
+        resposta.headers["Retry-After"] = "5"
+        return resposta, 429
+
+    conn = None
+    try:
+        # Conexão própria, fora do pool: a exportação dura o download inteiro
+        conn = psycopg2.connect(**PARAMETROS_PG)
+        pedacos = gerar_exportacao(formato, ler_blocos(conn, filtros, EXPORTACAO_BLOCO), separador)
+    except FormatoIndisponivel as e:
+        conn.close()
+        _exportacoes.release()
+        return jsonify({"ok": False, "error": "formato_indisponivel", "message": str(e)}), 501
+    except Exception:
+        if conn is not None:
+            conn.close()
+        _exportacoes.release()
+        raise
+
+    def encerrar():
+        # Roda no close() do WSGI, inclusive se o cliente desistir antes do 1º byte
+        pedacos.close()
+        conn.close()
+        _exportacoes.release()
+
+    tipo, extensao = FORMATOS[formato]
+    nome = f"paradas-{datetime.utcnow() - timedelta(hours=3):%Y%m%d-%H%M%S}.{extensao}"
+    resposta = Response(
+        pedacos,
+        mimetype=tipo,
+        headers={
+            "Content-Disposition": f'attachment; filename="{nome}"',
+            "Cache-Control": "no-store",
+            "X-Accel-Buffering": "no",
+        },
+    )
+    resposta.call_on_close(encerrar)
+    return resposta
+
+
 # =====================================================================
-# ENDPOINT PARA REPROCESSAR PARADAS MANUALMENTE (AGORA NO-OP)
+# REPROCESSAR PARADAS AUTO (eventos_brutos → paradas, ver reprocessamento.py)
 # =====================================================================
 
+REPROCESSAR_PROCESSOS = int(os.environ.get("REPROCESSAR_PROCESSOS", os.cpu_count() or 1))
+
+
 @app.route("/api/reprocess_paradas", methods=["POST"])
 def api_reprocess_paradas():
     """
-    No novo modelo, não há mais logs brutos a reprocessar.
-    As paradas são abertas/fechadas em tempo real.
-    Mantemos o endpoint só para não quebrar o front.
+    Refaz as paradas AUTO a partir de eventos_brutos com o threshold pedido
+    ({"threshold_minutos": 0.5, "machines": [...] opcional}). Responde
+    quando a troca estiver feita; o threshold passa a valer para o /log.
     """
+    data = request.get_json(silent=True) or {}
+    try:
+        threshold = float(data.get("threshold_minutos", threshold_descarte()))
+        if threshold < 0:
+            raise ValueError
+    except (ValueError, TypeError):
+        return jsonify({"ok": False, "error": "threshold_invalido"}), 400
+
+    maquinas = data.get("machines") or None
+    if maquinas is not None and not isinstance(maquinas, list):
+        return jsonify({"ok": False, "error": "machines_invalido"}), 400
+
+    try:
+        resumo = reprocessar_paradas(
+            PARAMETROS_PG,
+            threshold,
+            processos=REPROCESSAR_PROCESSOS,
+            maquinas=maquinas,
+            janela_s=PARADA_OSCILACAO_S,
+        )
+    except ReprocessamentoEmAndamento as e:
+        return jsonify({"ok": False, "error": "em_andamento", "message": str(e)}), 409
+
+    cache_paradas.backend.gravar(CHAVE_THRESHOLD, threshold)
+    cache_paradas.invalidar()
+    incrementar_versao_dados()
+    publicar_push([{"tipo": "reprocessado", "threshold_minutos": threshold}])
+    log.info("Reprocessamento concluído: %s", resumo)
+
     return jsonify(
         {
             "ok": True,
-            "message": "Modelo novo: nada a reprocessar. As paradas já são calculadas em tempo real.",
-            "total_paradas": 0,
+            "message": f"{resumo['fechadas']} paradas AUTO recalculadas em {resumo['segundos']}s.",
+            "total_paradas": resumo["fechadas"] + resumo["abertas"],
+            **resumo,
         }
     )
 
@@ -360,134 +1325,141 @@ def api_reprocess_paradas():
 # DASHBOARD: FUNÇÕES PARA LER paradas (tabela única)
 # =====================================================================
 
-machines = ["Máquina 01"]
 reasons = ["Setup", "Falta de Material", "Manutenção", "Almoço/Intervalo", "Sem motivo"]
 
 
+@metricas.medir("maroni_funcao_segundos", funcao="gerar_payload_dashboard")
 def gerar_payload_dashboard():
-    # ---------------------------------------------------------
-    # 1) Máquinas ativas / inativas AGORA, usando estadoLed:
-    #    - 0 (verde)   => ativa
-    #    - 1 (vermelho)=> inativa
-    #    - 2 / None    => ignorada (desligada)
-    # ---------------------------------------------------------
-    active_machines = 0
-    inactive_machines = 0
-
-    for m in machines:
-        estado = machine_states.get(m)
-        if estado == 0:
-            active_machines += 1
-        elif estado == 1:
-            inactive_machines += 1
-        # 2 ou None: não soma em nenhum
-
-    # ---------------------------------------------------------
-    # 2) Carrega histórico de PARADAS FECHADAS para gráficos
-    # ---------------------------------------------------------
-    conn = conectar_pg()
-    cur = conn.cursor()
-    cur.execute(
-        """
-        SELECT machine, reason, start_time, end_time, duration_minutes, origem
-        FROM paradas
-        WHERE end_time IS NOT NULL        -- só paradas fechadas
-        ORDER BY start_time DESC
-        LIMIT 200
-        """
+    sincronizar_maquinas()
+
+    # Somas dos últimos DASHBOARD_JANELA_DIAS dias (paradas_agregado)
+    hoje = (datetime.utcnow() - timedelta(hours=3)).replace(
+        hour=0, minute=0, second=0, microsecond=0
     )
+    desde = hoje - timedelta(days=DASHBOARD_JANELA_DIAS - 1)
+
+    cur = obter_conexao().cursor()
+    cur.execute(SQL_AGREGADOS_JANELA, (desde,))
+    agregados = cur.fetchall()
+    cur.execute(SQL_ULTIMAS_FECHADAS)
     rows = cur.fetchall()
     cur.close()
-    conn.close()
 
-    history = []
-    for machine, reason, start_time, end_time, duration, origem in rows:
-        history.append(
-            {
-                "machine": machine,
-                "reason": reason,
-                "start_time": start_time.isoformat(),
-                "end_time": end_time.isoformat(),
-                "duration_minutes": float(duration) if duration is not None else 0.0,
-                "origem": origem,  # AUTO / MANUAL
-            }
-        )
+    return montar_payload_dashboard(
+        registro_maquinas.contagem(),
+        agregados,
+        rows,
+        registro_maquinas.linha_de,
+        registro_maquinas.nomes,
+    )
 
-    # Se ainda não há paradas, mesmo assim devolve status de máquina
-    if not history:
-        return {
-            "cards": {
-                "totalStops": 0,
-                "totalDowntime": 0,
-                "avgDowntime": 0,
-                "mostCommonReason": "N/A",
-                "activeMachines": active_machines,
-                "inactiveMachines": inactive_machines,
-            },
-            "pie": {"labels": [], "data": []},
-            "bar": {"labels": machines, "data": [0 for _ in machines]},
-            "history": [],
-            "stops": [],
-            "machineStatus": {
-                "active": active_machines,
-                "inactive": inactive_machines,
-            },
-        }
 
-    total_stops = len(history)
-    total_downtime = sum(h["duration_minutes"] for h in history)
-    avg_downtime = total_downtime / total_stops if total_stops else 0
+# =====================================================================
+# ENDPOINT DO DASHBOARD → /api/data
+# =====================================================================
+
+# O JSON pronto fica no estado compartilhado junto com a versão/dia em que
+# foi gerado: com N TVs fazendo polling, só a primeira requisição depois
+# de uma mudança consulta o banco. Quem manda If-None-Match com o ETag
+# atual recebe 304 sem corpo.
 
-    # Contagem por motivo
-    reason_count = {}
-    for h in history:
-        r = h["reason"]
-        reason_count[r] = reason_count.get(r, 0) + 1
+cache_dashboard = CacheDashboard(cache_paradas.backend)
 
-    top_reason = max(reason_count, key=reason_count.get) if reason_count else "N/A"
 
-    pie_labels = list(reason_count.keys())
-    pie_data = [reason_count[k] for k in pie_labels]
+def etag_dashboard() -> str:
+    return montar_etag_dashboard(versao_dados(), datetime.utcnow() - timedelta(hours=3))
 
-    # Downtime por máquina
-    machine_downtime = {}
-    for h in history:
-        m = h["machine"]
-        machine_downtime[m] = machine_downtime.get(m, 0) + h["duration_minutes"]
 
-    bar_labels = list(machine_downtime.keys())
-    bar_data = [machine_downtime[m] for m in bar_labels]
+def obter_payload_dashboard_json(etag: str) -> str:
+    corpo = cache_dashboard.obter(etag)
+    if corpo is None:
+        corpo = cache_dashboard.guardar(etag, gerar_payload_dashboard())
+    return corpo
 
-    latest_history = history[:10]
 
-    return {
-        "cards": {
-            "totalStops": total_stops,
-            "totalDowntime": round(total_downtime, 2),
-            "avgDowntime": round(avg_downtime, 2),
-            "mostCommonReason": top_reason,
-            "activeMachines": active_machines,
-            "inactiveMachines": inactive_machines,
-        },
-        "pie": {"labels": pie_labels, "data": pie_data},
-        "bar": {"labels": bar_labels, "data": bar_data},
-        "history": latest_history,
-        "stops": history,
-        "machineStatus": {
-            "active": active_machines,
-            "inactive": inactive_machines,
-        },
-    }
+@app.route("/api/data", methods=["GET"])
+def api_data():
+    etag = etag_dashboard()
+
+    if etag_confere(request.headers.get("If-None-Match", ""), etag):
+        resposta = Response(status=304)
+    else:
+        resposta = Response(obter_payload_dashboard_json(etag), mimetype="application/json")
+
+    resposta.set_etag(etag)
+    resposta.headers["Cache-Control"] = "no-cache"
+    return resposta
 
 
 # =====================================================================
-# ENDPOINT DO DASHBOARD → /api/data
+# CADASTRO DE MÁQUINAS → /api/machines
 # =====================================================================
 
-@app.route("/api/data", methods=["GET"])
-def api_data():
-    payload = gerar_payload_dashboard()
-    return jsonify(payload)
+@app.route("/api/machines", methods=["GET"])
+def api_machines():
+    """Máquinas cadastradas (inclusive inativas) com last_seen e estado atual."""
+    conn = obter_conexao()
+    cur = conn.cursor()
+    registro_maquinas.gravar_vistos(cur)
+    conn.commit()
+    registro_maquinas.sincronizar(cur)
+    cur.execute("SELECT machine, last_seen FROM machines ORDER BY machine")
+    vistos = cur.fetchall()
+    cur.close()
+
+    agora = datetime.utcnow() - timedelta(hours=3)
+    sem_comunicacao = set(vigia_comunicacao.silenciadas())
+    itens = []
+    for machine, last_seen in vistos:
+        dados = registro_maquinas.obter(machine)
+        if dados is None:
+            continue
+        itens.append(
+            {
+                **dados,
+                "last_seen": last_seen.isoformat() if last_seen else None,
+                "estadoLed": estado_maquinas.obter(machine),
+                "em_turno": registro_maquinas.em_turno(machine, agora),
+                "sem_comunicacao": machine in sem_comunicacao,
+            }
+        )
+    return jsonify({"items": itens})
+
+
+@app.route("/api/machines", methods=["POST"])
+def api_salvar_machine():
+    """
+    Cria ou atualiza uma máquina:
+    {"machine": "Máquina 07", "linha": "L2", "setor": "Usinagem",
+     "turnos": "A=06:00-14:00,B=14:00-22:00", "ativa": true}
+    ativa=false tira a máquina das contagens sem apagar o histórico.
+    """
+    data = request.get_json(silent=True) or {}
+    machine = (data.get("machine") or "").strip()
+    if not machine or len(machine) > 50:
+        return jsonify({"ok": False, "error": "parametro_invalido", "message": "machine obrigatório (até 50 caracteres)"}), 400
+
+    conn = obter_conexao()
+    cur = conn.cursor()
+    try:
+        salva = registro_maquinas.salvar(
+            cur,
+            machine,
+            linha=data.get("linha") or None,
+            setor=data.get("setor") or None,
+            turnos=data.get("turnos") or None,
+            ativa=bool(data.get("ativa", True)),
+        )
+    except ValueError as e:
+        conn.rollback()
+        cur.close()
+        return jsonify({"ok": False, "error": "parametro_invalido", "message": f"turnos inválidos: {e}"}), 400
+    conn.commit()
+    cur.close()
+
+    registro_maquinas.publicar_mudanca()
+    incrementar_versao_dados()
+    return jsonify({"ok": True, "machine": salva}), 200
 
 
 # =====================================================================
@@ -498,7 +1470,7 @@ def api_data():
 def register_stop():
     data = request.get_json(silent=True) or {}
 
-    machine = data.get("machine") or "Máquina 01"
+    machine = data.get("machine") or MAQUINA_PADRAO
     reason = data.get("reason") or "Setup"
 
     try:
@@ -509,21 +1481,11 @@ def register_stop():
     now = datetime.utcnow()
     start_time = now - timedelta(minutes=duration_min)
 
-    conn = conectar_pg()
+    conn = obter_conexao()
     cur = conn.cursor()
-    cur.execute(
-        """
-        INSERT INTO paradas
-        (machine, reason, origem, start_time, end_time, duration_minutes)
-        VALUES (%s, %s, %s, %s, %s, %s)
-        RETURNING id;
-        """,
-        (machine, reason, "MANUAL", start_time, now, duration_min),
-    )
+    cur.execute(SQL_INSERIR_MANUAL, (machine, reason, "MANUAL", start_time, now, duration_min))
     new_id = cur.fetchone()[0]
-    conn.commit()
-    cur.close()
-    conn.close()
+    somar_agregados(cur, [(machine, reason, start_time, duration_min)])
 
     new_event = {
         "id": new_id,
@@ -535,6 +1497,17 @@ def register_stop():
         "origem": "MANUAL",
     }
 
+    if EVENTOS_PUSH:
+        eventos_push.publicar(
+            cur,
+            [{"tipo": "parada_manual", **new_event}]
+            + eventos_agregados([(machine, reason, start_time, duration_min)]),
+        )
+    conn.commit()
+    cur.close()
+    incrementar_versao_dados()
+    metricas.incrementar("maroni_paradas_total", evento="manual")
+
     return jsonify({"ok": True, "event": new_event}), 201
 
 
@@ -578,13 +1551,12 @@ def register_user():
     password_hash = generate_password_hash(password)
 
     try:
-        conn = conectar_pg()
+        conn = obter_conexao()
         cur = conn.cursor()
 
         cur.execute("SELECT id FROM users WHERE username = %s", (username,))
         if cur.fetchone():
             cur.close()
-            conn.close()
             return (
                 jsonify(
                     {
@@ -608,7 +1580,6 @@ def register_user():
         new_id = cur.fetchone()[0]
         conn.commit()
         cur.close()
-        conn.close()
 
         return (
             jsonify(
@@ -622,7 +1593,7 @@ def register_user():
         )
 
     except Exception as e:
-        print("[ERRO] /api/register_user:", e)
+        log.exception("/api/register_user: %s", e)
         return (
             jsonify(
                 {
@@ -649,7 +1620,7 @@ def api_login():
         return jsonify({"ok": False, "error": "missing_credentials"}), 400
 
     try:
-        conn = conectar_pg()
+        conn = obter_conexao()
         cur = conn.cursor()
         cur.execute(
             "SELECT id, username, password_hash, nome FROM users WHERE username = %s",
@@ -657,7 +1628,6 @@ def api_login():
         )
         row = cur.fetchone()
         cur.close()
-        conn.close()
 
         if not row:
             return jsonify({"ok": False, "error": "invalid_credentials"}), 401
@@ -674,7 +1644,7 @@ def api_login():
         return jsonify({"ok": True, "username": user_name, "nome": nome})
 
     except Exception as e:
-        print("[ERRO] /api/login:", e)
+        log.exception("/api/login: %s", e)
         return jsonify({"ok": False, "error": "server_error"}), 500
 
 
@@ -692,7 +1662,7 @@ def api_logout():
 def request_recovery():
     data = request.get_json(silent=True) or {}
     email = data.get("email")
-    print("[INFO] Pedido de recuperação de senha para:", email)
+    log.info("Pedido de recuperação de senha para: %s", email)
     return jsonify(
         {"ok": True, "message": "Se o e-mail existir, será enviado um link de recuperação."}
     )
@@ -708,5 +1678,10 @@ def index():
 
 
 if __name__ == "__main__":
-    print("Servidor unificado iniciado (modelo paradas única)...")
+    log.info("Servidor unificado iniciado (modelo paradas única)...")
+    try:
+        with app.app_context():
+            aquecer_cache_paradas()
+    except psycopg2.Error as e:
+        log.warning("Não foi possível aquecer o cache de paradas: %s", e)
     app.run(host="0.0.0.0", port=5000, debug=True)
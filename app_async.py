@@ -0,0 +1,845 @@
+import asyncio
+import contextlib
+import itertools
+import json
+import logging
+import os
+import re
+from datetime import datetime, timedelta
+from decimal import Decimal
+
+import asyncpg
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Route
+
+from arquivo_eventos import ArquivoEventos
+from cadastro_maquinas import SQL_CADASTRAR_NOVAS, SQL_GRAVAR_VISTOS, RegistroMaquinas
+from consultas_paradas import (
+    CHAVE_THRESHOLD,
+    CHAVE_VERSAO_DADOS,
+    SQL_AGREGADOS_JANELA,
+    SQL_ESTADOS_MAQUINAS,
+    SQL_INSERIR_MANUAL,
+    SQL_PARADAS_AUTO_ABERTAS,
+    SQL_SOMAR_AGREGADOS,
+    SQL_ULTIMAS_FECHADAS,
+    CacheDashboard,
+    decodificar_cursor,
+    etag_confere,
+    etag_dashboard,
+    evento_estado,
+    eventos_agregados,
+    ler_corpo_lote,
+    ler_filtros_historico,
+    linhas_agregados,
+    montar_consulta_historico,
+    montar_payload_dashboard,
+    pagina_historico,
+)
+from configuracao import (
+    ARQUIVO_EVENTOS,
+    ARQUIVO_EVENTOS_DIR,
+    ARQUIVO_FSYNC_S,
+    ARQUIVO_MAX_IDADE_S,
+    ARQUIVO_MAX_MB,
+    CACHE_REAQUECER_S,
+    DASHBOARD_JANELA_DIAS,
+    DEDUP_EVENTOS,
+    DEDUP_MEMORIA,
+    ESTADO_BACKEND,
+    EVENTOS_BRUTOS,
+    EVENTOS_PUSH,
+    HISTORICO_LIMITE_MAX,
+    HISTORICO_LIMITE_PADRAO,
+    LOTE_MAX_EVENTOS,
+    MAQUINAS_VISTO_S,
+    PARADA_OSCILACAO_S,
+    PARADAS_PENDENTES_S,
+    PARAMETROS_PG,
+    PG_POOL_MAX,
+    PG_POOL_MAX_VIDA_S,
+    PG_POOL_MIN,
+    PG_POOL_TIMEOUT_S,
+    SEM_COMUNICACAO_S,
+    TURNOS,
+)
+from deduplicacao import SQL_REGISTRAR_CHAVES, FiltroDuplicados, linhas_chaves, restantes
+from estado_compartilhado import CacheParadasAbertas, EstadoMaquinas, criar_backend
+from eventos_push import CANAL_PADRAO, payloads
+from gravacao_paradas import (
+    TEMPLATE_AGREGADOS,
+    TEMPLATE_VISTOS,
+    aplicar_gravado,
+    instrucoes_plano,
+    muda_paradas,
+    planejar_pendentes,
+)
+from instrumentacao import configurar_log, parar_log
+from maquina_estados import (
+    MAQUINA_PADRAO,
+    THRESHOLD_DESCARTE_MIN,
+    aberta_do_cache,
+    agrupar_eventos,
+    evento_sem_comunicacao,
+    eventos_reconexao,
+    planejar_paradas,
+    separar_por_maquina,
+    validar_evento,
+)
+from migracoes import SQL_PARADAS_PARTICIONADA
+from vigia_comunicacao import VigiaComunicacao
+
+# =====================================================================
+# MODO ASGI (Starlette + asyncpg) PARA INGESTÃO E DASHBOARD
+# =====================================================================
+#
+# Alternativa ao app.py para muitos Arduinos/TVs conectados ao mesmo
+# tempo: cada requisição esperando o banco é uma corrotina, não uma
+# thread, então poucos processos seguram milhares de conexões abertas.
+# Cobre /log, /log/batch, /heartbeat, /api/data, /ultimos,
+# /api/historico, /api/register_stop e /api/stream; o resto (login,
+# cadastro, analytics, exportação, reprocessamento, /metrics) continua no
+# app.py, que pode rodar ao lado com o mesmo banco e o mesmo
+# ESTADO_BACKEND (cache de abertas, estado dos LEDs, versão e cache do
+# dashboard são compartilhados entre os dois).
+#
+# A regra de negócio é a mesma do app.py: maquina_estados.py reduz os
+# eventos e consultas_paradas.py tem os SQL e os payloads. Aqui não há
+# fila de escrita: o /log espera a transação (sem ocupar thread) e
+# responde com o resumo, como o app.py com FILA_ESCRITA=0.
+#
+# Dependências extras (starlette, uvicorn, asyncpg): pip install -r requirements-async.txt
+#
+#   uvicorn app_async:app --host 0.0.0.0 --port 5000 --workers 2
+#
+# O estado compartilhado é lido de forma síncrona (microssegundos com
+# sqlite em /dev/shm); com ESTADO_BACKEND=postgres cada leitura bloqueia o
+# loop pelo tempo de uma ida ao banco.
+
+LOG_NIVEL = os.environ.get("LOG_NIVEL", "INFO")
+
+configurar_log(LOG_NIVEL)
+log = logging.getLogger("maroni.async")
+
+# =====================================================================
+# POOL asyncpg (parâmetros em configuracao.py)
+# =====================================================================
+
+# Limite de parâmetros por instrução do protocolo do PostgreSQL
+MAX_PARAMETROS = 32767
+
+_pool = {"pool": None}
+
+
+def pool() -> asyncpg.Pool:
+    return _pool["pool"]
+
+
+def para_asyncpg(sql: str) -> str:
+    """Placeholders do psycopg2 (%s) → asyncpg ($1, $2, ...)."""
+    numero = itertools.count(1)
+    return re.sub(r"%s", lambda _: f"${next(numero)}", sql)
+
+
+async def executar_valores(con, sql: str, linhas: list, template: str = None, fetch: bool = False):
+    """
+    execute_values() do psycopg2 para asyncpg: "VALUES %s" vira
+    "VALUES ($1, $2), ($3, $4), ..." com os valores em sequência, em
+    páginas que respeitam MAX_PARAMETROS. Os templates com casts estão em
+    gravacao_paradas.py.
+    """
+    if not linhas:
+        return []
+    template = template or "(" + ", ".join(["%s"] * len(linhas[0])) + ")"
+    pagina = max(1, MAX_PARAMETROS // max(1, template.count("%s")))
+    resultado = []
+    for inicio in range(0, len(linhas), pagina):
+        bloco = linhas[inicio:inicio + pagina]
+        valores = ", ".join([template] * len(bloco))
+        consulta = para_asyncpg(sql.replace("VALUES %s", "VALUES " + valores, 1))
+        args = [valor for linha in bloco for valor in linha]
+        if fetch:
+            resultado.extend(await con.fetch(consulta, *args))
+        else:
+            await con.execute(consulta, *args)
+    return resultado
+
+
+async def executar_instrucoes(con, instrucoes):
+    """executar_instrucoes() do app.py na conexão asyncpg `con`."""
+    retorno = None
+    while True:
+        try:
+            instrucao = instrucoes.send(retorno)
+        except StopIteration as fim:
+            return fim.value
+        if instrucao.lote:
+            retorno = await executar_valores(
+                con, instrucao.sql, list(instrucao.linhas), instrucao.template, instrucao.fetch
+            )
+        else:
+            retorno = await con.execute(para_asyncpg(instrucao.sql), *instrucao.linhas)
+
+
+def agora_local() -> datetime:
+    return datetime.utcnow() - timedelta(hours=3)
+
+
+# =====================================================================
+# ESTADO COMPARTILHADO (o mesmo do app.py)
+# =====================================================================
+
+cache_paradas = CacheParadasAbertas(
+    criar_backend(
+        ESTADO_BACKEND,
+        **({"parametros_conexao": PARAMETROS_PG} if ESTADO_BACKEND == "postgres" else {}),
+    ),
+    reaquecer_apos_s=CACHE_REAQUECER_S,
+)
+estado_maquinas = EstadoMaquinas(cache_paradas.backend)
+registro_maquinas = RegistroMaquinas(
+    cache_paradas.backend, TURNOS, recarregar_apos_s=CACHE_REAQUECER_S
+)
+filtro_duplicados = FiltroDuplicados(DEDUP_MEMORIA)
+
+
+def versao_dados() -> int:
+    return cache_paradas.backend.obter(CHAVE_VERSAO_DADOS) or 0
+
+
+def incrementar_versao_dados() -> int:
+    return cache_paradas.backend.incrementar(CHAVE_VERSAO_DADOS)
+
+
+def threshold_descarte() -> float:
+    valor = cache_paradas.backend.obter(CHAVE_THRESHOLD)
+    return THRESHOLD_DESCARTE_MIN if valor is None else float(valor)
+
+
+async def aquecer_cache_paradas(con):
+    total = cache_paradas.aquecer(await con.fetch(SQL_PARADAS_AUTO_ABERTAS))
+    log.info("Cache de paradas abertas aquecido (%d abertas).", total)
+
+
+async def parada_aberta_em_cache(con, machine: str):
+    """dict {id, reason, start_time} da parada AUTO aberta, ou None."""
+    if cache_paradas.precisa_aquecer():
+        await aquecer_cache_paradas(con)
+    aberta = cache_paradas.obter(machine)
+    if aberta is CacheParadasAbertas.DESCONHECIDO:
+        await aquecer_cache_paradas(con)
+        aberta = cache_paradas.obter(machine)
+    return aberta
+
+
+async def sincronizar_maquinas(con):
+    """Cadastro (se mudou) + estados de LED mudados por qualquer worker."""
+    pendente = registro_maquinas.consulta_pendente()
+    if pendente is not None:
+        sql, params, completa, versao = pendente
+        linhas = await con.fetch(para_asyncpg(sql), *params)
+        registro_maquinas.aplicar_carga(linhas, completa, versao)
+    registro_maquinas.sincronizar_estados(estado_maquinas)
+
+
+async def cadastrar_maquinas_novas(con, nomes):
+    await sincronizar_maquinas(con)
+    novas = registro_maquinas.desconhecidas(nomes)
+    if not novas:
+        return
+    inseridas = await executar_valores(con, SQL_CADASTRAR_NOVAS, [(m,) for m in novas], fetch=True)
+    novas = registro_maquinas.aplicar_cadastradas(inseridas)
+    if novas:
+        registro_maquinas.publicar_mudanca()
+        incrementar_versao_dados()
+        log.info("Máquina(s) nova(s) cadastrada(s): %s", ", ".join(novas))
+
+
+async def loop_gravar_vistos():
+    while True:
+        await asyncio.sleep(MAQUINAS_VISTO_S)
+        vistos = registro_maquinas.retirar_vistos()
+        if not vistos:
+            continue
+        try:
+            async with pool().acquire(timeout=PG_POOL_TIMEOUT_S) as con:
+                await executar_valores(
+                    con, SQL_GRAVAR_VISTOS, list(vistos.items()), template=TEMPLATE_VISTOS
+                )
+        except Exception as e:
+            log.warning("Falha ao gravar last_seen das máquinas: %s", e)
+
+
+_particionada = {"valor": None}
+
+
+async def tabela_paradas_particionada(con) -> bool:
+    if _particionada["valor"] is None:
+        _particionada["valor"] = await con.fetchval(SQL_PARADAS_PARTICIONADA)
+    return _particionada["valor"]
+
+
+# =====================================================================
+# ARQUIVO DE EVENTOS BRUTOS (ver arquivo_eventos.py)
+# =====================================================================
+
+arquivo_eventos = ArquivoEventos(
+    ARQUIVO_EVENTOS_DIR,
+    max_bytes=int(ARQUIVO_MAX_MB * 1024 * 1024),
+    max_idade_s=ARQUIVO_MAX_IDADE_S,
+    fsync_s=ARQUIVO_FSYNC_S,
+)
+
+
+def arquivar_eventos(dados: list):
+    if ARQUIVO_EVENTOS and not arquivo_eventos.registrar(dados):
+        log.warning("Arquivo de eventos: buffer cheio, %d evento(s) não arquivado(s)", len(dados))
+
+
+# =====================================================================
+# PROCESSAR EVENTOS DO ARDUINO (mesmo fluxo do processar_eventos do app.py)
+# =====================================================================
+
+async def publicar_push(con, eventos: list):
+    """pg_notify dentro da transação de con (entregue no commit)."""
+    if not EVENTOS_PUSH:
+        return
+    for payload in payloads(eventos):
+        await con.execute("SELECT pg_notify($1, $2)", CANAL_PADRAO, payload)
+
+
+async def processar_eventos(dados: list) -> dict:
+    threshold_minutos = threshold_descarte()
+    eventos, por_maquina, ignorados = agrupar_eventos(dados)
+
+    chaves, duplicados = {}, 0
+    if DEDUP_EVENTOS:
+        eventos, chaves, duplicados = filtro_duplicados.filtrar(eventos)
+
+    async with pool().acquire(timeout=PG_POOL_TIMEOUT_S) as con:
+        if por_maquina:
+            await cadastrar_maquinas_novas(con, list(por_maquina))
+            registro_maquinas.marcar_visto(por_maquina, agora_local())
+
+        # A transação das paradas começa no registro das chaves
+        transacao = None
+        if chaves:
+            transacao = con.transaction()
+            await transacao.start()
+        try:
+            return await planejar_e_gravar(
+                con, eventos, por_maquina, chaves, ignorados, duplicados, threshold_minutos, transacao
+            )
+        except BaseException:
+            # gravar_plano desfaz o que falhar na escrita; aqui sobra o que
+            # falhou antes dela (cache, planejamento) com a transação aberta
+            if transacao is not None and con.is_in_transaction():
+                await transacao.rollback()
+            raise
+
+
+async def planejar_e_gravar(con, eventos: list, por_maquina: dict, chaves: dict, ignorados: int,
+                            duplicados: int, threshold_minutos: float, transacao) -> dict:
+    """Resto do processar_eventos(): dentro da `transacao` quando há chaves a registrar."""
+    gravadas = []
+    if chaves:
+        linhas = await executar_valores(con, SQL_REGISTRAR_CHAVES, linhas_chaves(chaves), fetch=True)
+        eventos, gravadas, repetidos = restantes(eventos, chaves, linhas)
+        duplicados += repetidos
+    if duplicados:
+        por_maquina = separar_por_maquina(eventos)
+
+    anteriores = {}  # entradas do cache de paradas abertas, antes do lote
+    abertas = {}
+    push = []  # eventos para o stream ao vivo (/api/stream)
+    estados = []  # estados de LED que mudaram → machine_states e estado_maquinas
+    for machine, evs in por_maquina.items():
+        if estado_maquinas.mudou(machine, evs[-1]["estado_led"]):
+            estados.append((machine, evs[-1]["estado_led"], evs[-1]["agora"]))
+            push.append(evento_estado(machine, evs[-1]["estado_led"]))
+        anteriores[machine] = await parada_aberta_em_cache(con, machine)
+        abertas[machine] = aberta_do_cache(anteriores[machine])
+
+    agora = max([agora_local()] + [ev["agora"] for ev in eventos[-1:]])
+    plano = planejar_paradas(por_maquina, abertas, threshold_minutos, PARADA_OSCILACAO_S, agora)
+
+    brutos = []
+    if EVENTOS_BRUTOS:
+        brutos = [
+            (ev["machine"], ev["agora"], ev["ts_ms"], ev["tipo"], ev["estado_led"], ev["motivo_bruto"])
+            for ev in eventos
+            if isinstance(ev["estado_led"], int)
+        ]
+
+    resumo = {"eventos": len(eventos), "ignorados": ignorados, "duplicados": duplicados}
+    return await gravar_plano(
+        con, plano, anteriores, resumo, brutos, push, estados, gravadas, transacao
+    )
+
+
+async def gravar_plano(con, plano: dict, anteriores: dict, resumo: dict, brutos=(), push=None,
+                       estados=(), chaves=(), transacao=None) -> dict:
+    """
+    Mesmo papel do gravar_plano() de app.py, na conexão asyncpg `con`.
+    transacao: já aberta por quem inseriu as `chaves` em eventos_chaves;
+    o commit (ou rollback) é feito aqui.
+    """
+    push = push if push is not None else []
+    resumo.update(
+        {"fechadas": len(plano["fechadas"]), "descartadas": plano["descartadas"], "abertas": 0}
+    )
+
+    abertas_gravadas = []
+    if transacao is None and (muda_paradas(plano) or brutos or push or estados):
+        transacao = con.transaction()
+        await transacao.start()
+    if transacao is not None:
+        try:
+            particionada = muda_paradas(plano) and await tabela_paradas_particionada(con)
+            abertas_gravadas = await executar_instrucoes(
+                con,
+                instrucoes_plano(plano, resumo, brutos, estados, push, particionada, EVENTOS_PUSH),
+            )
+        except BaseException:
+            await transacao.rollback()
+            raise
+        await transacao.commit()
+
+    # Só depois do commit o cache reflete o banco
+    resumo["abertas"] = aplicar_gravado(
+        cache_paradas, estado_maquinas, filtro_duplicados,
+        plano, anteriores, abertas_gravadas, estados, chaves,
+    )
+
+    if push:
+        incrementar_versao_dados()
+    return resumo
+
+
+async def processar_pendentes():
+    """Ver processar_pendentes() em app.py. None se não havia nada vencido."""
+    pendentes = planejar_pendentes(
+        cache_paradas, agora_local(), threshold_descarte(), PARADA_OSCILACAO_S
+    )
+    if pendentes is None:
+        return None
+    plano, anteriores = pendentes
+    async with pool().acquire(timeout=PG_POOL_TIMEOUT_S) as con:
+        return await gravar_plano(con, plano, anteriores, {"eventos": 0, "ignorados": 0})
+
+
+async def loop_paradas_pendentes():
+    while True:
+        await asyncio.sleep(PARADAS_PENDENTES_S)
+        try:
+            resumo = await processar_pendentes()
+            if resumo:
+                log.debug("Paradas pendentes gravadas: %s", resumo)
+        except Exception as e:
+            log.warning("Falha ao gravar paradas pendentes: %s", e)
+
+
+# =====================================================================
+# HEARTBEAT E "SEM COMUNICAÇÃO" (ver vigia_comunicacao.py)
+# =====================================================================
+
+VIGIA_COMUNICACAO = SEM_COMUNICACAO_S > 0
+
+_loop = {"loop": None}
+
+
+async def aplicar_eventos_servidor(dados: list):
+    arquivar_eventos(dados)
+    try:
+        await processar_eventos(dados)
+    except Exception:
+        log.exception("Falha ao aplicar evento do servidor: %s", dados)
+
+
+def ao_silenciar(machine: str, registro: dict):
+    # Roda na thread do vigia: entrega ao loop do processo
+    asyncio.run_coroutine_threadsafe(
+        aplicar_eventos_servidor([evento_sem_comunicacao(machine, registro)]), _loop["loop"]
+    )
+
+
+def deve_vigiar(machine: str) -> bool:
+    dados = registro_maquinas.obter(machine)
+    if dados is None:
+        return True
+    return dados["ativa"] and registro_maquinas.em_turno(machine, agora_local())
+
+
+vigia_comunicacao = VigiaComunicacao(
+    cache_paradas.backend, SEM_COMUNICACAO_S, ao_silenciar, deve_vigiar=deve_vigiar
+)
+
+
+async def sinalizar_comunicacao(dados: list):
+    if not VIGIA_COMUNICACAO:
+        return
+    agora_texto = agora_local().strftime("%Y-%m-%d %H:%M:%S")
+    reconexoes = eventos_reconexao(vigia_comunicacao.sinalizar(dados, MAQUINA_PADRAO, agora_texto))
+    if reconexoes:
+        await aplicar_eventos_servidor(reconexoes)
+
+
+# =====================================================================
+# ENDPOINTS DO ARDUINO → /log, /log/batch, /heartbeat
+# =====================================================================
+
+async def receber_log(request):
+    try:
+        dado = json.loads(await request.body())
+    except ValueError as e:
+        log.error("JSON inválido: %s", e)
+        return JSONResponse({"status": "erro", "msg": "JSON inválido"}, status_code=400)
+    erro = validar_evento(dado)
+    if erro:
+        log.warning("Log inválido: %s", erro)
+        return JSONResponse({"status": "erro", "msg": erro}, status_code=400)
+
+    arquivar_eventos([dado])
+    await sinalizar_comunicacao([dado])
+
+    if dado.get("estadoLed") is None:
+        log.warning("Log sem estadoLed, ignorando para contagem.")
+        return JSONResponse({"status": "ok"})
+
+    resumo = await processar_eventos([dado])
+    return JSONResponse({"status": "ok", **resumo})
+
+
+async def receber_log_lote(request):
+    mimetype = request.headers.get("content-type", "").split(";")[0].strip()
+    try:
+        dados = ler_corpo_lote((await request.body()).decode("utf-8"), mimetype)
+    except ValueError as e:
+        log.error("Lote inválido: %s", e)
+        return JSONResponse({"status": "erro", "msg": "JSON/NDJSON inválido"}, status_code=400)
+
+    if not all(isinstance(d, dict) for d in dados):
+        return JSONResponse(
+            {"status": "erro", "msg": "Cada evento deve ser um objeto JSON"}, status_code=400
+        )
+    if len(dados) > LOTE_MAX_EVENTOS:
+        return JSONResponse(
+            {"status": "erro", "msg": f"Lote muito grande (máximo {LOTE_MAX_EVENTOS} eventos)"},
+            status_code=413,
+        )
+    for i, dado in enumerate(dados):
+        erro = validar_evento(dado)
+        if erro:
+            log.warning("Lote inválido: evento %d: %s", i, erro)
+            return JSONResponse({"status": "erro", "msg": f"Evento {i}: {erro}"}, status_code=400)
+
+    arquivar_eventos(dados)
+    await sinalizar_comunicacao(dados)
+    resumo = await processar_eventos(dados)
+    return JSONResponse({"status": "ok", **resumo})
+
+
+async def heartbeat(request):
+    try:
+        dados = json.loads(await request.body())
+    except ValueError:
+        dados = None
+    if isinstance(dados, dict):
+        dados = [dados]
+    if not isinstance(dados, list) or not all(isinstance(d, dict) for d in dados):
+        return JSONResponse({"status": "erro", "msg": "JSON inválido"}, status_code=400)
+    await sinalizar_comunicacao([{k: v for k, v in d.items() if k != "estadoLed"} for d in dados])
+    return Response(status_code=204)
+
+
+# =====================================================================
+# HISTÓRICO → /ultimos e /api/historico
+# =====================================================================
+
+async def consultar_historico(filtros: dict, limit: int, cursor=None):
+    limit = max(1, min(limit, HISTORICO_LIMITE_MAX))
+    sql, params = montar_consulta_historico(filtros, limit, cursor)
+    async with pool().acquire(timeout=PG_POOL_TIMEOUT_S) as con:
+        linhas = await con.fetch(para_asyncpg(sql), *params)
+    return pagina_historico(linhas, limit)
+
+
+def parametro_invalido(e: ValueError) -> JSONResponse:
+    return JSONResponse(
+        {"ok": False, "error": "parametro_invalido", "message": str(e)}, status_code=400
+    )
+
+
+async def ultimos_logs(request):
+    try:
+        limit = int(request.query_params.get("limit", 20))
+        filtros = ler_filtros_historico(request.query_params)
+    except ValueError as e:
+        return parametro_invalido(e)
+
+    resultado, _ = await consultar_historico(filtros, limit)
+    return JSONResponse(resultado)
+
+
+async def api_historico(request):
+    try:
+        limit = int(request.query_params.get("limit", HISTORICO_LIMITE_PADRAO))
+        filtros = ler_filtros_historico(request.query_params)
+        cursor = request.query_params.get("cursor")
+        cursor = decodificar_cursor(cursor) if cursor else None
+    except ValueError as e:
+        return parametro_invalido(e)
+
+    itens, proximo = await consultar_historico(filtros, limit, cursor)
+    return JSONResponse({"items": itens, "next_cursor": proximo})
+
+
+# =====================================================================
+# DASHBOARD → /api/data (mesmo cache e ETag do app.py)
+# =====================================================================
+
+cache_dashboard = CacheDashboard(cache_paradas.backend)
+
+
+async def gerar_payload_dashboard() -> dict:
+    hoje = agora_local().replace(hour=0, minute=0, second=0, microsecond=0)
+    desde = hoje - timedelta(days=DASHBOARD_JANELA_DIAS - 1)
+
+    async with pool().acquire(timeout=PG_POOL_TIMEOUT_S) as con:
+        await sincronizar_maquinas(con)
+        agregados = await con.fetch(para_asyncpg(SQL_AGREGADOS_JANELA), desde)
+        rows = await con.fetch(SQL_ULTIMAS_FECHADAS)
+
+    return montar_payload_dashboard(
+        registro_maquinas.contagem(),
+        agregados,
+        rows,
+        registro_maquinas.linha_de,
+        registro_maquinas.nomes,
+    )
+
+
+async def obter_payload_dashboard_json(etag: str) -> str:
+    corpo = cache_dashboard.obter(etag)
+    if corpo is None:
+        corpo = cache_dashboard.guardar(etag, await gerar_payload_dashboard())
+    return corpo
+
+
+async def api_data(request):
+    etag = etag_dashboard(versao_dados(), agora_local())
+    cabecalhos = {"ETag": f'"{etag}"', "Cache-Control": "no-cache"}
+
+    if etag_confere(request.headers.get("if-none-match", ""), etag):
+        return Response(status_code=304, headers=cabecalhos)
+
+    corpo = await obter_payload_dashboard_json(etag)
+    return Response(corpo, media_type="application/json", headers=cabecalhos)
+
+
+# =====================================================================
+# PARADA MANUAL → /api/register_stop
+# =====================================================================
+
+async def register_stop(request):
+    try:
+        data = json.loads(await request.body())
+    except ValueError:
+        data = None
+    if not isinstance(data, dict):
+        data = {}
+
+    machine = data.get("machine") or MAQUINA_PADRAO
+    reason = data.get("reason") or "Setup"
+
+    try:
+        duration_min = float(data.get("duration", 0))
+    except (ValueError, TypeError):
+        duration_min = 0.0
+
+    now = datetime.utcnow()
+    start_time = now - timedelta(minutes=duration_min)
+
+    async with pool().acquire(timeout=PG_POOL_TIMEOUT_S) as con:
+        async with con.transaction():
+            new_id = await con.fetchval(
+                para_asyncpg(SQL_INSERIR_MANUAL),
+                machine, reason, "MANUAL", start_time, now, Decimal(str(duration_min)),
+            )
+            await executar_valores(
+                con,
+                SQL_SOMAR_AGREGADOS,
+                linhas_agregados([(machine, reason, start_time, duration_min)]),
+                template=TEMPLATE_AGREGADOS,
+            )
+
+            new_event = {
+                "id": new_id,
+                "machine": machine,
+                "reason": reason,
+                "start_time": start_time.isoformat(),
+                "end_time": now.isoformat(),
+                "duration_minutes": duration_min,
+                "origem": "MANUAL",
+            }
+            await publicar_push(
+                con,
+                [{"tipo": "parada_manual", **new_event}]
+                + eventos_agregados([(machine, reason, start_time, duration_min)]),
+            )
+    incrementar_versao_dados()
+
+    return JSONResponse({"ok": True, "event": new_event}, status_code=201)
+
+
+# =====================================================================
+# STREAM AO VIVO (SSE) → /api/stream
+# =====================================================================
+#
+# Uma conexão por processo faz LISTEN (add_listener do asyncpg) e repassa
+# os eventos para a asyncio.Queue de cada cliente; cliente lento demais é
+# desligado, como no eventos_push.Difusor.
+
+SSE_KEEPALIVE_S = 15
+SSE_MAX_FILA = 500
+
+_assinantes = set()
+_ouvinte = {"con": None}
+
+
+def difundir(_con, _pid, _canal, payload: str):
+    try:
+        eventos = json.loads(payload)
+    except ValueError:
+        log.warning("Evento push inválido: %s", payload[:200])
+        return
+    for fila in list(_assinantes):
+        try:
+            for ev in eventos:
+                fila.put_nowait(ev)
+        except asyncio.QueueFull:
+            # Cliente não acompanha: derruba para ele reconectar
+            _assinantes.discard(fila)
+            fila.get_nowait()
+            fila.put_nowait(None)
+
+
+async def api_stream(request):
+    if not EVENTOS_PUSH:
+        return JSONResponse({"ok": False, "error": "push_desativado"}, status_code=404)
+
+    fila = asyncio.Queue(maxsize=SSE_MAX_FILA)
+    _assinantes.add(fila)
+
+    async def gerar():
+        try:
+            yield f"retry: 3000\nevent: versao\ndata: {json.dumps({'versao': versao_dados()})}\n\n"
+            while True:
+                try:
+                    ev = await asyncio.wait_for(fila.get(), SSE_KEEPALIVE_S)
+                except asyncio.TimeoutError:
+                    yield ": keepalive\n\n"
+                    continue
+                if ev is None:
+                    break
+                yield f"event: {ev.get('tipo', 'mensagem')}\ndata: {json.dumps(ev, ensure_ascii=False)}\n\n"
+        finally:
+            _assinantes.discard(fila)
+
+    return StreamingResponse(
+        gerar(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+async def ouvir_eventos():
+    """Mantém o LISTEN de pé; reconecta com espera crescente se cair."""
+    espera = 1.0
+    while True:
+        try:
+            con = await asyncpg.connect(**PARAMETROS_PG)
+            _ouvinte["con"] = con
+            await con.add_listener(CANAL_PADRAO, difundir)
+            espera = 1.0
+            # Avisa quem estava conectado que pode ter perdido eventos
+            difundir(con, None, CANAL_PADRAO, json.dumps([{"tipo": "reconectado"}]))
+            while not con.is_closed():
+                await asyncio.sleep(30)
+                await con.execute("SELECT 1")
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            log.error("LISTEN de eventos caiu (%s); reconectando em %.0fs", e, espera)
+        finally:
+            con = _ouvinte.pop("con", None)
+            if con is not None and not con.is_closed():
+                await con.close()
+        await asyncio.sleep(espera)
+        espera = min(espera * 2, 30.0)
+
+
+# =====================================================================
+# APLICAÇÃO ASGI
+# =====================================================================
+
+async def pool_esgotado(_request, _exc) -> JSONResponse:
+    """Sem conexão livre no pool em PG_POOL_TIMEOUT_S: 503 para o cliente tentar de novo."""
+    return JSONResponse(
+        {"status": "erro", "msg": "Servidor ocupado, tente novamente"},
+        status_code=503,
+        headers={"Retry-After": "1"},
+    )
+
+
+@contextlib.asynccontextmanager
+async def ciclo_de_vida(_app):
+    _loop["loop"] = asyncio.get_running_loop()
+    _pool["pool"] = await asyncpg.create_pool(
+        **PARAMETROS_PG,
+        min_size=PG_POOL_MIN,
+        max_size=PG_POOL_MAX,
+        max_inactive_connection_lifetime=PG_POOL_MAX_VIDA_S,
+    )
+    async with pool().acquire() as con:
+        if estado_maquinas.precisa_aquecer():
+            total = estado_maquinas.aquecer(await con.fetch(SQL_ESTADOS_MAQUINAS))
+            log.info("Estado das máquinas restaurado do banco (%d máquinas).", total)
+        await sincronizar_maquinas(con)
+    if VIGIA_COMUNICACAO:
+        vigia_comunicacao.acompanhar(registro_maquinas.nomes())
+
+    tarefas = [
+        asyncio.create_task(loop_gravar_vistos()),
+        asyncio.create_task(loop_paradas_pendentes()),
+    ]
+    if EVENTOS_PUSH:
+        tarefas.append(asyncio.create_task(ouvir_eventos()))
+    try:
+        yield
+    finally:
+        for tarefa in tarefas:
+            tarefa.cancel()
+        await asyncio.gather(*tarefas, return_exceptions=True)
+        for fila in list(_assinantes):
+            fila.put_nowait(None)
+        await pool().close()
+        arquivo_eventos.fechar()
+        parar_log()
+
+
+app = Starlette(
+    routes=[
+        Route("/log", receber_log, methods=["POST"]),
+        Route("/log/batch", receber_log_lote, methods=["POST"]),
+        Route("/heartbeat", heartbeat, methods=["POST"]),
+        Route("/ultimos", ultimos_logs, methods=["GET"]),
+        Route("/api/historico", api_historico, methods=["GET"]),
+        Route("/api/data", api_data, methods=["GET"]),
+        Route("/api/register_stop", register_stop, methods=["POST"]),
+        Route("/api/stream", api_stream, methods=["GET"]),
+    ],
+    exception_handlers={asyncio.TimeoutError: pool_esgotado},
+    lifespan=ciclo_de_vida,
+)
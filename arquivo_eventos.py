@@ -0,0 +1,307 @@
+import gzip
+import heapq
+import json
+import logging
+import os
+import queue
+import re
+import shutil
+import threading
+import time
+from collections import deque
+from datetime import datetime
+
+# =====================================================================
+# ARQUIVO DE EVENTOS BRUTOS (JSONL rotacionado e comprimido)
+# =====================================================================
+#
+# Todo log recebido do Arduino é guardado como veio, mais "recebido_em".
+# A requisição só coloca o evento num buffer limitado em memória; uma
+# thread por processo escreve no segmento atual, faz fsync a cada
+# `fsync_s` e troca de segmento por tamanho ou idade. O segmento fechado
+# é comprimido (.jsonl.gz) em segundo plano.
+#
+# Cada processo escreve nos seus próprios segmentos:
+#   eventos-<AAAAMMDDTHHMMSSffffff>-<pid>.jsonl[.gz]
+# e ler_eventos() junta todos de volta em ordem de recebimento — é o que
+# o reprocessar_arquivo.py usa para reconstruir a tabela paradas.
+#
+# Buffer cheio (disco travado) descarta o evento e conta em
+# `descartados`: o /log nunca espera pelo arquivo.
+
+log = logging.getLogger("maroni.arquivo")
+
+_RE_SEGMENTO = re.compile(r"^eventos-(\d{8}T\d{12})-(\d+)\.jsonl(\.gz)?$")
+
+
+def _agora_iso() -> str:
+    return datetime.utcnow().isoformat(timespec="microseconds") + "Z"
+
+
+class ArquivoEventos:
+    def __init__(
+        self,
+        diretorio: str,
+        max_bytes: int = 64 * 1024 * 1024,
+        max_idade_s: float = 3600.0,
+        fsync_s: float = 1.0,
+        capacidade: int = 50000,
+        comprimir: bool = True,
+    ):
+        self.diretorio = diretorio
+        self.max_bytes = max_bytes
+        self.max_idade_s = max_idade_s
+        self.fsync_s = fsync_s
+        self.capacidade = capacidade
+        self.comprimir = comprimir
+
+        self._fila = None
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+        self._parar = threading.Event()
+
+        self._arquivo = None
+        self._caminho = None
+        self._aberto_em = 0.0
+        self._bytes = 0
+        self._sujo = False
+
+        self.gravados_total = 0
+        self.descartados_total = 0
+        self.segmentos_total = 0
+
+    # -----------------------------------------------------------------
+    # PRODUTOR
+    # -----------------------------------------------------------------
+
+    def registrar(self, dados: list) -> bool:
+        """Enfileira os eventos (dicts) para o arquivo. Nunca bloqueia."""
+        self._garantir_thread()
+        recebido_em = _agora_iso()
+        try:
+            self._fila.put_nowait([{"recebido_em": recebido_em, **d} for d in dados])
+        except queue.Full:
+            self.descartados_total += len(dados)
+            return False
+        return True
+
+    def metricas(self) -> dict:
+        return {
+            "pendentes": self._fila.qsize() if self._fila is not None else 0,
+            "gravados_total": self.gravados_total,
+            "descartados_total": self.descartados_total,
+            "segmentos_total": self.segmentos_total,
+        }
+
+    def fechar(self, timeout: float = 5.0):
+        """Grava o que está no buffer, fecha o segmento e para a thread."""
+        if self._thread is None or self._pid != os.getpid():
+            return
+        self._parar.set()
+        self._thread.join(timeout)
+
+    # -----------------------------------------------------------------
+    # ESCRITOR
+    # -----------------------------------------------------------------
+
+    def _garantir_thread(self):
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            os.makedirs(self.diretorio, exist_ok=True)
+            self._fila = queue.Queue(maxsize=self.capacidade)
+            self._arquivo = None
+            self._parar = threading.Event()
+            self._thread = threading.Thread(
+                target=self._loop, name="arquivo-eventos", daemon=True
+            )
+            self._pid = os.getpid()
+            self._thread.start()
+
+    def _loop(self):
+        self._comprimir_orfaos()
+        ultimo_fsync = time.monotonic()
+        while True:
+            parar = self._parar.is_set()
+            try:
+                registros = self._fila.get(timeout=0 if parar else min(self.fsync_s, 0.5))
+            except queue.Empty:
+                registros = None
+
+            if registros:
+                try:
+                    self._escrever(registros)
+                except OSError as e:
+                    self.descartados_total += len(registros)
+                    log.error("Arquivo de eventos: falha ao gravar (%s)", e)
+
+            agora = time.monotonic()
+            if self._sujo and (agora - ultimo_fsync >= self.fsync_s or registros is None):
+                self._sincronizar()
+                ultimo_fsync = agora
+
+            if self._arquivo is not None and (
+                self._bytes >= self.max_bytes
+                or time.time() - self._aberto_em >= self.max_idade_s
+            ):
+                self._rotacionar()
+
+            if parar and registros is None:
+                if self._arquivo is not None:
+                    self._rotacionar(em_segundo_plano=False)
+                return
+
+    def _escrever(self, registros: list):
+        if self._arquivo is None:
+            self._abrir_segmento(registros[0]["recebido_em"])
+        texto = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in registros)
+        self._arquivo.write(texto)
+        self._bytes += len(texto.encode("utf-8"))
+        self._sujo = True
+        self.gravados_total += len(registros)
+
+    def _abrir_segmento(self, primeiro_recebido_em: str):
+        # O nome leva o recebido_em do 1º registro: ler_eventos() conta com
+        # nenhum registro do segmento ser anterior ao nome
+        inicio = datetime.fromisoformat(primeiro_recebido_em.rstrip("Z"))
+        carimbo = inicio.strftime("%Y%m%dT%H%M%S%f")
+        self._caminho = os.path.join(self.diretorio, f"eventos-{carimbo}-{os.getpid()}.jsonl")
+        self._arquivo = open(self._caminho, "a", encoding="utf-8")
+        self._aberto_em = time.time()
+        self._bytes = 0
+        self.segmentos_total += 1
+
+    def _sincronizar(self):
+        if self._arquivo is None:
+            return
+        self._arquivo.flush()
+        os.fsync(self._arquivo.fileno())
+        self._sujo = False
+
+    def _rotacionar(self, em_segundo_plano: bool = True):
+        self._sincronizar()
+        self._arquivo.close()
+        caminho = self._caminho
+        self._arquivo = None
+        self._caminho = None
+        if not self.comprimir:
+            return
+        if em_segundo_plano:
+            threading.Thread(target=comprimir_segmento, args=(caminho,), daemon=True).start()
+        else:
+            comprimir_segmento(caminho)
+
+    def _comprimir_orfaos(self):
+        """Segmentos .jsonl deixados por processos que já morreram."""
+        if not self.comprimir:
+            return
+        for nome in os.listdir(self.diretorio):
+            m = _RE_SEGMENTO.match(nome)
+            if not m or m.group(3) or _processo_vivo(int(m.group(2))):
+                continue
+            comprimir_segmento(os.path.join(self.diretorio, nome))
+
+
+def _processo_vivo(pid: int) -> bool:
+    if pid == os.getpid():
+        return True
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+
+def comprimir_segmento(caminho: str):
+    """caminho.jsonl → caminho.jsonl.gz (troca atômica; o original só sai no fim)."""
+    temporario = caminho + ".gz.tmp"
+    try:
+        with open(caminho, "rb") as origem, gzip.open(temporario, "wb") as destino:
+            shutil.copyfileobj(origem, destino)
+        os.replace(temporario, caminho + ".gz")
+        os.remove(caminho)
+    except OSError as e:
+        log.error("Não foi possível comprimir %s: %s", caminho, e)
+
+
+# =====================================================================
+# LEITURA (replay)
+# =====================================================================
+
+def listar_segmentos(diretorio: str) -> list:
+    """[(inicio_iso, caminho)] em ordem de abertura. .jsonl e .gz do mesmo
+    segmento (compressão interrompida) contam uma vez só: vale o .jsonl."""
+    segmentos = {}
+    for nome in os.listdir(diretorio):
+        m = _RE_SEGMENTO.match(nome)
+        if not m:
+            continue
+        chave = (m.group(1), m.group(2))
+        if chave in segmentos and m.group(3):
+            continue
+        inicio = datetime.strptime(m.group(1), "%Y%m%dT%H%M%S%f")
+        segmentos[chave] = (inicio.isoformat(timespec="microseconds") + "Z", os.path.join(diretorio, nome))
+    return sorted(segmentos.values())
+
+
+def _ler_segmento(caminho: str):
+    abrir = gzip.open if caminho.endswith(".gz") else open
+    with abrir(caminho, "rt", encoding="utf-8") as f:
+        for linha in f:
+            try:
+                registro = json.loads(linha)
+            except ValueError:
+                continue  # última linha cortada por queda
+            yield registro.get("recebido_em", ""), registro
+
+
+def _normalizar_instante(valor):
+    """datetime ou ISO ('2025-11-01T03:00:00Z') → mesmo formato de recebido_em."""
+    if valor is None or valor == "":
+        return None
+    if not isinstance(valor, datetime):
+        valor = datetime.fromisoformat(valor.rstrip("Z"))
+    return valor.isoformat(timespec="microseconds") + "Z"
+
+
+def ler_eventos(diretorio: str, desde=None, ate=None):
+    """
+    Gera os registros de todos os segmentos em ordem de recebido_em
+    (merge dos segmentos de todos os processos). desde/ate: UTC, datetime
+    ou ISO. Abre um segmento só quando o merge chega no horário em que ele
+    começou, então ficam abertos poucos arquivos ao mesmo tempo.
+    """
+    desde = _normalizar_instante(desde)
+    ate = _normalizar_instante(ate)
+    pendentes = deque(listar_segmentos(diretorio))
+    heap = []
+    desempate = 0
+
+    while heap or pendentes:
+        while pendentes and (not heap or pendentes[0][0] <= heap[0][0]):
+            inicio, caminho = pendentes.popleft()
+            if ate and inicio >= ate:
+                pendentes.clear()
+                break
+            leitor = _ler_segmento(caminho)
+            primeiro = next(leitor, None)
+            if primeiro is not None:
+                heapq.heappush(heap, (primeiro[0], desempate, primeiro[1], leitor))
+                desempate += 1
+        if not heap:
+            continue
+
+        recebido_em, _, registro, leitor = heapq.heappop(heap)
+        if ate and recebido_em >= ate:
+            continue  # esse leitor acabou (ordenado); os outros seguem
+        if not desde or recebido_em >= desde:
+            yield registro
+        proximo = next(leitor, None)
+        if proximo is not None:
+            heapq.heappush(heap, (proximo[0], desempate, proximo[1], leitor))
+            desempate += 1
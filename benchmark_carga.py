@@ -0,0 +1,372 @@
+import argparse
+import http.client
+import json
+import random
+import socket
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+from urllib.parse import urlparse
+
+from receptor_compacto import STATUS_TEXTO, codificar_binario, codificar_csv, ler_ack
+
+# =====================================================================
+# BENCHMARK: FROTA DE ARDUINOS SIMULADOS + TVs DO DASHBOARD
+# =====================================================================
+#
+# N máquinas mandam para o /log o mesmo JSON que o montaJSON() do sketch
+# (BOOT, RUN_CYCLE passando por verde → vermelho → desligado, MOTIVO
+# enquanto parada), cada requisição numa conexão nova com
+# "Connection: close", como o Ethernet shield faz. M "TVs" fazem polling
+# do /api/data com If-None-Match, como o dashboard.
+#
+# No fim: requisições/s, p50/p99 por endpoint, status HTTP e — com o
+# backend rodando com CONTAR_QUERIES=1 — queries por requisição
+# (cabeçalho X-DB-Queries). Com --pg-dsn, mostra também o que o
+# PostgreSQL registrou no período (commits, linhas escritas).
+#
+#   CONTAR_QUERIES=1 FILA_ESCRITA=0 py app.py
+#   py benchmark_carga.py --maquinas 50 --pollers 30 --duracao 60
+#
+# Com FILA_ESCRITA=1 o /log não toca o banco na requisição; a vazão real
+# de escrita aparece nas métricas da fila (/api/fila) no relatório.
+#
+# Com --udp as máquinas mandam frames compactos ao receptor_compacto.py
+# (binário ou CSV, --formato) e esperam o ack de cada um (reenviam até 3
+# vezes); a latência é a do envio até o ack, já gravado:
+#
+#   py receptor_compacto.py --udp 5005
+#   py benchmark_carga.py --udp localhost:5005 --maquinas 2000 --pollers 0
+
+MOTIVOS = ["SETUP", "MATERIAL", "MANUTENCAO"]
+
+
+class Estatisticas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencias = {}  # endpoint -> [s]
+        self.status = {}  # endpoint -> {código: qtd}
+        self.queries = {}  # endpoint -> [n]
+        self.erros = {}  # endpoint -> qtd
+
+    def registrar(self, endpoint, latencia, status, queries):
+        with self._lock:
+            self.latencias.setdefault(endpoint, []).append(latencia)
+            por_status = self.status.setdefault(endpoint, {})
+            por_status[status] = por_status.get(status, 0) + 1
+            if queries is not None:
+                self.queries.setdefault(endpoint, []).append(int(queries))
+
+    def erro(self, endpoint):
+        with self._lock:
+            self.erros[endpoint] = self.erros.get(endpoint, 0) + 1
+
+
+def percentil(valores_ordenados, p):
+    if not valores_ordenados:
+        return 0.0
+    i = min(len(valores_ordenados) - 1, int(round(p / 100.0 * (len(valores_ordenados) - 1))))
+    return valores_ordenados[i]
+
+
+def requisicao(alvo, metodo, caminho, corpo=None, cabecalhos=None, conn=None):
+    """Faz a requisição; com conn=None abre e fecha uma conexão (estilo Arduino)."""
+    propria = conn is None
+    if propria:
+        conn = http.client.HTTPConnection(alvo.hostname, alvo.port or 80, timeout=10)
+    try:
+        conn.request(metodo, caminho, body=corpo, headers=cabecalhos or {})
+        resp = conn.getresponse()
+        resp.read()
+        return resp.status, resp.getheader("X-DB-Queries"), resp.getheader("ETag")
+    finally:
+        if propria:
+            conn.close()
+
+
+# ---------------------------------------------------------------------
+# MÁQUINA SIMULADA
+# ---------------------------------------------------------------------
+
+class MaquinaSimulada:
+    """Replica o estado do sketch: estadoLedRun 0/1/2 + motivo exclusivo."""
+
+    def __init__(self, nome, relogio_inicio, aceleracao):
+        self.nome = nome
+        self.estado_led = 2
+        self.motivo = "NONE"
+        self.boot = time.monotonic()
+        self.relogio_inicio = relogio_inicio
+        self.aceleracao = aceleracao
+
+    def _agora_simulado(self):
+        decorrido = (time.monotonic() - self.boot) * self.aceleracao
+        return self.relogio_inicio + timedelta(seconds=decorrido)
+
+    def monta_json(self, tipo):
+        rodando = self.estado_led == 0
+        return {
+            "machine": self.nome,
+            "data_hora": self._agora_simulado().strftime("%Y-%m-%d %H:%M:%S"),
+            "ts_ms": int((time.monotonic() - self.boot) * 1000 * self.aceleracao),
+            "tipo": tipo,
+            "estado": "RUN" if rodando else "STOP",
+            "estadoLed": self.estado_led,
+            "parada": 0 if rodando else 1,
+            "motivo": self.motivo,
+        }
+
+    def proximo_evento(self):
+        """Sorteia o próximo botão, como um operador faria."""
+        if self.estado_led == 1 and random.random() < 0.5:
+            # Botão de motivo: liga um motivo ou desliga o atual
+            escolhido = random.choice(MOTIVOS)
+            self.motivo = "NONE" if self.motivo == escolhido else escolhido
+            return self.monta_json("MOTIVO")
+
+        # Botão RUN: verde → vermelho → desligado → verde ...
+        self.estado_led = (self.estado_led + 1) % 3
+        if self.estado_led != 1:
+            self.motivo = "NONE" if random.random() < 0.7 else self.motivo
+        return self.monta_json("RUN_CYCLE")
+
+
+def loop_maquina(alvo, maquina, stats, fim, intervalo_medio, lote):
+    corpo = json.dumps(maquina.monta_json("BOOT")).encode("utf-8")
+    cab = {"Content-Type": "application/json", "Connection": "close"}
+    pendentes = []
+
+    def enviar(caminho, corpo):
+        t0 = time.perf_counter()
+        try:
+            status, queries, _ = requisicao(alvo, "POST", caminho, corpo, cab)
+        except OSError:
+            stats.erro(caminho)
+            return
+        stats.registrar(caminho, time.perf_counter() - t0, status, queries)
+
+    enviar("/log", corpo)
+
+    while time.monotonic() < fim:
+        time.sleep(random.expovariate(1.0 / intervalo_medio))
+        evento = maquina.proximo_evento()
+        if lote > 1:
+            pendentes.append(evento)
+            if len(pendentes) >= lote:
+                enviar("/log/batch", json.dumps(pendentes).encode("utf-8"))
+                pendentes = []
+        else:
+            enviar("/log", json.dumps(evento).encode("utf-8"))
+
+    if pendentes:
+        enviar("/log/batch", json.dumps(pendentes).encode("utf-8"))
+
+
+def frame_compacto(evento: dict, maquina_id: int, formato: str) -> bytes:
+    """JSON do sketch → frame do receptor_compacto.py (timestamp em epoch UTC)."""
+    local = datetime.strptime(evento["data_hora"], "%Y-%m-%d %H:%M:%S")
+    timestamp = int((local + timedelta(hours=3)).replace(tzinfo=timezone.utc).timestamp())
+    campos = (
+        evento["ts_ms"] & 0xFFFFFFFF,
+        timestamp,
+        evento["estadoLed"],
+        evento["motivo"],
+        evento["tipo"],
+    )
+    if formato == "binario":
+        return codificar_binario(maquina_id, *campos)
+    return codificar_csv(evento["machine"], *campos)
+
+
+def loop_maquina_udp(destino, maquina, maquina_id, stats, fim, intervalo_medio, formato):
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    sock.settimeout(1.0)
+
+    def enviar(evento):
+        frame = frame_compacto(evento, maquina_id, formato)
+        seq = evento["ts_ms"] & 0xFFFFFFFF
+        t0 = time.perf_counter()
+        for _ in range(3):
+            sock.sendto(frame, destino)
+            try:
+                while True:
+                    recebido, status = ler_ack(sock.recv(64))
+                    if recebido == seq:
+                        break
+            except socket.timeout:
+                continue
+            stats.registrar("udp", time.perf_counter() - t0, STATUS_TEXTO[status], None)
+            return
+        stats.erro("udp")
+
+    enviar(maquina.monta_json("BOOT"))
+    while time.monotonic() < fim:
+        time.sleep(random.expovariate(1.0 / intervalo_medio))
+        enviar(maquina.proximo_evento())
+    sock.close()
+
+
+def loop_poller(alvo, stats, fim, intervalo):
+    # Navegador mantém a conexão aberta e reenvia o ETag
+    conn = http.client.HTTPConnection(alvo.hostname, alvo.port or 80, timeout=10)
+    etag = None
+    while time.monotonic() < fim:
+        cab = {"If-None-Match": etag} if etag else {}
+        t0 = time.perf_counter()
+        try:
+            status, queries, novo_etag = requisicao(alvo, "GET", "/api/data", None, cab, conn)
+        except (OSError, http.client.HTTPException):
+            stats.erro("/api/data")
+            conn.close()
+            conn = http.client.HTTPConnection(alvo.hostname, alvo.port or 80, timeout=10)
+            time.sleep(intervalo)
+            continue
+        stats.registrar("/api/data", time.perf_counter() - t0, status, queries)
+        etag = novo_etag or etag
+        time.sleep(intervalo)
+    conn.close()
+
+
+# ---------------------------------------------------------------------
+# POSTGRES (opcional)
+# ---------------------------------------------------------------------
+
+def foto_pg(dsn):
+    import psycopg2
+
+    conn = psycopg2.connect(dsn)
+    cur = conn.cursor()
+    cur.execute(
+        """
+        SELECT xact_commit, xact_rollback, tup_inserted, tup_updated, tup_deleted
+        FROM pg_stat_database
+        WHERE datname = current_database()
+        """
+    )
+    campos = ("commits", "rollbacks", "inseridas", "atualizadas", "apagadas")
+    foto = dict(zip(campos, cur.fetchone()))
+    try:
+        cur.execute("SELECT COALESCE(SUM(calls), 0) FROM pg_stat_statements")
+        foto["statements"] = int(cur.fetchone()[0])
+    except psycopg2.Error:
+        conn.rollback()
+    cur.close()
+    conn.close()
+    return foto
+
+
+# ---------------------------------------------------------------------
+# RELATÓRIO
+# ---------------------------------------------------------------------
+
+def relatorio(stats, duracao, pg_antes=None, pg_depois=None, fila=None) -> dict:
+    resultado = {"duracao_s": round(duracao, 2), "endpoints": {}}
+    for endpoint, lat in sorted(stats.latencias.items()):
+        lat = sorted(lat)
+        qs = stats.queries.get(endpoint, [])
+        resultado["endpoints"][endpoint] = {
+            "requisicoes": len(lat),
+            "req_s": round(len(lat) / duracao, 1),
+            "p50_ms": round(percentil(lat, 50) * 1000, 2),
+            "p99_ms": round(percentil(lat, 99) * 1000, 2),
+            "max_ms": round(lat[-1] * 1000, 2),
+            "status": stats.status.get(endpoint, {}),
+            "erros": stats.erros.get(endpoint, 0),
+            "queries_por_req": round(sum(qs) / len(qs), 2) if qs else None,
+        }
+    if pg_antes and pg_depois:
+        resultado["postgres"] = {k: pg_depois[k] - pg_antes.get(k, 0) for k in pg_depois}
+    if fila:
+        resultado["fila"] = fila
+    return resultado
+
+
+def imprimir(resultado):
+    print(f"\n=== BENCHMARK ({resultado['duracao_s']} s) ===")
+    print(f"{'endpoint':<14}{'reqs':>8}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'max ms':>9}{'q/req':>7}  status")
+    for endpoint, r in resultado["endpoints"].items():
+        qpr = "-" if r["queries_por_req"] is None else f"{r['queries_por_req']:.2f}"
+        print(
+            f"{endpoint:<14}{r['requisicoes']:>8}{r['req_s']:>9}{r['p50_ms']:>9}"
+            f"{r['p99_ms']:>9}{r['max_ms']:>9}{qpr:>7}  {r['status']}"
+            + (f" erros={r['erros']}" if r["erros"] else "")
+        )
+    if "postgres" in resultado:
+        print("PostgreSQL no período:", resultado["postgres"])
+    if "fila" in resultado:
+        print("Fila de escrita:", resultado["fila"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Carga simulada de Arduinos + dashboard")
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--maquinas", type=int, default=20)
+    parser.add_argument("--pollers", type=int, default=10)
+    parser.add_argument("--duracao", type=float, default=30.0, help="segundos")
+    parser.add_argument("--intervalo-evento", type=float, default=2.0,
+                        help="intervalo médio (s) entre botões de cada máquina")
+    parser.add_argument("--intervalo-poll", type=float, default=5.0,
+                        help="intervalo (s) entre polls de cada TV (App.jsx usa 5)")
+    parser.add_argument("--lote", type=int, default=1,
+                        help=">1: acumula N eventos por máquina e usa /log/batch")
+    parser.add_argument("--aceleracao", type=float, default=60.0,
+                        help="quanto o relógio simulado (data_hora) corre mais rápido")
+    parser.add_argument("--udp", help="HOST:PORTA do receptor_compacto.py (em vez do /log)")
+    parser.add_argument("--formato", choices=("binario", "csv"), default="binario",
+                        help="frame usado com --udp")
+    parser.add_argument("--pg-dsn", help="ex: 'dbname=arduino_logs user=postgres password=admin'")
+    parser.add_argument("--json", help="grava o resultado neste arquivo")
+    args = parser.parse_args()
+
+    alvo = urlparse(args.url)
+    stats = Estatisticas()
+    pg_antes = foto_pg(args.pg_dsn) if args.pg_dsn else None
+
+    inicio = time.monotonic()
+    fim = inicio + args.duracao
+    relogio = datetime.now()
+    threads = []
+
+    for i in range(args.maquinas):
+        maquina = MaquinaSimulada(f"Bench {i + 1:03d}", relogio, args.aceleracao)
+        if args.udp:
+            host, porta = args.udp.rsplit(":", 1)
+            threads.append(threading.Thread(
+                target=loop_maquina_udp,
+                args=((host, int(porta)), maquina, i + 1, stats, fim, args.intervalo_evento, args.formato),
+                daemon=True,
+            ))
+            continue
+        threads.append(threading.Thread(
+            target=loop_maquina,
+            args=(alvo, maquina, stats, fim, args.intervalo_evento, args.lote),
+            daemon=True,
+        ))
+    for _ in range(args.pollers):
+        threads.append(threading.Thread(
+            target=loop_poller, args=(alvo, stats, fim, args.intervalo_poll), daemon=True
+        ))
+
+    print(f"Rodando {args.maquinas} máquinas e {args.pollers} pollers por {args.duracao:.0f}s em {args.url} ...")
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    duracao = time.monotonic() - inicio
+
+    fila = None
+    try:
+        conn = http.client.HTTPConnection(alvo.hostname, alvo.port or 80, timeout=10)
+        conn.request("GET", "/api/fila")
+        fila = json.loads(conn.getresponse().read())
+        conn.close()
+    except (OSError, ValueError):
+        pass
+
+    pg_depois = foto_pg(args.pg_dsn) if args.pg_dsn else None
+    resultado = relatorio(stats, duracao, pg_antes, pg_depois, fila)
+    imprimir(resultado)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(resultado, f, indent=2, ensure_ascii=False)
@@ -0,0 +1,301 @@
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+
+from psycopg2.extras import execute_values
+
+from analise_paradas import ler_turnos
+
+# =====================================================================
+# CADASTRO DE MÁQUINAS (tabela machines + registro em memória)
+# =====================================================================
+#
+# Cada processo guarda em memória as máquinas cadastradas (linha, setor,
+# turnos esperados) e mantém a contagem de ativas/inativas no total e por
+# linha — o dashboard só lê os contadores. As mudanças de estadoLed vêm do
+# diário do EstadoMaquinas (estado_compartilhado.py), então todos os
+# workers contam igual, qualquer que seja o que recebeu o log.
+#
+# Mudança no cadastro (POST /api/machines ou máquina nova vista no /log)
+# incrementa CHAVE_VERSAO no estado compartilhado depois do commit; os
+# outros workers percebem na próxima leitura e recarregam só as linhas com
+# atualizado_em recente. A cada `recarregar_apos_s` recarrega tudo.
+#
+# last_seen fica em memória e é gravado em lote por gravar_vistos() (sem
+# mexer em atualizado_em, para não disparar recargas).
+
+log = logging.getLogger("maroni.maquinas")
+
+CHAVE_VERSAO = "meta:versao_maquinas"
+
+# Releitura incremental volta um pouco no tempo: pega linhas de transações
+# que começaram antes mas fizeram commit depois da última carga
+MARGEM_RELEITURA = timedelta(seconds=60)
+
+SQL_COLUNAS = "machine, linha, setor, turnos, ativa, atualizado_em"
+
+SQL_CADASTRAR_NOVAS = """
+    INSERT INTO machines (machine)
+    VALUES %s
+    ON CONFLICT (machine) DO NOTHING
+    RETURNING machine, linha, setor, turnos, ativa, atualizado_em
+"""
+
+SQL_GRAVAR_VISTOS = """
+    UPDATE machines m
+    SET last_seen = GREATEST(m.last_seen, v.visto)
+    FROM (VALUES %s) AS v (machine, visto)
+    WHERE m.machine = v.machine
+"""
+
+SQL_SALVAR = """
+    INSERT INTO machines (machine, linha, setor, turnos, ativa)
+    VALUES (%s, %s, %s, %s, %s)
+    ON CONFLICT (machine) DO UPDATE
+    SET linha = EXCLUDED.linha,
+        setor = EXCLUDED.setor,
+        turnos = EXCLUDED.turnos,
+        ativa = EXCLUDED.ativa,
+        atualizado_em = clock_timestamp()
+    RETURNING machine, linha, setor, turnos, ativa, atualizado_em
+"""
+
+SEM_LINHA = "Sem linha"
+
+
+class RegistroMaquinas:
+    def __init__(self, backend, turnos_padrao: list, recarregar_apos_s: float = 300.0):
+        self.backend = backend
+        self.turnos_padrao = turnos_padrao
+        self.recarregar_apos_s = recarregar_apos_s
+
+        self._lock = threading.Lock()
+        self._maquinas = {}  # machine -> {linha, setor, turnos, ativa}
+        self._versao = None
+        self._carregado_ate = None
+        self._carregado_em = 0.0
+
+        self._estados = {}  # machine -> último estadoLed (espelho do EstadoMaquinas)
+        self._seq_estados = None
+        self._contagem = Counter()  # (linha, estadoLed) -> máquinas ativas no cadastro
+        self._vistos = {}  # machine -> last_seen ainda não gravado
+
+    # -----------------------------------------------------------------
+    # CARGA / SINCRONIZAÇÃO COM O BANCO
+    # -----------------------------------------------------------------
+
+    def sincronizar(self, cur) -> bool:
+        """Recarrega se o cadastro mudou em algum worker. True se recarregou."""
+        pendente = self.consulta_pendente()
+        if pendente is None:
+            return False
+        sql, params, completa, versao = pendente
+        cur.execute(sql, params)
+        self.aplicar_carga(cur.fetchall(), completa, versao)
+        return True
+
+    def consulta_pendente(self):
+        """
+        None se o cadastro não mudou; senão (sql, params, completa, versao)
+        da recarga. Quem executar a consulta passa o resultado para
+        aplicar_carga() (sincronizar() faz as duas coisas com psycopg2).
+        """
+        versao = self.backend.obter(CHAVE_VERSAO) or 0
+        completa = time.monotonic() - self._carregado_em >= self.recarregar_apos_s
+        if versao == self._versao and not completa:
+            return None
+        if completa or self._carregado_ate is None:
+            return f"SELECT {SQL_COLUNAS} FROM machines", (), True, versao
+        return (
+            f"SELECT {SQL_COLUNAS} FROM machines WHERE atualizado_em >= %s",
+            (self._carregado_ate - MARGEM_RELEITURA,),
+            False,
+            versao,
+        )
+
+    def aplicar_carga(self, linhas, completa: bool, versao: int):
+        with self._lock:
+            if completa:
+                for machine in set(self._maquinas) - {l[0] for l in linhas}:
+                    self._aplicar(machine, None)
+                self._carregado_em = time.monotonic()
+            for linha in linhas:
+                self._aplicar_linha(linha)
+            self._versao = versao
+
+    def desconhecidas(self, nomes) -> list:
+        return [m for m in nomes if m not in self._maquinas]
+
+    def cadastrar_novas(self, cur, nomes) -> list:
+        """
+        Cadastra (sem linha/setor) máquinas vistas no /log e ainda
+        desconhecidas. Não faz commit: chame publicar_mudanca() depois.
+        """
+        novas = [(m,) for m in self.desconhecidas(nomes)]
+        if not novas:
+            return []
+        inseridas = execute_values(cur, SQL_CADASTRAR_NOVAS, novas, page_size=len(novas), fetch=True)
+        return self.aplicar_cadastradas(inseridas)
+
+    def aplicar_cadastradas(self, linhas) -> list:
+        """Linhas devolvidas pelo RETURNING de SQL_CADASTRAR_NOVAS / SQL_SALVAR."""
+        with self._lock:
+            for linha in linhas:
+                self._aplicar_linha(linha)
+        return [linha[0] for linha in linhas]
+
+    def salvar(self, cur, machine: str, linha=None, setor=None, turnos=None, ativa=True) -> dict:
+        """Cria/atualiza uma máquina. turnos no formato de TURNOS (ValueError se inválido)."""
+        if turnos:
+            ler_turnos(turnos)
+        cur.execute(SQL_SALVAR, (machine, linha, setor, turnos or None, ativa))
+        gravada = cur.fetchone()
+        with self._lock:
+            self._aplicar_linha(gravada)
+        return self.obter(machine)
+
+    def publicar_mudanca(self):
+        """Depois do commit: avisa os outros workers que o cadastro mudou."""
+        self.backend.incrementar(CHAVE_VERSAO)
+
+    def _aplicar_linha(self, linha):
+        machine, nome_linha, setor, turnos, ativa, atualizado_em = linha
+        if self._carregado_ate is None or atualizado_em > self._carregado_ate:
+            self._carregado_ate = atualizado_em
+        self._aplicar(
+            machine,
+            {"linha": nome_linha or SEM_LINHA, "setor": setor, "turnos": turnos, "ativa": ativa},
+        )
+
+    def _aplicar(self, machine: str, dados):
+        """Troca o cadastro de uma máquina mantendo os contadores (chamar com _lock)."""
+        anterior = self._maquinas.get(machine)
+        estado = self._estados.get(machine)
+        if anterior and anterior["ativa"]:
+            self._contagem[(anterior["linha"], estado)] -= 1
+        if dados is None:
+            self._maquinas.pop(machine, None)
+            return
+        if dados["turnos"]:
+            try:
+                dados["turnos_lidos"] = ler_turnos(dados["turnos"])
+            except ValueError:
+                log.warning("Turnos inválidos para %s: %r", machine, dados["turnos"])
+        self._maquinas[machine] = dados
+        if dados["ativa"]:
+            self._contagem[(dados["linha"], estado)] += 1
+
+    # -----------------------------------------------------------------
+    # ESTADO E LAST_SEEN
+    # -----------------------------------------------------------------
+
+    def sincronizar_estados(self, estados):
+        """Aplica as mudanças de estadoLed feitas (por qualquer worker) desde a última vez."""
+        seq, mudancas = estados.mudancas_desde(self._seq_estados)
+        if mudancas is None:
+            self.limpar_estados()
+            mudancas = estados.todos().items()
+        for machine, estado in mudancas:
+            self.definir_estado(machine, estado)
+        self._seq_estados = seq
+
+    def definir_estado(self, machine: str, estado):
+        with self._lock:
+            anterior = self._estados.get(machine)
+            if anterior == estado:
+                return
+            self._estados[machine] = estado
+            dados = self._maquinas.get(machine)
+            if dados and dados["ativa"]:
+                self._contagem[(dados["linha"], anterior)] -= 1
+                self._contagem[(dados["linha"], estado)] += 1
+
+    def limpar_estados(self):
+        with self._lock:
+            for machine in list(self._estados):
+                dados = self._maquinas.get(machine)
+                if dados and dados["ativa"]:
+                    self._contagem[(dados["linha"], self._estados[machine])] -= 1
+                    self._contagem[(dados["linha"], None)] += 1
+            self._estados.clear()
+
+    def marcar_visto(self, machines, quando: datetime):
+        with self._lock:
+            for machine in machines:
+                self._vistos[machine] = quando
+
+    def retirar_vistos(self) -> dict:
+        """last_seen pendentes (machine -> quando); quem chamou deve gravá-los."""
+        with self._lock:
+            vistos, self._vistos = self._vistos, {}
+        return vistos
+
+    def gravar_vistos(self, cur) -> int:
+        """Grava os last_seen pendentes (um UPDATE). Não faz commit."""
+        vistos = self.retirar_vistos()
+        if vistos:
+            execute_values(
+                cur,
+                SQL_GRAVAR_VISTOS,
+                list(vistos.items()),
+                template="(%s, %s::timestamp)",
+                page_size=len(vistos),
+            )
+        return len(vistos)
+
+    # -----------------------------------------------------------------
+    # LEITURA
+    # -----------------------------------------------------------------
+
+    def __contains__(self, machine: str) -> bool:
+        return machine in self._maquinas
+
+    def obter(self, machine: str):
+        dados = self._maquinas.get(machine)
+        if dados is None:
+            return None
+        return {
+            "machine": machine,
+            "linha": dados["linha"],
+            "setor": dados["setor"],
+            "turnos": dados["turnos"],
+            "ativa": dados["ativa"],
+        }
+
+    def nomes(self) -> list:
+        return sorted(m for m, d in self._maquinas.items() if d["ativa"])
+
+    def linha_de(self, machine: str) -> str:
+        dados = self._maquinas.get(machine)
+        return dados["linha"] if dados else SEM_LINHA
+
+    def contagem(self) -> dict:
+        """{"ativas": n, "inativas": n, "linhas": {linha: {...}}} — sem percorrer máquinas."""
+        linhas = {}
+        with self._lock:
+            itens = [(chave, n) for chave, n in self._contagem.items() if n]
+        for (linha, estado), n in itens:
+            por_linha = linhas.setdefault(linha, {"maquinas": 0, "ativas": 0, "inativas": 0})
+            por_linha["maquinas"] += n
+            if estado == 0:
+                por_linha["ativas"] += n
+            elif estado == 1:
+                por_linha["inativas"] += n
+        return {
+            "ativas": sum(l["ativas"] for l in linhas.values()),
+            "inativas": sum(l["inativas"] for l in linhas.values()),
+            "linhas": linhas,
+        }
+
+    def em_turno(self, machine: str, agora: datetime) -> bool:
+        """A máquina deveria estar trabalhando agora (turnos dela ou os padrão)?"""
+        dados = self._maquinas.get(machine) or {}
+        turnos = dados.get("turnos_lidos") or self.turnos_padrao
+        meia_noite = datetime.combine(agora.date(), datetime.min.time())
+        for _, inicio, duracao in turnos:
+            for dia in (meia_noite - timedelta(days=1), meia_noite):
+                if dia + inicio <= agora < dia + inicio + duracao:
+                    return True
+        return False
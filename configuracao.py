@@ -0,0 +1,77 @@
+import os
+
+from analise_paradas import TURNOS_PADRAO, ler_turnos
+
+# =====================================================================
+# CONFIGURAÇÃO COMUM AO app.py E AO app_async.py
+# =====================================================================
+#
+# Os dois servidores podem rodar lado a lado no mesmo banco e no mesmo
+# ESTADO_BACKEND, então leem as mesmas variáveis de ambiente daqui. O que
+# cada uma faz está comentado na seção correspondente do app.py e na
+# tabela do README.
+
+# ---------------------------------------------------------------------
+# POSTGRES
+# ---------------------------------------------------------------------
+
+PG_HOST = "localhost"
+PG_PORT = "5432"
+PG_USER = "postgres"
+PG_PASSWORD = "admin"
+PG_DB = "arduino_logs"
+
+PARAMETROS_PG = {
+    "host": PG_HOST,
+    "port": PG_PORT,
+    "user": PG_USER,
+    "password": PG_PASSWORD,
+    "database": PG_DB,
+}
+
+PG_POOL_MIN = int(os.environ.get("PG_POOL_MIN", 1))
+PG_POOL_MAX = int(os.environ.get("PG_POOL_MAX", 10))
+PG_POOL_MAX_VIDA_S = float(os.environ.get("PG_POOL_MAX_VIDA_S", 1800))
+PG_POOL_OCIOSO_CHECK_S = float(os.environ.get("PG_POOL_OCIOSO_CHECK_S", 30))
+PG_POOL_TIMEOUT_S = float(os.environ.get("PG_POOL_TIMEOUT_S", 5))
+
+# ---------------------------------------------------------------------
+# ARQUIVO DE EVENTOS BRUTOS
+# ---------------------------------------------------------------------
+
+ARQUIVO_EVENTOS = os.environ.get("ARQUIVO_EVENTOS", "1") == "1"
+ARQUIVO_EVENTOS_DIR = os.environ.get("ARQUIVO_EVENTOS_DIR", "arquivo_eventos")
+ARQUIVO_MAX_MB = float(os.environ.get("ARQUIVO_MAX_MB", 64))
+ARQUIVO_MAX_IDADE_S = float(os.environ.get("ARQUIVO_MAX_IDADE_S", 3600))
+ARQUIVO_FSYNC_S = float(os.environ.get("ARQUIVO_FSYNC_S", 1))
+
+# ---------------------------------------------------------------------
+# ESTADO COMPARTILHADO E CADASTRO DE MÁQUINAS
+# ---------------------------------------------------------------------
+
+ESTADO_BACKEND = os.environ.get("ESTADO_BACKEND", "sqlite")  # sqlite | memoria | postgres
+CACHE_REAQUECER_S = float(os.environ.get("CACHE_REAQUECER_S", 300))
+TURNOS = ler_turnos(os.environ.get("TURNOS", TURNOS_PADRAO))
+MAQUINAS_VISTO_S = float(os.environ.get("MAQUINAS_VISTO_S", 30))
+
+# ---------------------------------------------------------------------
+# GRAVAÇÃO DOS EVENTOS
+# ---------------------------------------------------------------------
+
+EVENTOS_BRUTOS = os.environ.get("EVENTOS_BRUTOS", "1") == "1"
+EVENTOS_PUSH = os.environ.get("EVENTOS_PUSH", "1") == "1"
+DEDUP_EVENTOS = os.environ.get("DEDUP_EVENTOS", "1") == "1"
+DEDUP_MEMORIA = int(os.environ.get("DEDUP_MEMORIA", 100000))
+DEDUP_RETER_DIAS = int(os.environ.get("DEDUP_RETER_DIAS", 7))
+PARADA_OSCILACAO_S = float(os.environ.get("PARADA_OSCILACAO_S", 0))
+PARADAS_PENDENTES_S = float(os.environ.get("PARADAS_PENDENTES_S", 1))
+SEM_COMUNICACAO_S = float(os.environ.get("SEM_COMUNICACAO_S", 120))
+LOTE_MAX_EVENTOS = int(os.environ.get("LOTE_MAX_EVENTOS", 5000))
+
+# ---------------------------------------------------------------------
+# CONSULTAS
+# ---------------------------------------------------------------------
+
+HISTORICO_LIMITE_PADRAO = 50
+HISTORICO_LIMITE_MAX = int(os.environ.get("HISTORICO_LIMITE_MAX", 500))
+DASHBOARD_JANELA_DIAS = int(os.environ.get("DASHBOARD_JANELA_DIAS", 30))
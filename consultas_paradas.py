@@ -0,0 +1,506 @@
+import base64
+import json
+from datetime import datetime
+
+# =====================================================================
+# SQL E MONTAGEM DE RESPOSTAS DAS PARADAS (app.py e app_async.py)
+# =====================================================================
+#
+# Tudo que os dois modos de servir (Flask + psycopg2 e ASGI + asyncpg)
+# precisam fazer igual: as instruções em lote do /log, o histórico
+# paginado, o payload do dashboard. Os SQL estão no estilo do psycopg2
+# (%s, e "VALUES %s" para execute_values); o app_async.py converte.
+
+# ---------------------------------------------------------------------
+# CHAVES NO ESTADO COMPARTILHADO (as mesmas nos dois modos)
+# ---------------------------------------------------------------------
+
+# Versão dos dados do dashboard: ver "VERSÃO DOS DADOS" no app.py
+CHAVE_VERSAO_DADOS = "meta:versao_dados"
+
+# JSON pronto do /api/data: {"etag", "corpo"}
+CHAVE_CACHE_DASHBOARD = "cache:dashboard"
+
+# Threshold de descarte gravado pelo último /api/reprocess_paradas
+CHAVE_THRESHOLD = "meta:threshold_descarte_min"
+
+
+def etag_dashboard(versao: int, agora: datetime) -> str:
+    """Muda com a versão dos dados e com o dia (a janela do dashboard anda)."""
+    return f"{versao}-{agora.strftime('%Y%m%d')}"
+
+
+def etag_confere(cabecalho: str, etag: str) -> bool:
+    """If-None-Match contém o ETag (forte ou fraco) ou "*"."""
+    for item in cabecalho.split(","):
+        item = item.strip()
+        if item == "*" or item.removeprefix("W/") == f'"{etag}"':
+            return True
+    return False
+
+
+class CacheDashboard:
+    """
+    JSON pronto do /api/data em dois níveis: o último corpo deste processo
+    e o do estado compartilhado (CHAVE_CACHE_DASHBOARD), os dois pelo
+    ETag. obter() None = gerar o payload e passar para guardar().
+    """
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._etag = None
+        self._corpo = None
+
+    def obter(self, etag: str):
+        if self._etag != etag:
+            em_cache = self.backend.obter(CHAVE_CACHE_DASHBOARD)
+            if not (em_cache and em_cache.get("etag") == etag):
+                return None
+            self._etag, self._corpo = etag, em_cache["corpo"]
+        return self._corpo
+
+    def guardar(self, etag: str, payload: dict) -> str:
+        corpo = json.dumps(payload, ensure_ascii=False)
+        self.backend.gravar(CHAVE_CACHE_DASHBOARD, {"etag": etag, "corpo": corpo})
+        self._etag, self._corpo = etag, corpo
+        return corpo
+
+
+# ---------------------------------------------------------------------
+# ENTRADA DO /log/batch
+# ---------------------------------------------------------------------
+
+def ler_corpo_lote(corpo: str, mimetype: str) -> list:
+    """
+    Aceita um array JSON de eventos ou NDJSON (um evento por linha).
+    Retorna a lista de dicts ou levanta ValueError.
+    """
+    corpo = corpo.strip()
+    if not corpo:
+        return []
+
+    if mimetype not in ("application/x-ndjson", "application/jsonl"):
+        try:
+            dados = json.loads(corpo)
+        except ValueError:
+            dados = None
+        if isinstance(dados, list):
+            return dados
+        if isinstance(dados, dict):
+            return [dados]
+
+    # NDJSON
+    return [json.loads(linha) for linha in corpo.splitlines() if linha.strip()]
+
+
+# ---------------------------------------------------------------------
+# ESCRITA DO /log
+# ---------------------------------------------------------------------
+
+SQL_INSERIR_EVENTOS_BRUTOS = """
+    INSERT INTO eventos_brutos (machine, data_hora, ts_ms, tipo, estado_led, motivo)
+    VALUES %s
+"""
+
+# Fecha (ou descarta, se for curta demais) as paradas AUTO abertas de
+# várias máquinas numa única instrução: as linhas são travadas, a duração
+# é calculada no próprio banco e DELETE/UPDATE são mutuamente exclusivos
+# pela condição do threshold. O motivo final vem junto (pode ter mudado
+# no mesmo lote). Usado com execute_values: (machine, fim, reason, threshold).
+SQL_FECHAR_AUTO_LOTE = """
+    WITH dados (machine, fim, reason, threshold) AS (VALUES %s),
+    aberta AS (
+        SELECT p.id, p.machine, d.reason, p.start_time, d.fim,
+               EXTRACT(EPOCH FROM (d.fim - p.start_time)) / 60.0 AS duracao,
+               d.threshold
+        FROM paradas p
+        JOIN dados d ON d.machine = p.machine
+        WHERE p.origem = 'AUTO'
+          AND p.end_time IS NULL
+        FOR UPDATE OF p
+    ),
+    descartada AS (
+        DELETE FROM paradas p
+        USING aberta a
+        WHERE p.id = a.id
+          AND a.duracao < a.threshold
+        RETURNING p.id
+    ),
+    fechada AS (
+        UPDATE paradas p
+        SET end_time = a.fim,
+            duration_minutes = a.duracao,
+            reason = a.reason
+        FROM aberta a
+        WHERE p.id = a.id
+          AND a.duracao >= a.threshold
+        RETURNING p.id
+    )
+    SELECT id, machine, reason, start_time, duracao, duracao < threshold AS descartada
+    FROM aberta
+"""
+
+# Paradas que abriram e fecharam dentro do mesmo lote: já entram fechadas.
+SQL_INSERIR_AUTO_FECHADAS = """
+    INSERT INTO paradas (machine, reason, origem, start_time, end_time, duration_minutes)
+    VALUES %s
+"""
+
+# Abre a parada AUTO ou, se já existir uma aberta, troca o motivo — tudo
+# num único INSERT ... ON CONFLICT. O índice único parcial
+# ux_paradas_auto_aberta (migracoes.py) garante no máximo uma parada AUTO
+# aberta por máquina, então dois logs concorrentes da mesma máquina não
+# conseguem abrir duas paradas.
+SQL_ABRIR_OU_ATUALIZAR_AUTO_LOTE = """
+    INSERT INTO paradas (machine, reason, origem, start_time, end_time, duration_minutes)
+    VALUES %s
+    ON CONFLICT (machine) WHERE origem = 'AUTO' AND end_time IS NULL
+    DO UPDATE SET reason = EXCLUDED.reason
+    RETURNING machine, id, reason, start_time, (xmax = 0) AS aberta_agora
+"""
+
+# Mesma coisa para paradas PARTICIONADA (migracoes.py --particionar), onde
+# não existe índice único global: as máquinas do lote são travadas antes
+# com pg_advisory_xact_lock (SQL_TRAVAR_MAQUINAS) e a abertura vira
+# UPDATE da aberta + INSERT onde não há aberta.
+SQL_TRAVAR_MAQUINAS = """
+    SELECT pg_advisory_xact_lock(hashtext(m))
+    FROM unnest(%s::text[]) AS m
+    ORDER BY m
+"""
+
+SQL_ABRIR_OU_ATUALIZAR_AUTO_LOTE_PARTICIONADA = """
+    WITH dados (machine, reason, start_time) AS (VALUES %s),
+    atualizada AS (
+        UPDATE paradas p
+        SET reason = d.reason
+        FROM dados d
+        WHERE p.machine = d.machine
+          AND p.origem = 'AUTO'
+          AND p.end_time IS NULL
+        RETURNING p.machine, p.id, p.reason, p.start_time, false AS aberta_agora
+    ),
+    inserida AS (
+        INSERT INTO paradas (machine, reason, origem, start_time, end_time, duration_minutes)
+        SELECT d.machine, d.reason, 'AUTO', d.start_time, NULL, NULL
+        FROM dados d
+        WHERE NOT EXISTS (
+            SELECT 1 FROM paradas p
+            WHERE p.machine = d.machine
+              AND p.origem = 'AUTO'
+              AND p.end_time IS NULL
+        )
+        RETURNING machine, id, reason, start_time, true AS aberta_agora
+    )
+    SELECT * FROM atualizada
+    UNION ALL
+    SELECT * FROM inserida
+"""
+
+
+# paradas_agregado: soma por (granularidade, bucket, machine, reason)
+SQL_SOMAR_AGREGADOS = """
+    INSERT INTO paradas_agregado (granularidade, bucket, machine, reason, qtd, minutos)
+    VALUES %s
+    ON CONFLICT (granularidade, bucket, machine, reason)
+    DO UPDATE SET qtd = paradas_agregado.qtd + EXCLUDED.qtd,
+                  minutos = paradas_agregado.minutos + EXCLUDED.minutos
+"""
+
+
+def linhas_agregados(paradas) -> list:
+    """
+    paradas: iterável de (machine, reason, start_time, duration_minutes)
+    já fechadas → linhas (granularidade, bucket, machine, reason, qtd,
+    minutos) para SQL_SOMAR_AGREGADOS.
+    """
+    somas = {}
+    for machine, reason, start_time, duracao in paradas:
+        hora = start_time.replace(minute=0, second=0, microsecond=0)
+        dia = hora.replace(hour=0)
+        for chave in (("hora", hora, machine, reason), ("dia", dia, machine, reason)):
+            qtd, minutos = somas.get(chave, (0, 0.0))
+            somas[chave] = (qtd + 1, minutos + float(duracao or 0))
+    return [(*chave, qtd, round(minutos, 2)) for chave, (qtd, minutos) in somas.items()]
+
+
+# Cópia durável do estadoLed (ver EstadoMaquinas): (machine, estado_led, desde)
+SQL_GRAVAR_ESTADOS = """
+    INSERT INTO machine_states (machine, estado_led, desde)
+    VALUES %s
+    ON CONFLICT (machine) DO UPDATE
+    SET estado_led = EXCLUDED.estado_led,
+        desde = EXCLUDED.desde,
+        atualizado_em = NOW()
+"""
+
+# Aquecimento do CacheParadasAbertas e do EstadoMaquinas
+SQL_PARADAS_AUTO_ABERTAS = """
+    SELECT machine, id, reason, start_time
+    FROM paradas
+    WHERE origem = 'AUTO'
+      AND end_time IS NULL
+"""
+
+SQL_ESTADOS_MAQUINAS = "SELECT machine, estado_led, desde FROM machine_states"
+
+SQL_INSERIR_MANUAL = """
+    INSERT INTO paradas
+    (machine, reason, origem, start_time, end_time, duration_minutes)
+    VALUES (%s, %s, %s, %s, %s, %s)
+    RETURNING id;
+"""
+
+
+# ---------------------------------------------------------------------
+# HISTÓRICO (/ultimos e /api/historico)
+# ---------------------------------------------------------------------
+
+def parada_para_dict(pid, machine, reason, origem, start_time, end_time, duration) -> dict:
+    return {
+        "id": pid,
+        "machine": machine,
+        "reason": reason,
+        "origem": origem,  # AUTO / MANUAL
+        "start_time": start_time.isoformat(),
+        "end_time": end_time.isoformat() if end_time else None,
+        "duration_minutes": float(duration) if duration is not None else None,
+        "status": "Aberta" if end_time is None else "Fechada",
+    }
+
+
+def codificar_cursor(start_time: datetime, pid: int) -> str:
+    bruto = json.dumps([start_time.isoformat(), pid]).encode("utf-8")
+    return base64.urlsafe_b64encode(bruto).decode("ascii").rstrip("=")
+
+
+def decodificar_cursor(cursor: str):
+    """Retorna (start_time, id) ou levanta ValueError."""
+    try:
+        bruto = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        inicio, pid = json.loads(bruto)
+        return datetime.fromisoformat(inicio), int(pid)
+    except Exception:
+        raise ValueError("cursor inválido")
+
+
+def ler_filtros_historico(args) -> dict:
+    """machine, reason, origem, desde, ate (ISO) da query string."""
+    filtros = {}
+    for campo in ("machine", "reason", "origem"):
+        valor = args.get(campo)
+        if valor:
+            filtros[campo] = valor
+    for campo in ("desde", "ate"):
+        valor = args.get(campo)
+        if valor:
+            try:
+                filtros[campo] = datetime.fromisoformat(valor)
+            except ValueError:
+                raise ValueError(f"{campo} inválido (use ISO 8601, ex: 2025-11-27T14:00:00)")
+    return filtros
+
+
+def montar_consulta_historico(filtros: dict, limit: int, cursor=None):
+    """
+    (sql, params) da página em ordem (start_time, id) decrescente, com
+    limit + 1 linhas (a sobra indica que há próxima página).
+    """
+    condicoes = []
+    params = []
+    for campo in ("machine", "reason", "origem"):
+        if campo in filtros:
+            condicoes.append(f"{campo} = %s")
+            params.append(filtros[campo])
+    if "desde" in filtros:
+        condicoes.append("start_time >= %s")
+        params.append(filtros["desde"])
+    if "ate" in filtros:
+        condicoes.append("start_time < %s")
+        params.append(filtros["ate"])
+    if cursor:
+        condicoes.append("(start_time, id) < (%s, %s)")
+        params.extend(cursor)
+
+    where = ("WHERE " + " AND ".join(condicoes)) if condicoes else ""
+    sql = f"""
+        SELECT id, machine, reason, origem, start_time, end_time, duration_minutes
+        FROM paradas
+        {where}
+        ORDER BY start_time DESC, id DESC
+        LIMIT %s
+    """
+    return sql, (*params, limit + 1)
+
+
+def pagina_historico(linhas, limit: int):
+    """Linhas de montar_consulta_historico() → (itens, proximo_cursor ou None)."""
+    proximo = None
+    if len(linhas) > limit:
+        linhas = linhas[:limit]
+        proximo = codificar_cursor(linhas[-1][4], linhas[-1][0])
+    return [parada_para_dict(*linha) for linha in linhas], proximo
+
+
+# ---------------------------------------------------------------------
+# DASHBOARD (/api/data)
+# ---------------------------------------------------------------------
+
+# Cards / pizza / barras: somas pré-calculadas por dia em paradas_agregado
+SQL_AGREGADOS_JANELA = """
+    SELECT machine, reason, SUM(qtd), SUM(minutos)
+    FROM paradas_agregado
+    WHERE granularidade = 'dia'
+      AND bucket >= %s
+    GROUP BY machine, reason
+"""
+
+# Últimas PARADAS FECHADAS para a tabela de histórico
+SQL_ULTIMAS_FECHADAS = """
+    SELECT machine, reason, start_time, end_time, duration_minutes, origem
+    FROM paradas
+    WHERE end_time IS NOT NULL        -- só paradas fechadas
+    ORDER BY start_time DESC
+    LIMIT 200
+"""
+
+
+def montar_payload_dashboard(status: dict, agregados, rows, linha_de, nomes) -> dict:
+    """
+    status: RegistroMaquinas.contagem(); agregados/rows: resultado de
+    SQL_AGREGADOS_JANELA / SQL_ULTIMAS_FECHADAS; linha_de(machine) e
+    nomes() vêm do registro de máquinas.
+    """
+    # ---------------------------------------------------------
+    # 1) Máquinas ativas / inativas AGORA, usando estadoLed:
+    #    - 0 (verde)   => ativa
+    #    - 1 (vermelho)=> inativa
+    #    - 2 / None    => ignorada (desligada)
+    #    Contadores mantidos pelo registro a cada mudança de estado.
+    # ---------------------------------------------------------
+    active_machines = status["ativas"]
+    inactive_machines = status["inativas"]
+
+    history = []
+    for machine, reason, start_time, end_time, duration, origem in rows:
+        history.append(
+            {
+                "machine": machine,
+                "reason": reason,
+                "start_time": start_time.isoformat(),
+                "end_time": end_time.isoformat(),
+                "duration_minutes": float(duration) if duration is not None else 0.0,
+                "origem": origem,  # AUTO / MANUAL
+            }
+        )
+
+    total_stops = 0
+    total_downtime = 0.0
+    reason_count = {}
+    machine_downtime = {}
+    lines = {
+        linha: {**contagem, "stops": 0, "downtime": 0.0}
+        for linha, contagem in status["linhas"].items()
+    }
+    for machine, reason, qtd, minutos in agregados:
+        minutos = float(minutos)
+        total_stops += qtd
+        total_downtime += minutos
+        reason_count[reason] = reason_count.get(reason, 0) + qtd
+        machine_downtime[machine] = machine_downtime.get(machine, 0) + minutos
+        por_linha = lines.setdefault(
+            linha_de(machine),
+            {"maquinas": 0, "ativas": 0, "inativas": 0, "stops": 0, "downtime": 0.0},
+        )
+        por_linha["stops"] += qtd
+        por_linha["downtime"] += minutos
+    for por_linha in lines.values():
+        por_linha["downtime"] = round(por_linha["downtime"], 2)
+
+    avg_downtime = total_downtime / total_stops if total_stops else 0
+    top_reason = max(reason_count, key=reason_count.get) if reason_count else "N/A"
+
+    pie_labels = list(reason_count.keys())
+    pie_data = [reason_count[k] for k in pie_labels]
+
+    # Sem paradas ainda: barras zeradas para as máquinas conhecidas
+    bar_labels = list(machine_downtime.keys()) or nomes()
+    bar_data = [round(machine_downtime.get(m, 0), 2) for m in bar_labels]
+
+    return {
+        "cards": {
+            "totalStops": total_stops,
+            "totalDowntime": round(total_downtime, 2),
+            "avgDowntime": round(avg_downtime, 2),
+            "mostCommonReason": top_reason,
+            "activeMachines": active_machines,
+            "inactiveMachines": inactive_machines,
+        },
+        "pie": {"labels": pie_labels, "data": pie_data},
+        "bar": {"labels": bar_labels, "data": bar_data},
+        "history": history[:10],
+        "stops": history,
+        "machineStatus": {
+            "active": active_machines,
+            "inactive": inactive_machines,
+        },
+        "lines": lines,
+    }
+
+
+# ---------------------------------------------------------------------
+# EVENTOS AO VIVO
+# ---------------------------------------------------------------------
+
+def evento_estado(machine: str, estado_led) -> dict:
+    return {"tipo": "estado_maquina", "machine": machine, "estadoLed": estado_led}
+
+
+def evento_fechada_no_lote(machine, reason, inicio, fim, duracao) -> dict:
+    """Parada que abriu e fechou dentro do mesmo lote (SQL_INSERIR_AUTO_FECHADAS)."""
+    return {
+        "tipo": "parada_fechada",
+        "machine": machine,
+        "reason": reason,
+        "start_time": inicio.isoformat(),
+        "end_time": fim.isoformat(),
+        "duration_minutes": round(duracao, 2),
+    }
+
+
+def evento_fechamento(parada_id, machine, reason, start_time, duracao_min, descartada) -> dict:
+    """Linha devolvida por SQL_FECHAR_AUTO_LOTE."""
+    return {
+        "tipo": "parada_descartada" if descartada else "parada_fechada",
+        "id": parada_id,
+        "machine": machine,
+        "reason": reason,
+        "start_time": start_time.isoformat(),
+        "duration_minutes": round(float(duracao_min), 2),
+    }
+
+
+def evento_abertura(machine, parada_id, reason, start_time, aberta_agora) -> dict:
+    """Linha devolvida por SQL_ABRIR_OU_ATUALIZAR_AUTO_LOTE(_PARTICIONADA)."""
+    return {
+        "tipo": "parada_aberta" if aberta_agora else "motivo_alterado",
+        "id": parada_id,
+        "machine": machine,
+        "reason": reason,
+        "start_time": start_time.isoformat(),
+    }
+
+
+def eventos_agregados(paradas) -> list:
+    """Delta dos agregados (para os cards/gráficos) por parada fechada."""
+    return [
+        {
+            "tipo": "agregados",
+            "machine": machine,
+            "reason": reason,
+            "dia": start_time.date().isoformat(),
+            "qtd": 1,
+            "minutos": round(float(duracao or 0), 2),
+        }
+        for machine, reason, start_time, duracao in paradas
+    ]
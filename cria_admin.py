@@ -1,6 +1,8 @@
 import psycopg2
 from werkzeug.security import generate_password_hash
 
+from migracoes import aplicar_migracoes
+
 # =====================================================================
 # CONFIG POSTGRES
 # =====================================================================
@@ -26,30 +28,8 @@ cur = conn.cursor()
 # CRIAÇÃO DAS TABELAS
 # =====================================================================
 
-cur.execute("""
-CREATE TABLE IF NOT EXISTS paradas (
-    id               SERIAL PRIMARY KEY,
-    machine          VARCHAR(50) NOT NULL,
-    reason           VARCHAR(100) NOT NULL,
-    origem           VARCHAR(20) NOT NULL,
-    start_time       TIMESTAMP NOT NULL,
-    end_time         TIMESTAMP,
-    duration_minutes NUMERIC(10,2),
-    created_at       TIMESTAMP NOT NULL DEFAULT NOW()
-);
-""")
-
-cur.execute("""
-CREATE TABLE IF NOT EXISTS users (
-    id            SERIAL PRIMARY KEY,
-    username      VARCHAR(50) UNIQUE NOT NULL,
-    password_hash TEXT NOT NULL,
-    nome          VARCHAR(100),
-    created_at    TIMESTAMP NOT NULL DEFAULT NOW()
-);
-""")
-
-conn.commit()
+# Tabelas, índices e agregados ficam em migracoes.py
+aplicar_migracoes(conn)
 print("Tabelas criadas/validadas com sucesso.")
 
 # =====================================================================
@@ -0,0 +1,122 @@
+import hashlib
+import threading
+from collections import OrderedDict
+
+from psycopg2.extras import execute_values
+
+# =====================================================================
+# EVENTOS DUPLICADOS (reenvio do Arduino / gateway)
+# =====================================================================
+#
+# Identidade de um evento: (máquina, sessão de boot, ts_ms) + tipo,
+# estadoLed e motivo. O Arduino não manda a sessão; ela sai de
+# data_hora - ts_ms (o instante do boot), arredondado ao minuto — um
+# reenvio repete data_hora e ts_ms, então cai na mesma chave. Evento sem
+# ts_ms (firmware antigo) não tem identidade e nunca é descartado.
+#
+# A chave vira um inteiro de 64 bits (blake2b). Duas camadas:
+#   1. FiltroDuplicados: LRU em memória por processo, O(1) por evento,
+#      sem ir ao banco (retry do mesmo gateway cai no mesmo worker na
+#      maioria das vezes);
+#   2. tabela eventos_chaves (só a chave + recebido_em, migração 009):
+#      INSERT ... ON CONFLICT DO NOTHING RETURNING na MESMA transação das
+#      paradas — a chave que não volta já foi aplicada (por qualquer
+#      worker). Se a transação falhar, a chave não fica gravada e o
+#      reenvio é aceito.
+
+SESSAO_S = 60
+
+SQL_REGISTRAR_CHAVES = """
+    INSERT INTO eventos_chaves (chave)
+    VALUES %s
+    ON CONFLICT (chave) DO NOTHING
+    RETURNING chave
+"""
+
+SQL_LIMPAR_CHAVES = """
+    DELETE FROM eventos_chaves
+    WHERE recebido_em < NOW() - make_interval(days => %s)
+"""
+
+
+def chave_evento(ev: dict):
+    """int64 que identifica o evento normalizado (interpretar_evento), ou None."""
+    if not ev["ts_ms"]:
+        return None
+    sessao = round((ev["agora"].timestamp() - ev["ts_ms"] / 1000.0) / SESSAO_S)
+    texto = "\x1f".join(
+        str(v)
+        for v in (ev["machine"], sessao, ev["ts_ms"], ev["tipo"], ev["estado_led"], ev["motivo_bruto"])
+    )
+    return int.from_bytes(
+        hashlib.blake2b(texto.encode("utf-8"), digest_size=8).digest(), "big", signed=True
+    )
+
+
+class FiltroDuplicados:
+    """LRU de chaves já aplicadas, limitado a `capacidade` (por processo)."""
+
+    def __init__(self, capacidade: int = 100_000):
+        self.capacidade = capacidade
+        self._lock = threading.Lock()
+        self._chaves = OrderedDict()
+
+    def filtrar(self, eventos: list):
+        """
+        Tira os eventos já vistos (no LRU ou repetidos no próprio lote).
+        Retorna (eventos, chaves, duplicados); chaves: evento → chave só
+        dos que têm identidade, para registrar_chaves() e lembrar().
+        """
+        novos, chaves, duplicados = [], {}, 0
+        no_lote = set()
+        with self._lock:
+            for ev in eventos:
+                chave = chave_evento(ev)
+                if chave is not None:
+                    if chave in self._chaves:
+                        self._chaves.move_to_end(chave)
+                        duplicados += 1
+                        continue
+                    if chave in no_lote:
+                        duplicados += 1
+                        continue
+                    no_lote.add(chave)
+                    chaves[id(ev)] = chave
+                novos.append(ev)
+        return novos, chaves, duplicados
+
+    def lembrar(self, chaves):
+        """Depois do commit: guarda as chaves aplicadas (descarta as mais antigas)."""
+        with self._lock:
+            for chave in chaves:
+                self._chaves[chave] = None
+                self._chaves.move_to_end(chave)
+            while len(self._chaves) > self.capacidade:
+                self._chaves.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._chaves)
+
+
+def registrar_chaves(cur, eventos: list, chaves: dict):
+    """
+    Grava as chaves em eventos_chaves (sem commit) e tira os eventos cuja
+    chave já estava lá. Retorna (eventos, chaves gravadas, duplicados).
+    """
+    if not chaves:
+        return eventos, [], 0
+    linhas = linhas_chaves(chaves)
+    gravadas = execute_values(cur, SQL_REGISTRAR_CHAVES, linhas, page_size=len(linhas), fetch=True)
+    return restantes(eventos, chaves, gravadas)
+
+
+def linhas_chaves(chaves: dict) -> list:
+    # Ordem fixa: dois lotes concorrentes com chaves em comum não se travam
+    return [(c,) for c in sorted(set(chaves.values()))]
+
+
+def restantes(eventos: list, chaves: dict, gravadas):
+    """gravadas: linhas do RETURNING de SQL_REGISTRAR_CHAVES."""
+    gravadas = {linha[0] for linha in gravadas}
+    novos = [ev for ev in eventos if id(ev) not in chaves or chaves[id(ev)] in gravadas]
+    return novos, list(gravadas), len(eventos) - len(novos)
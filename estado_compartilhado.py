@@ -0,0 +1,422 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+
+import psycopg2
+from psycopg2.extras import Json
+
+# =====================================================================
+# ESTADO COMPARTILHADO ENTRE WORKERS (chave → valor JSON)
+# =====================================================================
+#
+# Backends plugáveis com a mesma interface:
+#   - "memoria": dict do próprio processo (um worker só / testes)
+#   - "sqlite" : arquivo SQLite em /dev/shm (memória compartilhada do
+#                sistema), visto por todos os workers do gunicorn da
+#                mesma máquina. Leituras/escritas na casa de microssegundos.
+#   - "postgres": tabela estado_kv no próprio banco. Mais lento (ida e
+#                volta de rede), mas serve quando os workers não dividem
+#                o /dev/shm (vários hosts/containers) e sobrevive a reboot.
+
+
+def _diretorio_padrao() -> str:
+    if os.path.isdir("/dev/shm"):
+        return "/dev/shm"
+    return tempfile.gettempdir()
+
+
+class BackendMemoria:
+    def __init__(self):
+        self._dados = {}
+        self._lock = threading.Lock()
+
+    def obter(self, chave: str):
+        with self._lock:
+            return self._dados.get(chave)
+
+    def gravar(self, chave: str, valor):
+        with self._lock:
+            self._dados[chave] = valor
+
+    def apagar(self, chave: str):
+        with self._lock:
+            self._dados.pop(chave, None)
+
+    def incrementar(self, chave: str) -> int:
+        with self._lock:
+            self._dados[chave] = self._dados.get(chave, 0) + 1
+            return self._dados[chave]
+
+    def itens(self, prefixo: str = "") -> dict:
+        with self._lock:
+            return {k: v for k, v in self._dados.items() if k.startswith(prefixo)}
+
+    def substituir(self, prefixo: str, novos: dict):
+        """Troca atomicamente todas as chaves com o prefixo por `novos`."""
+        with self._lock:
+            for k in [k for k in self._dados if k.startswith(prefixo)]:
+                del self._dados[k]
+            self._dados.update(novos)
+
+
+class BackendSQLite:
+    def __init__(self, caminho: str = None):
+        self.caminho = caminho or os.path.join(
+            _diretorio_padrao(), "maroni_estado.sqlite3"
+        )
+        self._local = threading.local()
+        conn = self._conn()
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS kv (chave TEXT PRIMARY KEY, valor TEXT NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        pid = getattr(self._local, "pid", None)
+        if conn is None or pid != os.getpid():
+            conn = sqlite3.connect(self.caminho, timeout=5.0, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=OFF")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def obter(self, chave: str):
+        row = self._conn().execute(
+            "SELECT valor FROM kv WHERE chave = ?", (chave,)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def gravar(self, chave: str, valor):
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (chave, valor) VALUES (?, ?)",
+            (chave, json.dumps(valor, ensure_ascii=False)),
+        )
+
+    def apagar(self, chave: str):
+        self._conn().execute("DELETE FROM kv WHERE chave = ?", (chave,))
+
+    def incrementar(self, chave: str) -> int:
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute("SELECT valor FROM kv WHERE chave = ?", (chave,)).fetchone()
+            valor = (json.loads(row[0]) if row else 0) + 1
+            conn.execute(
+                "INSERT OR REPLACE INTO kv (chave, valor) VALUES (?, ?)",
+                (chave, json.dumps(valor)),
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        return valor
+
+    def itens(self, prefixo: str = "") -> dict:
+        rows = self._conn().execute(
+            "SELECT chave, valor FROM kv WHERE substr(chave, 1, ?) = ?",
+            (len(prefixo), prefixo),
+        ).fetchall()
+        return {k: json.loads(v) for k, v in rows}
+
+    def substituir(self, prefixo: str, novos: dict):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "DELETE FROM kv WHERE substr(chave, 1, ?) = ?", (len(prefixo), prefixo)
+            )
+            conn.executemany(
+                "INSERT OR REPLACE INTO kv (chave, valor) VALUES (?, ?)",
+                [(k, json.dumps(v, ensure_ascii=False)) for k, v in novos.items()],
+            )
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+
+
+class BackendPostgres:
+    def __init__(self, parametros_conexao: dict):
+        self.parametros_conexao = parametros_conexao
+        self._local = threading.local()
+        self._conn().cursor().execute(
+            "CREATE TABLE IF NOT EXISTS estado_kv (chave TEXT PRIMARY KEY, valor JSONB NOT NULL)"
+        )
+
+    def _conn(self):
+        conn = getattr(self._local, "conn", None)
+        pid = getattr(self._local, "pid", None)
+        if conn is None or conn.closed or pid != os.getpid():
+            conn = psycopg2.connect(**self.parametros_conexao)
+            conn.autocommit = True
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    def obter(self, chave: str):
+        cur = self._conn().cursor()
+        cur.execute("SELECT valor FROM estado_kv WHERE chave = %s", (chave,))
+        row = cur.fetchone()
+        return row[0] if row else None
+
+    def gravar(self, chave: str, valor):
+        self._conn().cursor().execute(
+            """
+            INSERT INTO estado_kv (chave, valor) VALUES (%s, %s)
+            ON CONFLICT (chave) DO UPDATE SET valor = EXCLUDED.valor
+            """,
+            (chave, Json(valor)),
+        )
+
+    def apagar(self, chave: str):
+        self._conn().cursor().execute("DELETE FROM estado_kv WHERE chave = %s", (chave,))
+
+    def incrementar(self, chave: str) -> int:
+        cur = self._conn().cursor()
+        cur.execute(
+            """
+            INSERT INTO estado_kv (chave, valor) VALUES (%s, '1')
+            ON CONFLICT (chave)
+            DO UPDATE SET valor = to_jsonb(estado_kv.valor::text::bigint + 1)
+            RETURNING valor
+            """,
+            (chave,),
+        )
+        return cur.fetchone()[0]
+
+    def itens(self, prefixo: str = "") -> dict:
+        cur = self._conn().cursor()
+        cur.execute(
+            "SELECT chave, valor FROM estado_kv WHERE left(chave, %s) = %s",
+            (len(prefixo), prefixo),
+        )
+        return dict(cur.fetchall())
+
+    def substituir(self, prefixo: str, novos: dict):
+        conn = self._conn()
+        cur = conn.cursor()
+        cur.execute("BEGIN")
+        try:
+            cur.execute("DELETE FROM estado_kv WHERE left(chave, %s) = %s", (len(prefixo), prefixo))
+            for chave, valor in novos.items():
+                cur.execute(
+                    """
+                    INSERT INTO estado_kv (chave, valor) VALUES (%s, %s)
+                    ON CONFLICT (chave) DO UPDATE SET valor = EXCLUDED.valor
+                    """,
+                    (chave, Json(valor)),
+                )
+            cur.execute("COMMIT")
+        except Exception:
+            cur.execute("ROLLBACK")
+            raise
+
+
+BACKENDS = {
+    "memoria": BackendMemoria,
+    "sqlite": BackendSQLite,
+    "postgres": BackendPostgres,
+}
+
+
+def criar_backend(nome: str, **opcoes):
+    try:
+        classe = BACKENDS[nome]
+    except KeyError:
+        raise ValueError(
+            f"Backend de estado desconhecido: {nome!r} (use {', '.join(BACKENDS)})"
+        )
+    return classe(**opcoes)
+
+
+# =====================================================================
+# CACHE DAS PARADAS AUTO ABERTAS (por máquina)
+# =====================================================================
+
+class CacheParadasAbertas:
+    """
+    Espelho da parada AUTO aberta de cada máquina: {id, reason,
+    start_time, fim}. id None = parada pendente, que ainda não durou o
+    threshold e só existe aqui; fim = fechamento provisório esperando a
+    janela de oscilação (ver reduzir_eventos_maquina).
+
+    Depois de aquecido é autoritativo: máquina sem entrada = nenhuma
+    parada AUTO aberta. Enquanto não aquecido, obter() devolve DESCONHECIDO
+    e o chamador deve consultar o banco.
+    """
+
+    PREFIXO = "aberta:"
+    CHAVE_AQUECIDO = "meta:aberta_aquecido_em"
+    DESCONHECIDO = object()
+
+    def __init__(self, backend, reaquecer_apos_s: float = 300.0):
+        self.backend = backend
+        self.reaquecer_apos_s = reaquecer_apos_s
+
+    def precisa_aquecer(self) -> bool:
+        aquecido_em = self.backend.obter(self.CHAVE_AQUECIDO)
+        return aquecido_em is None or time.time() - aquecido_em > self.reaquecer_apos_s
+
+    @staticmethod
+    def entrada(parada_id, reason: str, start_time, fim=None) -> dict:
+        return {
+            "id": parada_id,
+            "reason": reason,
+            "start_time": start_time.isoformat(),
+            "fim": fim.isoformat() if fim else None,
+        }
+
+    def aquecer(self, linhas):
+        """
+        linhas: iterável de (machine, id, reason, start_time) vindas do banco.
+        Pendentes e fechamentos provisórios (que o banco não conhece) ficam.
+        """
+        novos = {
+            self.PREFIXO + machine: self.entrada(pid, reason, start_time)
+            for machine, pid, reason, start_time in linhas
+        }
+        for chave, atual in self.backend.itens(self.PREFIXO).items():
+            if atual.get("id") is None and chave not in novos:
+                novos[chave] = atual
+            elif atual.get("fim") and novos.get(chave, {}).get("id") == atual.get("id"):
+                novos[chave]["fim"] = atual["fim"]
+        self.backend.substituir(self.PREFIXO, novos)
+        self.backend.gravar(self.CHAVE_AQUECIDO, time.time())
+        return len(novos)
+
+    def obter(self, machine: str):
+        """dict da parada aberta, None (nenhuma) ou DESCONHECIDO."""
+        if self.backend.obter(self.CHAVE_AQUECIDO) is None:
+            return self.DESCONHECIDO
+        return self.backend.obter(self.PREFIXO + machine)
+
+    def marcar_aberta(self, machine: str, parada_id, reason: str, start_time, fim=None):
+        self.backend.gravar(self.PREFIXO + machine, self.entrada(parada_id, reason, start_time, fim))
+
+    def aplicar_planos(self, planos: dict, anteriores: dict, abertas_gravadas=()):
+        """
+        Depois do commit: deixa a entrada de cada máquina igual à parada
+        final do plano (planejar_paradas). anteriores: machine → entrada
+        lida antes; abertas_gravadas: linhas (machine, id, reason,
+        start_time, ...) do INSERT de abertura.
+        """
+        gravadas = {linha[0]: tuple(linha)[1:4] for linha in abertas_gravadas}
+        for machine, plano in planos.items():
+            final = plano["final"]
+            if final is None:
+                if anteriores.get(machine):
+                    self.marcar_fechada(machine)
+                continue
+            parada_id, reason, start_time = gravadas.get(
+                machine, (final.get("id"), final["reason"], final["start_time"])
+            )
+            nova = self.entrada(parada_id, reason, start_time, final.get("fim"))
+            if nova != anteriores.get(machine):
+                self.backend.gravar(self.PREFIXO + machine, nova)
+
+    def marcar_fechada(self, machine: str):
+        self.backend.apagar(self.PREFIXO + machine)
+
+    def invalidar(self):
+        self.backend.apagar(self.CHAVE_AQUECIDO)
+
+    def todas(self) -> dict:
+        n = len(self.PREFIXO)
+        return {k[n:]: v for k, v in self.backend.itens(self.PREFIXO).items()}
+
+
+# =====================================================================
+# ESTADO (LED) DE CADA MÁQUINA
+# =====================================================================
+
+class EstadoMaquinas:
+    """
+    Último estadoLed de cada máquina ({estado, desde}), visto por todos os
+    workers. obter() é uma leitura de chave.
+
+    Cada mudança também entra num diário ("estado_mud:<seq>", os últimos
+    `tamanho_diario`): quem mantém contadores em memória (o registro de
+    máquinas) lê só as mudanças desde o último seq que viu, via
+    mudancas_desde(). O banco (tabela machine_states) é a cópia durável:
+    aquecer() restaura daqui quando o estado compartilhado está vazio
+    (reboot, backend "memoria").
+    """
+
+    PREFIXO = "estado:"
+    PREFIXO_DIARIO = "estado_mud:"
+    CHAVE_SEQ = "meta:estado_seq"
+    CHAVE_AQUECIDO = "meta:estado_aquecido_em"
+
+    def __init__(self, backend, tamanho_diario: int = 10000):
+        self.backend = backend
+        self.tamanho_diario = tamanho_diario
+
+    def precisa_aquecer(self) -> bool:
+        return self.backend.obter(self.CHAVE_AQUECIDO) is None
+
+    def aquecer(self, linhas):
+        """linhas: iterável de (machine, estado_led, desde) vindas do banco."""
+        novos = {
+            self.PREFIXO + machine: {"estado": estado, "desde": desde.isoformat()}
+            for machine, estado, desde in linhas
+        }
+        self.backend.substituir(self.PREFIXO, novos)
+        self._registrar(None)
+        self.backend.gravar(self.CHAVE_AQUECIDO, time.time())
+        return len(novos)
+
+    def obter(self, machine: str):
+        registro = self.backend.obter(self.PREFIXO + machine)
+        return registro["estado"] if registro else None
+
+    def mudou(self, machine: str, estado) -> bool:
+        """True se `estado` difere do último gravado. Não grava nada."""
+        registro = self.backend.obter(self.PREFIXO + machine)
+        return not (registro and registro["estado"] == estado)
+
+    def definir(self, machine: str, estado, desde) -> bool:
+        """Grava se mudou. desde: datetime do evento. True se mudou."""
+        registro = self.backend.obter(self.PREFIXO + machine)
+        if registro and registro["estado"] == estado:
+            return False
+        self.backend.gravar(self.PREFIXO + machine, {"estado": estado, "desde": desde.isoformat()})
+        self._registrar({"machine": machine, "estado": estado})
+        return True
+
+    def limpar(self):
+        self.backend.substituir(self.PREFIXO, {})
+        self._registrar(None)
+
+    def todos(self) -> dict:
+        n = len(self.PREFIXO)
+        return {k[n:]: v["estado"] for k, v in self.backend.itens(self.PREFIXO).items()}
+
+    def _registrar(self, mudanca):
+        """mudanca None = tudo mudou (quem lê recarrega tudo)."""
+        seq = self.backend.incrementar(self.CHAVE_SEQ)
+        self.backend.gravar(self.PREFIXO_DIARIO + str(seq), mudanca or {"tudo": True})
+        self.backend.apagar(self.PREFIXO_DIARIO + str(seq - self.tamanho_diario))
+
+    def mudancas_desde(self, seq: int):
+        """
+        (seq_atual, [(machine, estado)]) com as mudanças depois de `seq`, ou
+        (seq_atual, None) quando é preciso recarregar tudo com todos().
+        """
+        atual = self.backend.obter(self.CHAVE_SEQ) or 0
+        if seq is None or atual - seq >= self.tamanho_diario:
+            return atual, None
+        mudancas = []
+        for s in range(seq + 1, atual + 1):
+            mudanca = self.backend.obter(self.PREFIXO_DIARIO + str(s))
+            if mudanca is None:
+                if s < atual:
+                    return atual, None  # perdida (processo morreu no meio)
+                return s - 1, mudancas  # ainda sendo gravada: fica para a próxima
+            if mudanca.get("tudo"):
+                return atual, None
+            mudancas.append((mudanca["machine"], mudanca["estado"]))
+        return atual, mudancas
@@ -0,0 +1,144 @@
+import json
+import logging
+import os
+import queue
+import select
+import threading
+import time
+
+# =====================================================================
+# EVENTOS AO VIVO (push para o dashboard)
+# =====================================================================
+#
+# Produtor: quem grava no banco chama publicar(cur, eventos) DENTRO da
+# transação; o pg_notify só é entregue no commit, então ninguém recebe
+# evento de algo que foi desfeito. Vale para todos os workers.
+#
+# Consumidor: cada processo tem UMA thread com conexão dedicada fazendo
+# LISTEN no canal e repassando cada evento para as filas dos assinantes
+# locais (clientes SSE). Assinante lento demais é desligado — o
+# EventSource do navegador reconecta e recarrega o /api/data.
+
+log = logging.getLogger("maroni.push")
+
+CANAL_PADRAO = "maroni_eventos"
+
+# Limite do payload do NOTIFY é 8000 bytes; fica uma folga
+_MAX_BYTES_NOTIFY = 7000
+
+
+def payloads(eventos: list):
+    """Arrays JSON com os eventos, cada um cabendo num NOTIFY."""
+    pedaco = []
+    tamanho = 0
+    for ev in eventos:
+        texto = json.dumps(ev, ensure_ascii=False, default=str)
+        n = len(texto.encode("utf-8")) + 1
+        if pedaco and tamanho + n > _MAX_BYTES_NOTIFY:
+            yield "[" + ",".join(pedaco) + "]"
+            pedaco, tamanho = [], 0
+        pedaco.append(texto)
+        tamanho += n
+    if pedaco:
+        yield "[" + ",".join(pedaco) + "]"
+
+
+def publicar(cur, eventos: list, canal: str = CANAL_PADRAO):
+    """Enfileira os eventos no NOTIFY da transação atual. Não faz commit."""
+    for payload in payloads(eventos):
+        cur.execute("SELECT pg_notify(%s, %s)", (canal, payload))
+
+
+class Difusor:
+    def __init__(self, fabrica_conexao, canal: str = CANAL_PADRAO, max_fila_assinante: int = 500):
+        self._fabrica = fabrica_conexao
+        self.canal = canal
+        self.max_fila_assinante = max_fila_assinante
+        self._assinantes = set()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+    # -----------------------------------------------------------------
+    # ASSINANTES
+    # -----------------------------------------------------------------
+
+    def assinar(self) -> queue.Queue:
+        self._garantir_thread()
+        fila = queue.Queue(maxsize=self.max_fila_assinante)
+        with self._lock:
+            self._assinantes.add(fila)
+        return fila
+
+    def cancelar(self, fila: queue.Queue):
+        with self._lock:
+            self._assinantes.discard(fila)
+
+    def total_assinantes(self) -> int:
+        with self._lock:
+            return len(self._assinantes)
+
+    def difundir(self, eventos: list):
+        """Entrega os eventos a todos os assinantes deste processo."""
+        with self._lock:
+            assinantes = list(self._assinantes)
+        for fila in assinantes:
+            try:
+                for ev in eventos:
+                    fila.put_nowait(ev)
+            except queue.Full:
+                # Cliente não acompanha: derruba para ele reconectar
+                self.cancelar(fila)
+                try:
+                    fila.get_nowait()
+                    fila.put_nowait(None)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    # -----------------------------------------------------------------
+    # LISTEN
+    # -----------------------------------------------------------------
+
+    def _garantir_thread(self):
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._assinantes = set()
+            self._thread = threading.Thread(
+                target=self._loop, name="difusor-eventos", daemon=True
+            )
+            self._thread.start()
+
+    def _loop(self):
+        espera = 1.0
+        while True:
+            conn = None
+            try:
+                conn = self._fabrica()
+                conn.autocommit = True
+                cur = conn.cursor()
+                cur.execute(f'LISTEN "{self.canal}"')
+                espera = 1.0
+                # Avisa quem estava conectado que pode ter perdido eventos
+                self.difundir([{"tipo": "reconectado"}])
+
+                while True:
+                    if select.select([conn], [], [], 30.0) == ([], [], []):
+                        continue
+                    conn.poll()
+                    while conn.notifies:
+                        aviso = conn.notifies.pop(0)
+                        try:
+                            self.difundir(json.loads(aviso.payload))
+                        except ValueError:
+                            log.warning("Evento push inválido: %s", aviso.payload[:200])
+            except Exception as e:
+                log.error("LISTEN de eventos caiu (%s); reconectando em %.0fs", e, espera)
+                if conn is not None:
+                    try:
+                        conn.close()
+                    except Exception:
+                        pass
+                time.sleep(espera)
+                espera = min(espera * 2, 30.0)
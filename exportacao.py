@@ -0,0 +1,256 @@
+import argparse
+import csv
+import io
+import sys
+from datetime import datetime
+
+import psycopg2
+
+# =====================================================================
+# EXPORTAÇÃO DE PARADAS (CSV / Parquet / Arrow) EM FLUXO
+# =====================================================================
+#
+# As linhas saem de um cursor no servidor (named cursor) em blocos de
+# `bloco` linhas; cada bloco é convertido e entregue antes do próximo ser
+# lido, então a memória não cresce com o tamanho da exportação. Usa uma
+# conexão própria (não a do pool), para uma exportação longa não ocupar
+# conexão do dashboard.
+#
+# Parquet e Arrow IPC precisam do pyarrow (opcional: pip install pyarrow).
+#
+#   py exportacao.py --formato csv --machine "Máquina 01" --desde 2025-01-01 > paradas.csv
+#   py exportacao.py --formato parquet --saida paradas.parquet
+
+PG_HOST = "localhost"
+PG_PORT = "5432"
+PG_USER = "postgres"
+PG_PASSWORD = "admin"
+PG_DB = "arduino_logs"
+
+COLUNAS = (
+    "id",
+    "machine",
+    "reason",
+    "origem",
+    "start_time",
+    "end_time",
+    "duration_minutes",
+    "created_at",
+)
+
+FORMATOS = {
+    "csv": ("text/csv; charset=utf-8", "csv"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+    "arrow": ("application/vnd.apache.arrow.stream", "arrows"),
+}
+
+
+class FormatoIndisponivel(Exception):
+    """Formato pedido precisa de uma dependência que não está instalada."""
+
+
+def montar_consulta(filtros: dict):
+    """filtros: machines (lista), origem, desde, ate. Retorna (sql, params)."""
+    condicoes = []
+    params = []
+    if filtros.get("machines"):
+        condicoes.append("machine = ANY(%s)")
+        params.append(list(filtros["machines"]))
+    if filtros.get("origem"):
+        condicoes.append("origem = %s")
+        params.append(filtros["origem"])
+    if filtros.get("desde"):
+        condicoes.append("start_time >= %s")
+        params.append(filtros["desde"])
+    if filtros.get("ate"):
+        condicoes.append("start_time < %s")
+        params.append(filtros["ate"])
+
+    where = ("WHERE " + " AND ".join(condicoes)) if condicoes else ""
+    sql = f"""
+        SELECT {", ".join(COLUNAS)}
+        FROM paradas
+        {where}
+        ORDER BY start_time, id
+    """
+    return sql, params
+
+
+def ler_blocos(conn, filtros: dict, bloco: int = 10000):
+    """Gera listas de até `bloco` linhas. Fecha a conexão no fim."""
+    sql, params = montar_consulta(filtros)
+    try:
+        conn.set_session(readonly=True)
+        cur = conn.cursor(name="exportacao_paradas")
+        cur.itersize = bloco
+        cur.execute(sql, params)
+        while True:
+            linhas = cur.fetchmany(bloco)
+            if not linhas:
+                break
+            yield linhas
+        cur.close()
+        conn.rollback()
+    finally:
+        conn.close()
+
+
+# ---------------------------------------------------------------------
+# CSV
+# ---------------------------------------------------------------------
+
+def _valor_csv(v):
+    if v is None:
+        return ""
+    if isinstance(v, datetime):
+        return v.isoformat(sep=" ")
+    return v
+
+
+def gerar_csv(blocos, separador: str = ","):
+    """BOM + cabeçalho + linhas (o BOM faz o Excel abrir os acentos certo)."""
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, delimiter=separador, lineterminator="\r\n")
+    escritor.writerow(COLUNAS)
+    yield ("\ufeff" + buffer.getvalue()).encode("utf-8")
+
+    for linhas in blocos:
+        buffer.seek(0)
+        buffer.truncate()
+        escritor.writerows([_valor_csv(v) for v in linha] for linha in linhas)
+        yield buffer.getvalue().encode("utf-8")
+
+
+# ---------------------------------------------------------------------
+# PARQUET / ARROW (pyarrow)
+# ---------------------------------------------------------------------
+
+class _SaidaDrenavel(io.RawIOBase):
+    """Arquivo só-escrita em memória que é esvaziado a cada bloco."""
+
+    def __init__(self):
+        self._dados = bytearray()
+        self._posicao = 0
+
+    def writable(self):
+        return True
+
+    def write(self, b):
+        self._dados += b
+        self._posicao += len(b)
+        return len(b)
+
+    def tell(self):
+        return self._posicao
+
+    def drenar(self) -> bytes:
+        dados = bytes(self._dados)
+        self._dados.clear()
+        return dados
+
+
+def _pyarrow():
+    try:
+        import pyarrow
+        import pyarrow.parquet  # noqa: F401
+    except ImportError:
+        raise FormatoIndisponivel("Parquet/Arrow precisam do pyarrow (pip install pyarrow)")
+    return pyarrow
+
+
+def _esquema(pa):
+    return pa.schema(
+        [
+            ("id", pa.int64()),
+            ("machine", pa.string()),
+            ("reason", pa.string()),
+            ("origem", pa.string()),
+            ("start_time", pa.timestamp("us")),
+            ("end_time", pa.timestamp("us")),
+            ("duration_minutes", pa.float64()),
+            ("created_at", pa.timestamp("us")),
+        ]
+    )
+
+
+def _lote_arrow(pa, esquema, linhas):
+    colunas = list(zip(*linhas))
+    i_duracao = COLUNAS.index("duration_minutes")
+    colunas[i_duracao] = [float(v) if v is not None else None for v in colunas[i_duracao]]
+    return pa.record_batch(
+        [pa.array(c, type=campo.type) for c, campo in zip(colunas, esquema)], schema=esquema
+    )
+
+
+def gerar_parquet(blocos):
+    """Um row group por bloco."""
+    pa = _pyarrow()
+    esquema = _esquema(pa)
+    saida = _SaidaDrenavel()
+    escritor = pa.parquet.ParquetWriter(pa.PythonFile(saida, mode="w"), esquema, compression="zstd")
+    for linhas in blocos:
+        escritor.write_batch(_lote_arrow(pa, esquema, linhas))
+        yield saida.drenar()
+    escritor.close()
+    yield saida.drenar()
+
+
+def gerar_arrow(blocos):
+    """Arrow IPC em formato stream: um record batch por bloco."""
+    pa = _pyarrow()
+    esquema = _esquema(pa)
+    saida = _SaidaDrenavel()
+    escritor = pa.ipc.new_stream(pa.PythonFile(saida, mode="w"), esquema)
+    yield saida.drenar()
+    for linhas in blocos:
+        escritor.write_batch(_lote_arrow(pa, esquema, linhas))
+        yield saida.drenar()
+    escritor.close()
+    yield saida.drenar()
+
+
+def gerar_exportacao(formato: str, blocos, separador: str = ","):
+    """Gerador de bytes no formato pedido. Levanta FormatoIndisponivel/ValueError."""
+    if formato == "csv":
+        return gerar_csv(blocos, separador)
+    if formato in ("parquet", "arrow"):
+        _pyarrow()  # falha já, antes de começar a responder
+        return gerar_parquet(blocos) if formato == "parquet" else gerar_arrow(blocos)
+    raise ValueError(f"formato deve ser um de: {', '.join(FORMATOS)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Exporta a tabela paradas")
+    parser.add_argument("--formato", choices=list(FORMATOS), default="csv")
+    parser.add_argument("--saida", help="arquivo de saída (padrão: stdout)")
+    parser.add_argument("--machine", action="append", dest="machines",
+                        help="pode repetir; padrão: todas")
+    parser.add_argument("--origem", choices=["AUTO", "MANUAL"])
+    parser.add_argument("--desde", type=datetime.fromisoformat, help="start_time inicial (ISO)")
+    parser.add_argument("--ate", type=datetime.fromisoformat, help="start_time final, exclusivo")
+    parser.add_argument("--separador", default=",", help="separador do CSV (ex: ';')")
+    parser.add_argument("--bloco", type=int, default=10000, help="linhas por bloco")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=PG_HOST,
+        port=PG_PORT,
+        user=PG_USER,
+        password=PG_PASSWORD,
+        database=PG_DB,
+    )
+    filtros = {k: getattr(args, k) for k in ("machines", "origem", "desde", "ate")}
+    blocos = ler_blocos(conn, filtros, args.bloco)
+
+    try:
+        pedacos = gerar_exportacao(args.formato, blocos, args.separador)
+    except FormatoIndisponivel as e:
+        sys.exit(str(e))
+
+    destino = open(args.saida, "wb") if args.saida else sys.stdout.buffer
+    try:
+        for pedaco in pedacos:
+            destino.write(pedaco)
+    finally:
+        if args.saida:
+            destino.close()
@@ -0,0 +1,488 @@
+import importlib
+import json
+import logging
+import multiprocessing
+import os
+import queue
+import threading
+import time
+import zlib
+from collections import deque
+
+# =====================================================================
+# FILA DE ESCRITA (write-behind) ENTRE O /log E O POSTGRES
+# =====================================================================
+#
+# O /log só valida e enfileira; uma thread de fundo junta os eventos em
+# lotes e chama `aplicar(lista_de_dados)` (o processar_eventos do app).
+# Uma única thread consumidora + lotes aplicados em ordem de chegada =
+# ordem preservada por máquina dentro do processo.
+#
+# Com `arquivo_spool`, cada item também é gravado num JSONL antes de ser
+# aceito; o que já foi aplicado é marcado num arquivo de offset, e ao
+# reiniciar o restante é reenfileirado. O spool é zerado quando a fila
+# esvazia. Cada processo trava um "slot" (<arquivo>.0, <arquivo>.1, ...)
+# para que vários workers do gunicorn não escrevam no mesmo arquivo; um
+# worker novo assume o slot livre e recupera o que sobrou nele.
+
+log = logging.getLogger("maroni.fila")
+
+
+class FilaCheia(Exception):
+    """Fila no limite: o chamador deve responder com back-pressure (503)."""
+
+
+def aplicar_itens(aplicar, itens: list, transitorios: tuple, origem: str):
+    """
+    Aplica itens (enfileirado_em, [dados...]) como um lote só. Erro em
+    `transitorios` (banco fora do ar etc.): segura o lote e tenta de novo,
+    com espera crescente. Qualquer outro erro vem do conteúdo e repetir não
+    resolve: o lote é refeito item a item e só o item que falha é
+    descartado (com log do conteúdo), para um evento ruim não parar a fila.
+    Retorna (erros, eventos descartados).
+    """
+    erros = 0
+
+    def tentar(dados):
+        nonlocal erros
+        espera = 0.5
+        while True:
+            try:
+                aplicar(dados)
+                return
+            except transitorios as e:
+                erros += 1
+                log.error("%s: falha ao aplicar lote (%s); nova tentativa em %.1fs", origem, e, espera)
+                time.sleep(espera)
+                espera = min(espera * 2, 30.0)
+
+    try:
+        tentar([d for _, lista in itens for d in lista])
+        return erros, 0
+    except Exception as e:
+        erros += 1
+        recusados = [(itens[0][1], e)]
+
+    if len(itens) > 1:
+        log.warning("%s: lote recusado (%r); aplicando item a item.", origem, recusados[0][1])
+        recusados = []
+        for _, dados in itens:
+            try:
+                tentar(dados)
+            except Exception as e:
+                erros += 1
+                recusados.append((dados, e))
+
+    for dados, e in recusados:
+        log.error(
+            "%s: %d eventos DESCARTADOS (%r): %s",
+            origem, len(dados), e, json.dumps(dados, ensure_ascii=False, default=str)[:2000],
+        )
+    return erros, sum(len(dados) for dados, _ in recusados)
+
+
+class FilaEscrita:
+    def __init__(
+        self,
+        aplicar,
+        capacidade: int = 10000,
+        lote_max: int = 500,
+        espera_lote_s: float = 0.05,
+        arquivo_spool: str = None,
+        fsync_spool: bool = False,
+        transitorios: tuple = (Exception,),
+    ):
+        self._aplicar = aplicar
+        self.transitorios = transitorios
+        self.capacidade = capacidade
+        self.lote_max = lote_max
+        self.espera_lote_s = espera_lote_s
+        self.arquivo_spool = arquivo_spool
+        self.fsync_spool = fsync_spool
+
+        # Cada item: (enfileirado_em, [dados...]) — um /log/batch entra como
+        # um item só e nunca é dividido entre transações.
+        self._fila = queue.Queue()
+        self._eventos_pendentes = 0
+        self._lock = threading.Lock()
+        self._spool = None
+        self._caminho_spool = None
+        self._trava_spool = None
+        self._spool_linhas = 0
+        self._thread = None
+        self._pid = None
+        self._parar = threading.Event()
+
+        self.processados_total = 0
+        self.lotes_total = 0
+        self.erros_total = 0
+        self.rejeitados_total = 0
+        self.descartados_total = 0
+        self.atraso_ultimo_lote_s = 0.0
+
+    # -----------------------------------------------------------------
+    # PRODUTOR
+    # -----------------------------------------------------------------
+
+    def enfileirar(self, dados: list):
+        """Aceita a lista de eventos inteira ou levanta FilaCheia."""
+        self._garantir_thread()
+        with self._lock:
+            if self._eventos_pendentes + len(dados) > self.capacidade:
+                self.rejeitados_total += len(dados)
+                raise FilaCheia(f"Fila de escrita cheia ({self.capacidade} eventos)")
+            if self._spool is not None:
+                self._spool.write(json.dumps(dados, ensure_ascii=False) + "\n")
+                self._spool.flush()
+                if self.fsync_spool:
+                    os.fsync(self._spool.fileno())
+                self._spool_linhas += 1
+            self._eventos_pendentes += len(dados)
+            self._fila.put((time.time(), dados))
+
+    # -----------------------------------------------------------------
+    # CONSUMIDOR
+    # -----------------------------------------------------------------
+
+    def _garantir_thread(self):
+        # Thread criada por processo (depois do fork do gunicorn)
+        if self._pid == os.getpid() and self._thread is not None:
+            return
+        with self._lock:
+            if self._pid == os.getpid() and self._thread is not None:
+                return
+            self._pid = os.getpid()
+            self._fila = queue.Queue()
+            self._eventos_pendentes = 0
+            self._abrir_spool()
+            self._thread = threading.Thread(
+                target=self._loop, name="fila-escrita", daemon=True
+            )
+            self._thread.start()
+
+    def _escolher_slot_spool(self) -> str:
+        try:
+            import fcntl
+        except ImportError:
+            return self.arquivo_spool  # Windows: servidor de um processo só
+
+        for i in range(64):
+            caminho = f"{self.arquivo_spool}.{i}"
+            trava = open(caminho + ".lock", "w")
+            try:
+                fcntl.flock(trava, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                trava.close()
+                continue
+            self._trava_spool = trava  # mantida aberta enquanto o processo viver
+            return caminho
+        raise RuntimeError("Nenhum slot de spool livre (máximo 64 processos)")
+
+    def _abrir_spool(self):
+        if not self.arquivo_spool:
+            return
+        self._caminho_spool = self._escolher_slot_spool()
+        pendentes = []
+        if os.path.exists(self._caminho_spool):
+            aplicados = 0
+            try:
+                with open(self._caminho_spool + ".ofs", encoding="utf-8") as f:
+                    aplicados = int(f.read().strip() or 0)
+            except (OSError, ValueError):
+                pass
+            with open(self._caminho_spool, encoding="utf-8") as f:
+                for i, linha in enumerate(f):
+                    if i >= aplicados and linha.strip():
+                        try:
+                            pendentes.append(json.loads(linha))
+                        except ValueError:
+                            break  # última linha truncada por queda
+        # Regrava só o que falta aplicar
+        self._spool = open(self._caminho_spool, "w", encoding="utf-8")
+        self._gravar_offset(0)
+        self._spool_linhas = 0
+        for dados in pendentes:
+            self._spool.write(json.dumps(dados, ensure_ascii=False) + "\n")
+            self._spool_linhas += 1
+            self._eventos_pendentes += len(dados)
+            self._fila.put((time.time(), dados))
+        self._spool.flush()
+        if pendentes:
+            log.info("Fila de escrita: %d itens recuperados do spool.", len(pendentes))
+
+    def _gravar_offset(self, n: int):
+        with open(self._caminho_spool + ".ofs", "w", encoding="utf-8") as f:
+            f.write(str(n))
+
+    def _juntar_lote(self):
+        itens = [self._fila.get()]
+        total = len(itens[0][1])
+        limite = time.monotonic() + self.espera_lote_s
+        while total < self.lote_max:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                proximo = self._fila.get(timeout=restante)
+            except queue.Empty:
+                break
+            itens.append(proximo)
+            total += len(proximo[1])
+        return itens
+
+    def _loop(self):
+        while not self._parar.is_set():
+            itens = self._juntar_lote()
+            total = sum(len(lista) for _, lista in itens)
+            erros, descartados = aplicar_itens(self._aplicar, itens, self.transitorios, "Fila de escrita")
+
+            agora = time.time()
+            with self._lock:
+                self._eventos_pendentes -= total
+                self.processados_total += total - descartados
+                self.descartados_total += descartados
+                self.erros_total += erros
+                self.lotes_total += 1
+                self.atraso_ultimo_lote_s = agora - itens[0][0]
+                if self._spool is not None:
+                    if self._fila.empty():
+                        self._spool.seek(0)
+                        self._spool.truncate()
+                        self._spool_linhas = 0
+                        self._gravar_offset(0)
+                    else:
+                        self._gravar_offset(self._spool_linhas - self._fila.qsize())
+
+    def drenar(self, timeout: float = 10.0) -> bool:
+        """Espera a fila esvaziar (desligamento). True se esvaziou."""
+        limite = time.monotonic() + timeout
+        while time.monotonic() < limite:
+            with self._lock:
+                if self._eventos_pendentes == 0:
+                    return True
+            time.sleep(0.05)
+        return False
+
+    # -----------------------------------------------------------------
+    # MÉTRICAS
+    # -----------------------------------------------------------------
+
+    def metricas(self) -> dict:
+        with self._fila.mutex:
+            mais_antigo = self._fila.queue[0][0] if self._fila.queue else None
+        with self._lock:
+            return {
+                "profundidade": self._eventos_pendentes,
+                "capacidade": self.capacidade,
+                "idade_mais_antigo_s": round(time.time() - mais_antigo, 3)
+                if mais_antigo
+                else 0.0,
+                "atraso_ultimo_lote_s": round(self.atraso_ultimo_lote_s, 3),
+                "processados_total": self.processados_total,
+                "lotes_total": self.lotes_total,
+                "erros_total": self.erros_total,
+                "rejeitados_total": self.rejeitados_total,
+                "descartados_total": self.descartados_total,
+            }
+
+
+# =====================================================================
+# FILA PARTICIONADA: UM PROCESSO POR FATIA DAS MÁQUINAS
+# =====================================================================
+#
+# Mesma interface da FilaEscrita, mas quem aplica são N processos (spawn)
+# e cada máquina sempre cai no mesmo, por hash do nome (particao_de). O
+# processo é o único que escreve as paradas, o LED e as pendentes das
+# suas máquinas: eventos da mesma máquina nunca correm em paralelo e
+# processos diferentes não disputam as mesmas linhas. Cada um junta os
+# seus lotes como a FilaEscrita.
+#
+# `aplicar` e `iniciar` são referências "modulo:funcao", importadas dentro
+# de cada processo; iniciar(indice, total) roda uma vez ao subir. Um
+# /log/batch com várias máquinas é dividido entre os processos. Sem spool:
+# o que estiver na fila se perde se o processo pai cair.
+
+
+def particao_de(machine: str, total: int) -> int:
+    """Partição (0..total-1) dona da máquina; estável entre processos e reinícios."""
+    return zlib.crc32((machine or "").encode("utf-8")) % total
+
+
+def _importar(referencia: str):
+    modulo, nome = referencia.split(":")
+    return getattr(importlib.import_module(modulo), nome)
+
+
+def _loop_particao(indice: int, total: int, aplicar_ref: str, iniciar_ref: str, fila, concluidos,
+                   lote_max: int, espera_lote_s: float, transitorios: tuple):
+    """Corpo de cada processo da FilaParticionada."""
+    aplicar = _importar(aplicar_ref)
+    if iniciar_ref:
+        _importar(iniciar_ref)(indice, total)
+
+    while True:
+        item = fila.get()
+        if item is None:
+            return
+        itens = [item]
+        total_eventos = len(item[1])
+        limite = time.monotonic() + espera_lote_s
+        while total_eventos < lote_max:
+            restante = limite - time.monotonic()
+            if restante <= 0:
+                break
+            try:
+                proximo = fila.get(timeout=restante)
+            except queue.Empty:
+                break
+            if proximo is None:
+                fila.put(None)  # encerra depois deste lote
+                break
+            itens.append(proximo)
+            total_eventos += len(proximo[1])
+        erros, descartados = aplicar_itens(aplicar, itens, transitorios, f"Partição {indice}")
+        eventos = sum(len(lista) for _, lista in itens)
+        concluidos.put((indice, eventos, itens[0][0], itens[-1][0], erros, descartados))
+
+
+class FilaParticionada:
+    def __init__(
+        self,
+        aplicar: str,
+        particoes: int,
+        iniciar: str = None,
+        capacidade: int = 10000,
+        lote_max: int = 500,
+        espera_lote_s: float = 0.05,
+        transitorios: tuple = (Exception,),
+        maquina_de=None,
+    ):
+        self.aplicar = aplicar
+        self.particoes = particoes
+        self.transitorios = transitorios
+        # Nome da máquina como o aplicar vai vê-lo (ex.: sem "machine" = a padrão)
+        self.maquina_de = maquina_de or (lambda dado: dado.get("machine"))
+        self.iniciar = iniciar
+        self.capacidade = capacidade
+        self.lote_max = lote_max
+        self.espera_lote_s = espera_lote_s
+
+        self._lock = threading.Lock()
+        self._pid = None
+        self._filas = []
+        self._processos = []
+        self._concluidos = None
+        self._pendentes = [0] * particoes
+        self._mais_antigo = [deque() for _ in range(particoes)]  # enfileirado_em ainda não aplicados
+
+        self.processados_total = 0
+        self.lotes_total = 0
+        self.erros_total = 0
+        self.rejeitados_total = 0
+        self.descartados_total = 0
+        self.atraso_ultimo_lote_s = 0.0
+
+    # -----------------------------------------------------------------
+    # PRODUTOR
+    # -----------------------------------------------------------------
+
+    def enfileirar(self, dados: list):
+        """Divide os eventos por partição; aceita todos ou levanta FilaCheia."""
+        self._garantir_processos()
+        partes = {}
+        for dado in dados:
+            partes.setdefault(particao_de(self.maquina_de(dado), self.particoes), []).append(dado)
+        agora = time.time()
+        with self._lock:
+            if sum(self._pendentes) + len(dados) > self.capacidade:
+                self.rejeitados_total += len(dados)
+                raise FilaCheia(f"Fila de escrita cheia ({self.capacidade} eventos)")
+            for indice, parte in partes.items():
+                self._pendentes[indice] += len(parte)
+                self._mais_antigo[indice].append(agora)
+                self._filas[indice].put((agora, parte))
+
+    # -----------------------------------------------------------------
+    # PROCESSOS
+    # -----------------------------------------------------------------
+
+    def _garantir_processos(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            contexto = multiprocessing.get_context("spawn")
+            self._concluidos = contexto.Queue()
+            self._filas = [contexto.Queue() for _ in range(self.particoes)]
+            self._processos = []
+            for indice, fila in enumerate(self._filas):
+                processo = contexto.Process(
+                    target=_loop_particao,
+                    args=(
+                        indice, self.particoes, self.aplicar, self.iniciar, fila,
+                        self._concluidos, self.lote_max, self.espera_lote_s, self.transitorios,
+                    ),
+                    name=f"fila-particao-{indice}",
+                    daemon=True,
+                )
+                processo.start()
+                self._processos.append(processo)
+            self._pid = os.getpid()
+            threading.Thread(target=self._loop_concluidos, name="fila-particoes", daemon=True).start()
+            log.info("Fila particionada: %d processos de escrita.", self.particoes)
+
+    def _loop_concluidos(self):
+        concluidos = self._concluidos
+        while True:
+            indice, eventos, enfileirado_em, ultimo, erros, descartados = concluidos.get()
+            with self._lock:
+                self._pendentes[indice] -= eventos
+                antigos = self._mais_antigo[indice]
+                while antigos and antigos[0] <= ultimo:
+                    antigos.popleft()
+                self.processados_total += eventos - descartados
+                self.descartados_total += descartados
+                self.lotes_total += 1
+                self.erros_total += erros
+                self.atraso_ultimo_lote_s = time.time() - enfileirado_em
+
+    def drenar(self, timeout: float = 10.0) -> bool:
+        """Espera as filas esvaziarem e encerra os processos. True se esvaziou."""
+        if self._pid != os.getpid():
+            return True
+        limite = time.monotonic() + timeout
+        vazia = False
+        while time.monotonic() < limite:
+            with self._lock:
+                if sum(self._pendentes) == 0:
+                    vazia = True
+                    break
+            time.sleep(0.05)
+        for fila in self._filas:
+            fila.put(None)
+        for processo in self._processos:
+            processo.join(timeout=max(0.1, limite - time.monotonic()))
+        return vazia
+
+    # -----------------------------------------------------------------
+    # MÉTRICAS
+    # -----------------------------------------------------------------
+
+    def metricas(self) -> dict:
+        with self._lock:
+            mais_antigo = min((a[0] for a in self._mais_antigo if a), default=None)
+            return {
+                "profundidade": sum(self._pendentes),
+                "capacidade": self.capacidade,
+                "idade_mais_antigo_s": round(time.time() - mais_antigo, 3)
+                if mais_antigo
+                else 0.0,
+                "atraso_ultimo_lote_s": round(self.atraso_ultimo_lote_s, 3),
+                "processados_total": self.processados_total,
+                "lotes_total": self.lotes_total,
+                "erros_total": self.erros_total,
+                "rejeitados_total": self.rejeitados_total,
+                "descartados_total": self.descartados_total,
+                "particoes": list(self._pendentes),
+            }
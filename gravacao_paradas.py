@@ -0,0 +1,180 @@
+import logging
+from collections import namedtuple
+
+from consultas_paradas import (
+    SQL_ABRIR_OU_ATUALIZAR_AUTO_LOTE,
+    SQL_ABRIR_OU_ATUALIZAR_AUTO_LOTE_PARTICIONADA,
+    SQL_FECHAR_AUTO_LOTE,
+    SQL_GRAVAR_ESTADOS,
+    SQL_INSERIR_AUTO_FECHADAS,
+    SQL_INSERIR_EVENTOS_BRUTOS,
+    SQL_SOMAR_AGREGADOS,
+    SQL_TRAVAR_MAQUINAS,
+    evento_abertura,
+    evento_fechada_no_lote,
+    evento_fechamento,
+    eventos_agregados,
+    linhas_agregados,
+)
+from eventos_push import CANAL_PADRAO, payloads
+from maquina_estados import aberta_do_cache, pendencia_vencida, planejar_paradas
+
+# =====================================================================
+# GRAVAÇÃO DE UM PLANO DE PARADAS (app.py e app_async.py)
+# =====================================================================
+#
+# planejar_paradas() diz o que muda; aqui isso vira as instruções da
+# transação sem depender do driver. instrucoes_plano() é um gerador:
+# entrega Instrucao(sql, linhas, template, fetch, lote) e recebe de volta
+# (send) as linhas que a instrução retornou. Com lote=True o SQL tem
+# "VALUES %s" e `linhas` são as tuplas (execute_values do psycopg2,
+# executar_valores do app_async); com lote=False `linhas` são os
+# parâmetros de uma instrução só. Quem roda decide o commit; depois dele,
+# aplicar_gravado() atualiza o estado compartilhado.
+
+log = logging.getLogger("maroni.gravacao")
+
+Instrucao = namedtuple("Instrucao", "sql linhas template fetch lote", defaults=(None, False, True))
+
+SQL_NOTIFICAR = "SELECT pg_notify(%s, %s)"
+
+# Templates com casts: o asyncpg manda os parâmetros tipados pelo que o
+# servidor inferiu, e em VALUES dentro de CTE não há coluna de destino;
+# os floats do Python vão em colunas NUMERIC. O psycopg2 aceita os mesmos.
+TEMPLATE_FECHAR_AUTO = "(%s::text, %s::timestamp, %s::text, %s::float8)"
+TEMPLATE_AUTO_FECHADAS = "(%s, %s, 'AUTO', %s, %s, %s::float8)"
+TEMPLATE_ABRIR_AUTO = "(%s, %s, 'AUTO', %s, NULL, NULL)"
+TEMPLATE_ABRIR_AUTO_PARTICIONADA = "(%s::text, %s::text, %s::timestamp)"
+TEMPLATE_AGREGADOS = "(%s, %s, %s, %s, %s, %s::float8)"
+TEMPLATE_VISTOS = "(%s::text, %s::timestamp)"
+
+
+def muda_paradas(plano: dict) -> bool:
+    return bool(plano["para_fechar"] or plano["fechadas"] or plano["para_abrir"])
+
+
+def planejar_pendentes(cache_paradas, agora, threshold_minutos: float, oscilacao_s: float,
+                       dono=None):
+    """
+    Plano do que venceu sem chegar evento novo: paradas pendentes que já
+    passaram do threshold e fechamentos provisórios cuja janela de
+    oscilação acabou. dono(machine): só as máquinas deste processo.
+    (plano, anteriores) ou None se não havia nada.
+    """
+    anteriores = {
+        machine: entrada
+        for machine, entrada in cache_paradas.todas().items()
+        if (dono is None or dono(machine))
+        and pendencia_vencida(entrada, agora, threshold_minutos, oscilacao_s)
+    }
+    if not anteriores:
+        return None
+    plano = planejar_paradas(
+        {machine: [] for machine in anteriores},
+        {machine: aberta_do_cache(entrada) for machine, entrada in anteriores.items()},
+        threshold_minutos,
+        oscilacao_s,
+        agora,
+    )
+    return plano, anteriores
+
+
+def instrucoes_plano(plano: dict, resumo: dict, brutos=(), estados=(), push=None,
+                     particionada: bool = False, publicar: bool = True):
+    """
+    Gerador das instruções que gravam `plano`: no máximo três em lote nas
+    paradas (fechar as que estavam abertas, inserir as que abriram e
+    fecharam no meio do caminho, abrir/atualizar as que terminam abertas),
+    mais eventos_brutos, paradas_agregado, machine_states (só estadoLed
+    inteiro) e o NOTIFY de `push` (com publicar). Atualiza resumo
+    ("fechadas", "descartadas") e `push`; retorna as abertas gravadas.
+    """
+    planos = plano["planos"]
+    fechadas = plano["fechadas"]
+    push = push if push is not None else []
+
+    if brutos:
+        yield Instrucao(SQL_INSERIR_EVENTOS_BRUTOS, list(brutos))
+
+    if particionada and muda_paradas(plano):
+        yield Instrucao(SQL_TRAVAR_MAQUINAS, (sorted(planos),), lote=False)
+
+    para_agregar = [(m, r, inicio, dur) for m, r, inicio, _, dur in fechadas]
+    push.extend(evento_fechada_no_lote(*f) for f in fechadas)
+
+    if plano["para_fechar"]:
+        for linha in (yield Instrucao(
+            SQL_FECHAR_AUTO_LOTE, plano["para_fechar"], TEMPLATE_FECHAR_AUTO, fetch=True
+        )):
+            parada_id, machine, reason, start_time, duracao_min, descartada = linha
+            push.append(evento_fechamento(*linha))
+            if descartada:
+                resumo["descartadas"] += 1
+                log.info(
+                    "Parada AUTO id=%s DESCARTADA (%.2f min) para %s",
+                    parada_id, float(duracao_min), machine,
+                )
+            else:
+                resumo["fechadas"] += 1
+                para_agregar.append((machine, reason, start_time, duracao_min))
+                log.info(
+                    "Parada AUTO id=%s FECHADA para %s: %.2f min (%s)",
+                    parada_id, machine, float(duracao_min), reason,
+                )
+
+    if fechadas:
+        yield Instrucao(SQL_INSERIR_AUTO_FECHADAS, fechadas, TEMPLATE_AUTO_FECHADAS)
+
+    abertas_gravadas = []
+    if plano["para_abrir"] and particionada:
+        abertas_gravadas = yield Instrucao(
+            SQL_ABRIR_OU_ATUALIZAR_AUTO_LOTE_PARTICIONADA,
+            plano["para_abrir"],
+            TEMPLATE_ABRIR_AUTO_PARTICIONADA,
+            fetch=True,
+        )
+    elif plano["para_abrir"]:
+        abertas_gravadas = yield Instrucao(
+            SQL_ABRIR_OU_ATUALIZAR_AUTO_LOTE, plano["para_abrir"], TEMPLATE_ABRIR_AUTO, fetch=True
+        )
+
+    agregados = linhas_agregados(para_agregar)
+    if agregados:
+        yield Instrucao(SQL_SOMAR_AGREGADOS, agregados, TEMPLATE_AGREGADOS)
+
+    push.extend(evento_abertura(*linha) for linha in abertas_gravadas)
+    push.extend(eventos_agregados(para_agregar))
+
+    estados_led = [linha for linha in estados if isinstance(linha[1], int)]
+    if estados_led:
+        yield Instrucao(SQL_GRAVAR_ESTADOS, estados_led)
+
+    if publicar:
+        for payload in payloads(push):
+            yield Instrucao(SQL_NOTIFICAR, (CANAL_PADRAO, payload), lote=False)
+
+    return abertas_gravadas
+
+
+def aplicar_gravado(cache_paradas, estado_maquinas, filtro_duplicados, plano: dict,
+                    anteriores: dict, abertas_gravadas=(), estados=(), chaves=()) -> int:
+    """
+    Depois do commit: o cache fica igual à parada final de cada máquina,
+    os `estados` de LED passam a valer para todos os workers e as `chaves`
+    vão para o filtro de duplicados. Se a transação falhou, nada disso
+    muda e a nova tentativa ainda vê as mesmas mudanças. Retorna quantas
+    paradas abriram.
+    """
+    cache_paradas.aplicar_planos(plano["planos"], anteriores, abertas_gravadas)
+    for machine, estado, desde in estados:
+        estado_maquinas.definir(machine, estado, desde)
+    filtro_duplicados.lembrar(chaves)
+
+    abertas = 0
+    for machine, parada_id, reason, start_time, aberta_agora in abertas_gravadas:
+        if aberta_agora:
+            abertas += 1
+            log.info("Parada AUTO ABERTA para %s em %s, motivo=%s", machine, start_time, reason)
+        else:
+            log.info("Parada AUTO id=%s de %s agora com motivo %s.", parada_id, machine, reason)
+    return abertas
@@ -0,0 +1,237 @@
+import bisect
+import functools
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+import time
+from contextlib import contextmanager
+
+# =====================================================================
+# LOG COM NÍVEIS, SEM BLOQUEAR A REQUISIÇÃO
+# =====================================================================
+#
+# Quem loga só coloca o registro numa fila em memória; uma thread por
+# processo formata e escreve no stderr. Console lento (ou redirecionado
+# para arquivo/rede) não segura mais o /log.
+#
+#   log = logging.getLogger("maroni.algo")   # em qualquer módulo
+#   configurar_log("INFO")                   # uma vez, no app
+
+
+class _HandlerFila(logging.handlers.QueueHandler):
+    """QueueHandler que (re)cria o listener no processo atual (fork do gunicorn)."""
+
+    def __init__(self, destino: logging.Handler):
+        super().__init__(queue.SimpleQueue())
+        self._destino = destino
+        self._listener = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _garantir_listener(self):
+        if self._pid == os.getpid():
+            return
+        with self._lock:
+            if self._pid == os.getpid():
+                return
+            # A fila herdada do pai pode ter registros que a thread dele não
+            # escreveu; começa com uma nova
+            self.queue = queue.SimpleQueue()
+            self._listener = logging.handlers.QueueListener(self.queue, self._destino)
+            self._listener.start()
+            self._pid = os.getpid()
+
+    def enqueue(self, record):
+        self._garantir_listener()
+        super().enqueue(record)
+
+    def parar(self):
+        if self._listener is not None and self._pid == os.getpid():
+            self._listener.stop()
+            self._pid = None
+
+
+def configurar_log(nivel: str = "INFO", nome: str = "maroni") -> logging.Logger:
+    log = logging.getLogger(nome)
+    log.setLevel(getattr(logging, nivel.upper(), logging.INFO))
+    log.propagate = False
+    if not any(isinstance(h, _HandlerFila) for h in log.handlers):
+        destino = logging.StreamHandler(sys.stderr)
+        destino.setFormatter(
+            logging.Formatter("%(asctime)s [%(levelname)s] %(name)s: %(message)s")
+        )
+        log.addHandler(_HandlerFila(destino))
+    return log
+
+
+def parar_log(nome: str = "maroni"):
+    """Escreve o que ainda está na fila (chamar no encerramento)."""
+    for h in logging.getLogger(nome).handlers:
+        if isinstance(h, _HandlerFila):
+            h.parar()
+
+
+# =====================================================================
+# MÉTRICAS (contadores, gauges e histogramas) NO FORMATO PROMETHEUS
+# =====================================================================
+#
+# Cada processo acumula as suas em memória (só um lock e somas na hora de
+# registrar). snapshot() vira JSON para ser publicado no estado
+# compartilhado; combinar() soma os snapshots de todos os workers e
+# renderizar() gera o texto servido no /metrics.
+
+BUCKETS_PADRAO = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def _chave(rotulos: dict) -> tuple:
+    return tuple(sorted((k, str(v)) for k, v in rotulos.items()))
+
+
+class Metricas:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._definicoes = {}  # nome -> (tipo, ajuda, buckets)
+        self._series = {}  # nome -> {chave_rotulos: valor | [contagens, soma, qtd]}
+
+    # -----------------------------------------------------------------
+    # DEFINIÇÃO
+    # -----------------------------------------------------------------
+
+    def contador(self, nome: str, ajuda: str):
+        self._definir(nome, "counter", ajuda)
+
+    def gauge(self, nome: str, ajuda: str):
+        self._definir(nome, "gauge", ajuda)
+
+    def histograma(self, nome: str, ajuda: str, buckets=BUCKETS_PADRAO):
+        self._definir(nome, "histogram", ajuda, tuple(buckets))
+
+    def _definir(self, nome, tipo, ajuda, buckets=None):
+        with self._lock:
+            self._definicoes[nome] = (tipo, ajuda, buckets)
+            self._series.setdefault(nome, {})
+
+    # -----------------------------------------------------------------
+    # REGISTRO
+    # -----------------------------------------------------------------
+
+    def incrementar(self, nome: str, valor: float = 1, **rotulos):
+        chave = _chave(rotulos)
+        with self._lock:
+            series = self._series[nome]
+            series[chave] = series.get(chave, 0) + valor
+
+    def definir(self, nome: str, valor: float, **rotulos):
+        with self._lock:
+            self._series[nome][_chave(rotulos)] = valor
+
+    def observar(self, nome: str, valor: float, **rotulos):
+        buckets = self._definicoes[nome][2]
+        i = bisect.bisect_left(buckets, valor)
+        chave = _chave(rotulos)
+        with self._lock:
+            series = self._series[nome]
+            h = series.get(chave)
+            if h is None:
+                h = series[chave] = [[0] * (len(buckets) + 1), 0.0, 0]
+            h[0][i] += 1
+            h[1] += valor
+            h[2] += 1
+
+    @contextmanager
+    def cronometrar(self, nome: str, **rotulos):
+        inicio = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observar(nome, time.perf_counter() - inicio, **rotulos)
+
+    def medir(self, nome: str, **rotulos):
+        """Decorador: observa no histograma `nome` a duração de cada chamada."""
+        def decorador(func):
+            @functools.wraps(func)
+            def medida(*args, **kwargs):
+                with self.cronometrar(nome, **rotulos):
+                    return func(*args, **kwargs)
+            return medida
+        return decorador
+
+    # -----------------------------------------------------------------
+    # EXPORTAÇÃO
+    # -----------------------------------------------------------------
+
+    def snapshot(self) -> dict:
+        """{nome: {tipo, ajuda, buckets, series: [[rotulos, valor], ...]}} (JSON)."""
+        with self._lock:
+            return {
+                nome: {
+                    "tipo": tipo,
+                    "ajuda": ajuda,
+                    "buckets": list(buckets) if buckets else None,
+                    "series": [
+                        [dict(chave), [list(v[0]), v[1], v[2]] if tipo == "histogram" else v]
+                        for chave, v in self._series[nome].items()
+                    ],
+                }
+                for nome, (tipo, ajuda, buckets) in self._definicoes.items()
+            }
+
+
+def combinar(snapshots: list) -> dict:
+    """Soma séries iguais de vários processos (gauges também: pool, fila...)."""
+    total = {}
+    for snap in snapshots:
+        for nome, m in snap.items():
+            destino = total.setdefault(nome, {**m, "series": {}})
+            for rotulos, valor in m["series"]:
+                chave = _chave(rotulos)
+                atual = destino["series"].get(chave)
+                if atual is None:
+                    destino["series"][chave] = (
+                        [list(valor[0]), valor[1], valor[2]] if m["tipo"] == "histogram" else valor
+                    )
+                elif m["tipo"] == "histogram":
+                    atual[0] = [a + b for a, b in zip(atual[0], valor[0])]
+                    atual[1] += valor[1]
+                    atual[2] += valor[2]
+                else:
+                    destino["series"][chave] = atual + valor
+    return total
+
+
+def _rotulos_texto(chave: tuple, extra: tuple = ()) -> str:
+    pares = chave + extra
+    if not pares:
+        return ""
+    escapar = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{escapar(v)}"' for k, v in pares) + "}"
+
+
+def _numero(v) -> str:
+    return repr(float(v)) if isinstance(v, float) else str(v)
+
+
+def renderizar(combinado: dict) -> str:
+    """Formato texto de exposição do Prometheus (versão 0.0.4)."""
+    linhas = []
+    for nome in sorted(combinado):
+        m = combinado[nome]
+        linhas.append(f"# HELP {nome} {m['ajuda']}")
+        linhas.append(f"# TYPE {nome} {m['tipo']}")
+        for chave in sorted(m["series"]):
+            valor = m["series"][chave]
+            if m["tipo"] != "histogram":
+                linhas.append(f"{nome}{_rotulos_texto(chave)} {_numero(valor)}")
+                continue
+            contagens, soma, qtd = valor
+            acumulado = 0
+            for limite, n in zip(list(m["buckets"]) + ["+Inf"], contagens):
+                acumulado += n
+                le = limite if limite == "+Inf" else repr(float(limite))
+                linhas.append(f"{nome}_bucket{_rotulos_texto(chave, (('le', le),))} {acumulado}")
+            linhas.append(f"{nome}_sum{_rotulos_texto(chave)} {_numero(float(soma))}")
+            linhas.append(f"{nome}_count{_rotulos_texto(chave)} {qtd}")
+    return "\n".join(linhas) + "\n"
@@ -0,0 +1,181 @@
+from datetime import datetime
+
+# =====================================================================
+# LINHA DO TEMPO (GANTT) RODANDO / PARADA / DESLIGADA POR MÁQUINA
+# =====================================================================
+#
+# O intervalo pedido é dividido em `largura` baldes iguais (um por pixel
+# da barra) e toda a conta de intervalos fica numa única query, como em
+# analise_paradas.py:
+#   - paradas (abertas contam até "agora") recortadas em [desde, ate);
+#     tempo parado sai da união das paradas da mesma máquina (AUTO +
+#     MANUAL sobrepostas não contam duas vezes), o motivo dominante do
+#     balde sai do tempo de cada motivo;
+#   - desligada = trechos com estadoLed 2 em eventos_brutos (o último
+#     evento antes de `desde` dá o estado inicial). Sem EVENTOS_BRUTOS não
+#     há OFF, só RUN/STOP;
+#   - cada intervalo é espalhado só pelos baldes que ele toca
+#     (generate_series entre o primeiro e o último) e recortado nas
+#     bordas deles — o custo é proporcional a intervalos × baldes tocados.
+# Em Python só sobra juntar baldes vizinhos iguais em trechos.
+
+ESTADOS = ("RUN", "STOP", "OFF")
+
+SQL_LINHA_DO_TEMPO = """
+    WITH p AS (
+        SELECT machine, reason,
+               GREATEST(start_time, %(desde)s) AS ini,
+               LEAST(COALESCE(end_time, %(agora)s), %(ate)s) AS fim
+        FROM paradas
+        WHERE start_time < %(ate)s
+          AND COALESCE(end_time, 'infinity'::timestamp) > %(desde)s
+          AND machine = ANY(%(maquinas)s::text[])
+    ),
+    marcadas AS (
+        SELECT machine, ini, fim,
+               CASE WHEN ini <= MAX(fim) OVER (
+                        PARTITION BY machine ORDER BY ini, fim
+                        ROWS BETWEEN UNBOUNDED PRECEDING AND 1 PRECEDING)
+                    THEN 0 ELSE 1 END AS nova_ilha
+        FROM p
+        WHERE fim > ini
+    ),
+    ilhas AS (
+        SELECT machine, ini, fim,
+               SUM(nova_ilha) OVER (PARTITION BY machine ORDER BY ini, fim) AS ilha
+        FROM marcadas
+    ),
+    unidas AS (
+        SELECT machine, MIN(ini) AS ini, MAX(fim) AS fim
+        FROM ilhas
+        GROUP BY machine, ilha
+    ),
+    eventos AS (
+        SELECT e.*
+        FROM unnest(%(maquinas)s::text[]) AS m (machine)
+        CROSS JOIN LATERAL (
+            (SELECT machine, data_hora, ts_ms, id, estado_led
+             FROM eventos_brutos
+             WHERE machine = m.machine AND data_hora < %(desde)s
+             ORDER BY data_hora DESC, ts_ms DESC, id DESC
+             LIMIT 1)
+            UNION ALL
+            (SELECT machine, data_hora, ts_ms, id, estado_led
+             FROM eventos_brutos
+             WHERE machine = m.machine AND data_hora >= %(desde)s AND data_hora < %(ate)s)
+        ) e
+    ),
+    trechos_led AS (
+        SELECT machine, estado_led, data_hora AS ini,
+               LEAD(data_hora) OVER (PARTITION BY machine ORDER BY data_hora, ts_ms, id) AS prox
+        FROM eventos
+    ),
+    desligada AS (
+        SELECT machine,
+               GREATEST(ini, %(desde)s) AS ini,
+               LEAST(COALESCE(prox, %(agora)s), %(ate)s) AS fim
+        FROM trechos_led
+        WHERE estado_led = 2
+    ),
+    intervalos (machine, reason, tipo, ini, fim) AS (
+        SELECT machine, reason, 0, ini, fim FROM p              -- tempo de cada motivo
+        UNION ALL SELECT machine, NULL, 1, ini, fim FROM unidas -- tempo parado
+        UNION ALL SELECT machine, NULL, 2, ini, fim FROM desligada
+    ),
+    por_balde AS (
+        SELECT i.machine, i.reason, i.tipo, b AS balde,
+               EXTRACT(EPOCH FROM
+                   LEAST(i.fim, %(desde)s + (b + 1) * %(passo_s)s * INTERVAL '1 second')
+                   - GREATEST(i.ini, %(desde)s + b * %(passo_s)s * INTERVAL '1 second')
+               ) AS s
+        FROM intervalos i
+        CROSS JOIN LATERAL generate_series(
+            GREATEST(0, FLOOR(EXTRACT(EPOCH FROM i.ini - %(desde)s) / %(passo_s)s)::int),
+            LEAST(%(largura)s - 1, CEIL(EXTRACT(EPOCH FROM i.fim - %(desde)s) / %(passo_s)s)::int - 1)
+        ) AS b
+        WHERE i.fim > i.ini
+    ),
+    dominante AS (
+        SELECT DISTINCT ON (machine, balde) machine, balde, reason
+        FROM (
+            SELECT machine, balde, reason, SUM(s) AS s
+            FROM por_balde
+            WHERE tipo = 0
+            GROUP BY machine, balde, reason
+        ) m
+        ORDER BY machine, balde, s DESC, reason
+    ),
+    tempos AS (
+        SELECT machine, balde,
+               COALESCE(SUM(s) FILTER (WHERE tipo = 1), 0) AS parado,
+               COALESCE(SUM(s) FILTER (WHERE tipo = 2), 0) AS desligado
+        FROM por_balde
+        GROUP BY machine, balde
+    )
+    SELECT t.machine, t.balde, t.parado, t.desligado, d.reason
+    FROM tempos t
+    LEFT JOIN dominante d ON d.machine = t.machine AND d.balde = t.balde
+"""
+
+
+def calcular_linha_do_tempo(cur, desde: datetime, ate: datetime, largura: int, agora: datetime,
+                            maquinas: list) -> dict:
+    """
+    {"passo_s": s, "maquinas": {machine: {"trechos": [...], ...}}}.
+    Cada trecho é [balde_inicial, baldes, estado, motivo, fração_parada]
+    com estado RUN/STOP/OFF (None = futuro) — baldes vizinhos iguais já
+    vêm juntos.
+    """
+    passo_s = (ate - desde).total_seconds() / largura
+    cur.execute(
+        SQL_LINHA_DO_TEMPO,
+        {
+            "desde": desde,
+            "ate": ate,
+            "agora": agora,
+            "maquinas": list(maquinas),
+            "largura": largura,
+            "passo_s": passo_s,
+        },
+    )
+    baldes = {}
+    for machine, balde, parado, desligado, reason in cur.fetchall():
+        baldes.setdefault(machine, {})[balde] = (float(parado), float(desligado), reason)
+
+    # Tempo de cada balde até agora (balde futuro não conta)
+    decorridos = [
+        max(0.0, min(passo_s, (agora - desde).total_seconds() - i * passo_s))
+        for i in range(largura)
+    ]
+
+    resultado = {}
+    for machine in maquinas:
+        do_balde = baldes.get(machine, {})
+        trechos = []
+        soma_parado = soma_desligado = 0.0
+        for i, decorrido in enumerate(decorridos):
+            parado, desligado, motivo = do_balde.get(i, (0.0, 0.0, None))
+            soma_parado += parado
+            soma_desligado += desligado
+            if decorrido <= 0:
+                chave = (None, None, None)
+            else:
+                fracao_parada = min(1.0, parado / decorrido)
+                fracao_desligada = min(1.0 - fracao_parada, desligado / decorrido)
+                fracoes = (1.0 - fracao_parada - fracao_desligada, fracao_parada, fracao_desligada)
+                # Empate: STOP > OFF > RUN
+                estado = max((1, 2, 0), key=lambda e: fracoes[e])
+                chave = (ESTADOS[estado], motivo, round(fracao_parada, 2))
+            if trechos and tuple(trechos[-1][2:]) == chave:
+                trechos[-1][1] += 1
+            else:
+                trechos.append([i, 1, *chave])
+        total = sum(decorridos)
+        resultado[machine] = {
+            "trechos": trechos,
+            "minutos_parada": round(soma_parado / 60.0, 2),
+            "minutos_desligada": round(soma_desligado / 60.0, 2),
+            "fracao_parada": round(soma_parado / total, 4) if total else None,
+        }
+
+    return {"passo_s": round(passo_s, 3), "maquinas": resultado}
@@ -0,0 +1,393 @@
+import logging
+import os
+from datetime import datetime, timedelta
+
+# =====================================================================
+# MÁQUINA DE ESTADOS DAS PARADAS AUTO (sem banco, sem Flask)
+# =====================================================================
+#
+# Regras puras usadas pelo /log (app.processar_eventos), pelo replay do
+# arquivo e pelo reprocessamento em paralelo (reprocessamento.py, que roda
+# em processos separados e não pode importar o app).
+
+log = logging.getLogger("maroni.estados")
+
+# Menor duração (min) para uma parada AUTO ser gravada; abaixo disso é
+# descartada ao fechar.
+THRESHOLD_DESCARTE_MIN = 0.1
+
+# Máquina assumida quando o log chega sem "machine" (firmware antigo)
+MAQUINA_PADRAO = os.environ.get("MAQUINA_PADRAO", "Máquina 01")
+
+
+# =====================================================================
+# MAPA DE MOTIVOS (do Arduino → texto humano)
+# =====================================================================
+
+MOTIVO_MAP = {
+    "SETUP": "Setup",
+    "MATERIAL": "Falta de Material",
+    "MANUTENCAO": "Manutenção",
+    "ALMOCO": "Almoço/Intervalo",
+    "ALMOÇO": "Almoço/Intervalo",
+    "SEM_MOTIVO": "Sem motivo",
+    "NONE": "Sem motivo",
+    "SEM_COMUNICACAO": "Sem comunicação",
+}
+
+# Eventos gerados pelo servidor (vigia_comunicacao.py), não pelo Arduino:
+# a máquina parou de falar / voltou a falar só com heartbeat
+TIPO_SEM_COMUNICACAO = "SEM_COMUNICACAO"
+TIPO_RECONEXAO = "RECONEXAO"
+MOTIVO_SEM_COMUNICACAO = MOTIVO_MAP["SEM_COMUNICACAO"]
+
+
+def evento_servidor(machine: str, tipo: str, estado_led: int, data_hora: str, ts_ms: int) -> dict:
+    """Log no formato do Arduino para um evento gerado pelo servidor."""
+    return {
+        "machine": machine,
+        "tipo": tipo,
+        "estadoLed": estado_led,
+        "motivo": "NONE",
+        "data_hora": data_hora,
+        "ts_ms": ts_ms,
+        "origem": "servidor",
+    }
+
+
+def evento_sem_comunicacao(machine: str, registro: dict) -> dict:
+    """
+    Evento do vigia quando a máquina silencia (registro: último sinal
+    dela). ts_ms + 1: fica depois do último log na ordem.
+    """
+    return evento_servidor(
+        machine, TIPO_SEM_COMUNICACAO, 1, registro["data_hora"], registro["ts_ms"] + 1
+    )
+
+
+def eventos_reconexao(reconectadas) -> list:
+    """reconectadas: (machine, estado, data_hora, ts_ms) de VigiaComunicacao.sinalizar()."""
+    return [
+        evento_servidor(machine, TIPO_RECONEXAO, estado, data_hora, ts_ms)
+        for machine, estado, data_hora, ts_ms in reconectadas
+    ]
+
+
+def traduz_motivo_bruto(motivo_bruto: str) -> str:
+    if not motivo_bruto:
+        return "Sem motivo"
+    motivo_bruto = motivo_bruto.upper()
+    return MOTIVO_MAP.get(motivo_bruto, motivo_bruto)
+
+
+# =====================================================================
+# EVENTOS → PARADAS
+# =====================================================================
+
+def obter_agora_do_log(dado: dict) -> datetime:
+    """
+    Tenta usar data_hora enviada pelo Arduino.
+    Formato esperado: 'YYYY-MM-DD HH:MM:SS' (hora local Brasil).
+    Se não vier ou der erro, cai num fallback.
+    """
+    s = dado.get("data_hora")
+    if s:
+        try:
+            # Hora local que o Arduino já calculou via NTP
+            return datetime.strptime(s, "%Y-%m-%d %H:%M:%S")
+        except Exception as e:
+            log.warning("data_hora inválido no log, usando fallback: %s (%s)", s, e)
+
+    # Fallback: UTC-3 (aprox. Belém), coerente com ajuste do Arduino
+    return datetime.utcnow() - timedelta(hours=3)
+
+
+# Limites das colunas (machine VARCHAR(50), reason VARCHAR(100),
+# estado_led SMALLINT, ts_ms BIGINT): o que passa daqui não pode falhar no
+# INSERT — com a fila de escrita o /log já respondeu 202.
+MAQUINA_MAX = 50
+MOTIVO_MAX = 100
+ESTADO_LED_MAX = 32767
+TS_MS_MAX = 2 ** 63 - 1
+
+
+def ler_ts_ms(valor) -> int:
+    try:
+        return int(valor or 0)
+    except (ValueError, TypeError, OverflowError):
+        return 0
+
+
+def validar_evento(dado) -> str:
+    """Motivo pelo qual o log não pode ser aplicado, ou None se está ok."""
+    if not isinstance(dado, dict):
+        return "evento deve ser um objeto JSON"
+    machine = dado.get("machine")
+    if machine is not None and not isinstance(machine, str):
+        return "machine deve ser texto"
+    if machine and len(machine) > MAQUINA_MAX:
+        return f"machine com mais de {MAQUINA_MAX} caracteres"
+    for campo in ("tipo", "motivo", "data_hora"):
+        if dado.get(campo) is not None and not isinstance(dado[campo], str):
+            return f"{campo} deve ser texto"
+    if len(dado.get("motivo") or "") > MOTIVO_MAX:
+        return f"motivo com mais de {MOTIVO_MAX} caracteres"
+    estado_led = dado.get("estadoLed")
+    if isinstance(estado_led, bool) or not isinstance(estado_led, (int, str, type(None))):
+        return "estadoLed deve ser inteiro"
+    if isinstance(estado_led, int) and abs(estado_led) > ESTADO_LED_MAX:
+        return "estadoLed fora do intervalo"
+    if abs(ler_ts_ms(dado.get("ts_ms"))) > TS_MS_MAX:
+        return "ts_ms fora do intervalo"
+    return None
+
+
+def interpretar_evento(dado: dict):
+    """
+    Normaliza um log do Arduino para a máquina de estados.
+    Retorna None se o log não tiver estadoLed (não conta para paradas).
+    """
+    estado_led = dado.get("estadoLed")
+    if estado_led is None:
+        return None
+
+    ts_ms = ler_ts_ms(dado.get("ts_ms"))
+
+    return {
+        "machine": dado.get("machine") or MAQUINA_PADRAO,
+        "tipo": (dado.get("tipo") or "").upper(),
+        "motivo_bruto": (dado.get("motivo") or "NONE").upper(),
+        "estado_led": estado_led,
+        "agora": obter_agora_do_log(dado),
+        "ts_ms": ts_ms,
+    }
+
+
+def _fechar(plano: dict, machine: str, aberta: dict, fim: datetime, threshold_minutos: float):
+    """Fecha `aberta` em `fim` no plano: UPDATE se está no banco, senão INSERT fechada ou descarte."""
+    if aberta["persistida"]:
+        plano["fechar"] = (fim, aberta["reason"])
+        return
+    duracao_min = (fim - aberta["start_time"]).total_seconds() / 60.0
+    if duracao_min >= threshold_minutos:
+        plano["fechadas"].append((machine, aberta["reason"], aberta["start_time"], fim, duracao_min))
+    else:
+        plano["descartadas"] += 1
+        log.info("Parada AUTO DESCARTADA (%.2f min) para %s", duracao_min, machine)
+
+
+def reduzir_eventos_maquina(machine: str, eventos: list, aberta, threshold_minutos: float,
+                            janela_s: float = 0.0):
+    """
+    Aplica em memória, na ordem, os eventos de UMA máquina à parada AUTO que
+    já estava aberta (`aberta`, ou None) e devolve só o efeito líquido a
+    gravar:
+      - "fechar":    (fim, reason) para fechar a parada que já estava no banco
+      - "fechadas":  paradas que abriram e fecharam sem chegar ao banco
+      - "descartadas": quantas dessas ficaram abaixo do threshold
+      - "final":     parada que termina aberta ({reason, start_time,
+                     persistida, alterada, id, fim}) ou None
+
+    Regras (as mesmas de sempre):
+      LED 0/2 → fecha a parada aberta (descarta se < threshold_minutos)
+      LED 1   → abre "Sem motivo" se não houver; log MOTIVO troca o motivo
+    e as de comunicação:
+      SEM_COMUNICACAO → abre "Sem comunicação" se não houver parada aberta
+      qualquer outro evento fecha a "Sem comunicação" antes de ser aplicado
+
+    Com janela_s > 0, LED 0/2 só marca o fechamento ("fim"): se o LED 1
+    voltar em até janela_s segundos, a parada continua (a oscilação vira
+    uma parada só); senão fecha em "fim". Quem fecha de vez quando não
+    chega mais evento é maturar_plano().
+    """
+    plano = {"fechar": None, "fechadas": [], "descartadas": 0, "final": None}
+
+    for ev in eventos:
+        estado_led = ev["estado_led"]
+
+        # Fechamento provisório cuja janela passou: fecha de vez em "fim"
+        if (
+            aberta is not None
+            and aberta.get("fim") is not None
+            and (ev["agora"] - aberta["fim"]).total_seconds() > janela_s
+        ):
+            _fechar(plano, machine, aberta, aberta["fim"], threshold_minutos)
+            aberta = None
+
+        if ev["tipo"] == TIPO_SEM_COMUNICACAO:
+            if aberta is not None and aberta.get("fim") is not None:
+                _fechar(plano, machine, aberta, aberta["fim"], threshold_minutos)
+                aberta = None
+            if aberta is None:
+                aberta = {
+                    "reason": MOTIVO_SEM_COMUNICACAO,
+                    "start_time": ev["agora"],
+                    "persistida": False,
+                    "alterada": True,
+                }
+            continue
+
+        if aberta is not None and aberta["reason"] == MOTIVO_SEM_COMUNICACAO:
+            _fechar(plano, machine, aberta, ev["agora"], threshold_minutos)
+            aberta = None
+
+        if estado_led in (0, 2):
+            if aberta is None:
+                continue
+            if janela_s <= 0:
+                _fechar(plano, machine, aberta, ev["agora"], threshold_minutos)
+                aberta = None
+            elif aberta.get("fim") is None:
+                aberta["fim"] = ev["agora"]
+
+        elif estado_led == 1:
+            eh_motivo = ev["tipo"] == "MOTIVO"
+            if aberta is None:
+                aberta = {
+                    "reason": traduz_motivo_bruto(ev["motivo_bruto"] if eh_motivo else "NONE"),
+                    "start_time": ev["agora"],
+                    "persistida": False,
+                    "alterada": True,
+                }
+                continue
+            aberta["fim"] = None  # voltou dentro da janela: a mesma parada continua
+            if eh_motivo:
+                novo = traduz_motivo_bruto(ev["motivo_bruto"])
+                if novo != aberta["reason"]:
+                    aberta["reason"] = novo
+                    aberta["alterada"] = True
+
+        else:
+            log.warning("estadoLed inesperado: %s. Ignorando para contagem.", estado_led)
+
+    plano["final"] = aberta
+    return plano
+
+
+def maturar_plano(machine: str, plano: dict, threshold_minutos: float, janela_s: float = 0.0,
+                  agora: datetime = None) -> dict:
+    """
+    Fecha de vez a parada final em fechamento provisório cuja janela já
+    venceu em `agora`. agora=None é o fim do histórico (reprocessamento):
+    fecha sempre.
+    """
+    final = plano["final"]
+    if final is None or final.get("fim") is None:
+        return plano
+    if agora is not None and (agora - final["fim"]).total_seconds() <= janela_s:
+        return plano
+    _fechar(plano, machine, final, final["fim"], threshold_minutos)
+    plano["final"] = None
+    return plano
+
+
+# =====================================================================
+# LOTE DE LOGS → PLANO DE ESCRITA (compartilhado por app.py e app_async.py)
+# =====================================================================
+
+def agrupar_eventos(dados: list):
+    """
+    Normaliza os logs, ordena por data_hora (ts_ms desempata) e separa por
+    máquina. Retorna (eventos, por_maquina, ignorados).
+    """
+    eventos = []
+    ignorados = 0
+    for dado in dados:
+        ev = interpretar_evento(dado)
+        if ev is None:
+            ignorados += 1
+            continue
+        eventos.append(ev)
+
+    # sort é estável: mesma data_hora e ts_ms mantém a ordem de chegada
+    eventos.sort(key=lambda ev: (ev["agora"], ev["ts_ms"]))
+    return eventos, separar_por_maquina(eventos), ignorados
+
+
+def separar_por_maquina(eventos: list) -> dict:
+    """machine → eventos dela, na ordem de `eventos`."""
+    por_maquina = {}
+    for ev in eventos:
+        por_maquina.setdefault(ev["machine"], []).append(ev)
+    return por_maquina
+
+
+def aberta_do_cache(entrada):
+    """
+    Entrada do CacheParadasAbertas ({id, reason, start_time, fim}) →
+    `aberta` do redutor. id None = parada pendente, ainda não gravada.
+    """
+    if not entrada:
+        return None
+    persistida = entrada.get("id") is not None
+    fim = entrada.get("fim")
+    return {
+        "id": entrada.get("id"),
+        "reason": entrada["reason"],
+        "start_time": datetime.fromisoformat(entrada["start_time"]),
+        "persistida": persistida,
+        "alterada": not persistida,
+        "fim": datetime.fromisoformat(fim) if fim else None,
+    }
+
+
+def pendencia_vencida(entrada, agora: datetime, threshold_minutos: float, janela_s: float) -> bool:
+    """
+    A entrada do cache precisa ir ao banco sem esperar evento: parada
+    pendente que já passou do threshold, ou fechamento provisório cuja
+    janela venceu.
+    """
+    if not entrada:
+        return False
+    if entrada.get("fim"):
+        return (agora - datetime.fromisoformat(entrada["fim"])).total_seconds() > janela_s
+    if entrada.get("id") is None:
+        inicio = datetime.fromisoformat(entrada["start_time"])
+        return (agora - inicio).total_seconds() / 60.0 >= threshold_minutos
+    return False
+
+
+def planejar_paradas(por_maquina: dict, abertas: dict, threshold_minutos: float,
+                     janela_s: float = 0.0, agora: datetime = None) -> dict:
+    """
+    Reduz os eventos de cada máquina (abertas: machine → `aberta` ou None)
+    e junta o efeito em lotes prontos para o banco:
+      para_fechar: (machine, fim, reason, threshold)
+      fechadas:    (machine, reason, start_time, end_time, duração)
+      para_abrir:  (machine, reason, start_time)
+
+    Com `agora` (o /log), a parada nova só vai para para_abrir depois de
+    durar threshold_minutos: antes disso fica pendente (só no cache), e se
+    fechar nesse meio tempo é descartada sem ter tocado no banco.
+    """
+    planos = {}
+    for machine, evs in por_maquina.items():
+        plano = reduzir_eventos_maquina(machine, evs, abertas.get(machine), threshold_minutos, janela_s)
+        if agora is not None:
+            maturar_plano(machine, plano, threshold_minutos, janela_s, agora)
+        planos[machine] = plano
+
+    def gravar_aberta(final) -> bool:
+        if not final or not final["alterada"]:
+            return False
+        if final["persistida"] or agora is None:
+            return True
+        if final.get("fim") is not None:
+            return False  # pendente fechando: ou volta (e segue pendente) ou vira fechada
+        return (agora - final["start_time"]).total_seconds() / 60.0 >= threshold_minutos
+
+    return {
+        "planos": planos,
+        "para_fechar": [
+            (m, p["fechar"][0], p["fechar"][1], threshold_minutos)
+            for m, p in planos.items()
+            if p["fechar"]
+        ],
+        "fechadas": [f for p in planos.values() for f in p["fechadas"]],
+        "para_abrir": [
+            (m, p["final"]["reason"], p["final"]["start_time"])
+            for m, p in planos.items()
+            if gravar_aberta(p["final"])
+        ],
+        "descartadas": sum(p["descartadas"] for p in planos.values()),
+    }
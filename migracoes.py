@@ -0,0 +1,415 @@
+import argparse
+from datetime import datetime
+
+import psycopg2
+
+# =====================================================================
+# MIGRAÇÕES DO SCHEMA (tabela paradas e auxiliares)
+# =====================================================================
+#
+# Cada migração roda uma única vez e fica registrada em schema_migracoes.
+# Todas usam IF NOT EXISTS, então bancos criados pelo cria_admin.py antigo
+# são apenas "marcados" na primeira execução.
+#
+#   py migracoes.py                 -> aplica as pendentes
+#   py migracoes.py --particionar   -> + converte paradas para partições
+#                                      mensais por start_time
+#   py migracoes.py --particoes 3   -> garante partições até 3 meses à frente
+
+PG_HOST = "localhost"
+PG_PORT = "5432"
+PG_USER = "postgres"
+PG_PASSWORD = "admin"
+PG_DB = "arduino_logs"
+
+
+def _m001_tabelas_base(cur):
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS paradas (
+        id               SERIAL PRIMARY KEY,
+        machine          VARCHAR(50) NOT NULL,
+        reason           VARCHAR(100) NOT NULL,
+        origem           VARCHAR(20) NOT NULL,
+        start_time       TIMESTAMP NOT NULL,
+        end_time         TIMESTAMP,
+        duration_minutes NUMERIC(10,2),
+        created_at       TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """)
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS users (
+        id            SERIAL PRIMARY KEY,
+        username      VARCHAR(50) UNIQUE NOT NULL,
+        password_hash TEXT NOT NULL,
+        nome          VARCHAR(100),
+        created_at    TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """)
+
+
+def _m002_parada_auto_aberta(cur):
+    # No máximo UMA parada AUTO aberta por máquina. É o alvo do
+    # INSERT ... ON CONFLICT usado pelo /log para abrir/atualizar paradas,
+    # e o índice parcial (minúsculo) das buscas "parada aberta da máquina".
+    # (Se já houver duplicadas abertas no banco, feche-as antes de rodar.)
+    cur.execute("""
+    CREATE UNIQUE INDEX IF NOT EXISTS ux_paradas_auto_aberta
+        ON paradas (machine)
+        WHERE origem = 'AUTO' AND end_time IS NULL;
+    """)
+
+
+def _m003_indices_historico(cur):
+    # Histórico paginado por (start_time, id) — /ultimos e /api/historico.
+    # Um índice geral e um por filtro mais comum (máquina, motivo).
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS ix_paradas_start_id
+        ON paradas (start_time DESC, id DESC);
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS ix_paradas_machine_start_id
+        ON paradas (machine, start_time DESC, id DESC);
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS ix_paradas_reason_start_id
+        ON paradas (reason, start_time DESC, id DESC);
+    """)
+
+
+def _m004_paradas_agregado(cur):
+    # Somas por hora/dia, máquina e motivo das paradas FECHADAS, mantidas
+    # pelo app.py a cada parada fechada/registrada (dashboard /api/data).
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS paradas_agregado (
+        granularidade VARCHAR(4) NOT NULL,      -- 'hora' | 'dia'
+        bucket        TIMESTAMP NOT NULL,
+        machine       VARCHAR(50) NOT NULL,
+        reason        VARCHAR(100) NOT NULL,
+        qtd           INTEGER NOT NULL DEFAULT 0,
+        minutos       NUMERIC(14,2) NOT NULL DEFAULT 0,
+        PRIMARY KEY (granularidade, bucket, machine, reason)
+    );
+    """)
+
+    # Primeira criação: preenche a partir do histórico já existente
+    cur.execute("SELECT EXISTS (SELECT 1 FROM paradas_agregado)")
+    if not cur.fetchone()[0]:
+        reconstruir_agregados(cur)
+
+
+def _m005_eventos_brutos(cur):
+    # Todo evento com estadoLed que passa pelo processar_eventos() do app,
+    # gravado na mesma transação das paradas. É a fonte do reprocessamento
+    # (reprocessamento.py), lido por máquina em ordem de data_hora.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS eventos_brutos (
+        id          BIGSERIAL PRIMARY KEY,
+        machine     VARCHAR(50) NOT NULL,
+        data_hora   TIMESTAMP NOT NULL,
+        ts_ms       BIGINT NOT NULL DEFAULT 0,
+        tipo        TEXT NOT NULL DEFAULT '',
+        estado_led  SMALLINT NOT NULL,
+        motivo      TEXT NOT NULL DEFAULT 'NONE',
+        recebido_em TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS ix_eventos_brutos_machine_ordem
+        ON eventos_brutos (machine, data_hora, ts_ms, id);
+    """)
+
+
+def _m006_indice_fim(cur):
+    # Junto com ix_paradas_start_id, acha as paradas que encostam num
+    # intervalo (start_time < ate AND fim > desde) — /api/analytics.
+    # Parada aberta entra como fim = infinity.
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS ix_paradas_fim
+        ON paradas ((COALESCE(end_time, 'infinity'::timestamp)));
+    """)
+
+
+def _m007_machines(cur):
+    # Cadastro de máquinas (cadastro_maquinas.py). turnos no formato da
+    # variável TURNOS; NULL = turnos padrão do app. atualizado_em só muda
+    # quando o cadastro muda (last_seen não conta): é por ele que os
+    # workers recarregam só o que mudou.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS machines (
+        machine       VARCHAR(50) PRIMARY KEY,
+        linha         VARCHAR(50),
+        setor         VARCHAR(50),
+        turnos        TEXT,
+        ativa         BOOLEAN NOT NULL DEFAULT TRUE,
+        last_seen     TIMESTAMP,
+        atualizado_em TIMESTAMP NOT NULL DEFAULT clock_timestamp()
+    );
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS ix_machines_atualizado
+        ON machines (atualizado_em);
+    """)
+    # Máquinas que já aparecem nas paradas (e a antiga lista fixa)
+    cur.execute("""
+    INSERT INTO machines (machine)
+    SELECT machine FROM paradas
+    UNION
+    SELECT 'Máquina 01'
+    ON CONFLICT (machine) DO NOTHING;
+    """)
+
+
+def _m008_machine_states(cur):
+    # Cópia durável do último estadoLed de cada máquina (o estado vivo fica
+    # no estado compartilhado, ver EstadoMaquinas). Restaurada ao subir.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS machine_states (
+        machine       VARCHAR(50) PRIMARY KEY,
+        estado_led    SMALLINT NOT NULL,
+        desde         TIMESTAMP NOT NULL,
+        atualizado_em TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """)
+
+
+def _m009_eventos_chaves(cur):
+    # Identidade dos eventos já aplicados (deduplicacao.py): só o hash de
+    # 64 bits, para o reenvio do mesmo evento ser recusado. BRIN em
+    # recebido_em (tabela só cresce no fim) para a limpeza diária.
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS eventos_chaves (
+        chave       BIGINT PRIMARY KEY,
+        recebido_em TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """)
+    cur.execute("""
+    CREATE INDEX IF NOT EXISTS ix_eventos_chaves_recebido
+        ON eventos_chaves USING BRIN (recebido_em);
+    """)
+
+
+def reconstruir_agregados(cur, desde: datetime = None):
+    """
+    Recalcula paradas_agregado a partir de paradas (tudo, ou só os dias a
+    partir de `desde`). Usado pela migração e depois de reprocessamentos.
+    Não faz commit.
+    """
+    desde = desde.replace(hour=0, minute=0, second=0, microsecond=0) if desde else None
+    if desde:
+        cur.execute("DELETE FROM paradas_agregado WHERE bucket >= %s", (desde,))
+    else:
+        cur.execute("DELETE FROM paradas_agregado")
+
+    for granularidade, trunc in (("hora", "hour"), ("dia", "day")):
+        cur.execute(
+            """
+            INSERT INTO paradas_agregado (granularidade, bucket, machine, reason, qtd, minutos)
+            SELECT %s, date_trunc(%s, start_time), machine, reason,
+                   COUNT(*), COALESCE(SUM(duration_minutes), 0)
+            FROM paradas
+            WHERE end_time IS NOT NULL
+              AND (%s::timestamp IS NULL OR start_time >= %s::timestamp)
+            GROUP BY 2, 3, 4;
+            """,
+            (granularidade, trunc, desde, desde),
+        )
+
+
+MIGRACOES = [
+    ("001_tabelas_base", _m001_tabelas_base),
+    ("002_parada_auto_aberta", _m002_parada_auto_aberta),
+    ("003_indices_historico", _m003_indices_historico),
+    ("004_paradas_agregado", _m004_paradas_agregado),
+    ("005_eventos_brutos", _m005_eventos_brutos),
+    ("006_indice_fim", _m006_indice_fim),
+    ("007_machines", _m007_machines),
+    ("008_machine_states", _m008_machine_states),
+    ("009_eventos_chaves", _m009_eventos_chaves),
+]
+
+
+def aplicar_migracoes(conn) -> list:
+    """Aplica, cada uma na sua transação, as migrações pendentes."""
+    cur = conn.cursor()
+    cur.execute("""
+    CREATE TABLE IF NOT EXISTS schema_migracoes (
+        nome        VARCHAR(100) PRIMARY KEY,
+        aplicada_em TIMESTAMP NOT NULL DEFAULT NOW()
+    );
+    """)
+    conn.commit()
+
+    cur.execute("SELECT nome FROM schema_migracoes")
+    aplicadas = {row[0] for row in cur.fetchall()}
+
+    novas = []
+    for nome, migracao in MIGRACOES:
+        if nome in aplicadas:
+            continue
+        migracao(cur)
+        cur.execute("INSERT INTO schema_migracoes (nome) VALUES (%s)", (nome,))
+        conn.commit()
+        novas.append(nome)
+        print(f"[MIGRAÇÃO] {nome} aplicada.")
+
+    cur.close()
+    return novas
+
+
+# =====================================================================
+# PARTICIONAMENTO MENSAL (opcional)
+# =====================================================================
+#
+# paradas vira uma tabela particionada por RANGE (start_time), uma
+# partição por mês (paradas_pAAAAMM) + uma DEFAULT. Consequências:
+#   - a PK passa a ser (id, start_time);
+#   - índice único só pode existir por partição, então o índice de parada
+#     AUTO aberta vira não-único e o app.py passa a serializar as aberturas
+#     por máquina com pg_advisory_xact_lock (detectado automaticamente).
+# As partições futuras precisam existir ANTES de chegarem linhas daquele
+# mês (senão caem na DEFAULT): o app chama garantir_particoes() ao subir
+# e uma vez por dia.
+
+
+SQL_PARADAS_PARTICIONADA = """
+    SELECT EXISTS (
+        SELECT 1 FROM pg_partitioned_table pt
+        JOIN pg_class c ON c.oid = pt.partrelid
+        WHERE c.relname = 'paradas'
+          AND pg_table_is_visible(c.oid)
+    )
+"""
+
+
+def paradas_particionada(cur) -> bool:
+    cur.execute(SQL_PARADAS_PARTICIONADA)
+    return cur.fetchone()[0]
+
+
+def _inicio_mes(d: datetime) -> datetime:
+    return datetime(d.year, d.month, 1)
+
+
+def _proximo_mes(d: datetime) -> datetime:
+    return datetime(d.year + (d.month == 12), d.month % 12 + 1, 1)
+
+
+def garantir_particoes(cur, meses_a_frente: int = 3, desde: datetime = None) -> list:
+    """Cria as partições mensais de `desde` (padrão: mês atual) até N meses à frente."""
+    mes = _inicio_mes(desde or datetime.now())
+    limite = _inicio_mes(datetime.now())
+    for _ in range(meses_a_frente):
+        limite = _proximo_mes(limite)
+
+    criadas = []
+    while mes <= limite:
+        nome = f"paradas_p{mes:%Y%m}"
+        cur.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {nome}
+            PARTITION OF paradas
+            FOR VALUES FROM (%s) TO (%s)
+            """,
+            (mes, _proximo_mes(mes)),
+        )
+        criadas.append(nome)
+        mes = _proximo_mes(mes)
+    return criadas
+
+
+def particionar_paradas(conn, meses_a_frente: int = 3) -> bool:
+    """Converte paradas (tabela comum) em particionada. Uma transação só."""
+    cur = conn.cursor()
+    if paradas_particionada(cur):
+        print("[MIGRAÇÃO] paradas já é particionada.")
+        cur.close()
+        return False
+
+    cur.execute("LOCK TABLE paradas IN ACCESS EXCLUSIVE MODE")
+    cur.execute("SELECT MIN(start_time) FROM paradas")
+    mais_antiga = cur.fetchone()[0]
+
+    # Libera nomes (índices/PK/sequência) para a tabela nova
+    cur.execute("ALTER TABLE paradas RENAME TO paradas_legado")
+    cur.execute("ALTER TABLE paradas_legado RENAME CONSTRAINT paradas_pkey TO paradas_legado_pkey")
+    for indice in (
+        "ux_paradas_auto_aberta",
+        "ix_paradas_start_id",
+        "ix_paradas_machine_start_id",
+        "ix_paradas_reason_start_id",
+        "ix_paradas_fim",
+    ):
+        cur.execute(f"DROP INDEX IF EXISTS {indice}")
+    cur.execute("ALTER SEQUENCE paradas_id_seq OWNED BY NONE")
+
+    cur.execute("""
+    CREATE TABLE paradas (
+        id               INTEGER NOT NULL DEFAULT nextval('paradas_id_seq'),
+        machine          VARCHAR(50) NOT NULL,
+        reason           VARCHAR(100) NOT NULL,
+        origem           VARCHAR(20) NOT NULL,
+        start_time       TIMESTAMP NOT NULL,
+        end_time         TIMESTAMP,
+        duration_minutes NUMERIC(10,2),
+        created_at       TIMESTAMP NOT NULL DEFAULT NOW(),
+        PRIMARY KEY (id, start_time)
+    ) PARTITION BY RANGE (start_time);
+    """)
+    cur.execute("ALTER SEQUENCE paradas_id_seq OWNED BY paradas.id")
+    cur.execute("CREATE TABLE paradas_p_default PARTITION OF paradas DEFAULT")
+
+    particoes = garantir_particoes(cur, meses_a_frente, desde=mais_antiga)
+
+    cur.execute("""
+    INSERT INTO paradas (id, machine, reason, origem, start_time, end_time, duration_minutes, created_at)
+    SELECT id, machine, reason, origem, start_time, end_time, duration_minutes, created_at
+    FROM paradas_legado
+    """)
+    cur.execute("DROP TABLE paradas_legado")
+
+    # Índices declarados na tabela-mãe valem para todas as partições
+    cur.execute("""
+    CREATE INDEX ix_paradas_auto_aberta
+        ON paradas (machine)
+        WHERE origem = 'AUTO' AND end_time IS NULL;
+    """)
+    _m003_indices_historico(cur)
+    _m006_indice_fim(cur)
+
+    conn.commit()
+    cur.close()
+    print(f"[MIGRAÇÃO] paradas particionada ({len(particoes)} partições mensais + default).")
+    return True
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Migrações do banco de paradas")
+    parser.add_argument("--particionar", action="store_true",
+                        help="converte paradas em tabela particionada por mês")
+    parser.add_argument("--particoes", type=int, metavar="MESES",
+                        help="garante partições até MESES meses à frente")
+    args = parser.parse_args()
+
+    conn = psycopg2.connect(
+        host=PG_HOST,
+        port=PG_PORT,
+        user=PG_USER,
+        password=PG_PASSWORD,
+        database=PG_DB,
+    )
+
+    novas = aplicar_migracoes(conn)
+    print(f"{len(novas)} migração(ões) aplicada(s).")
+
+    if args.particionar:
+        particionar_paradas(conn, meses_a_frente=args.particoes or 3)
+    elif args.particoes is not None:
+        cur = conn.cursor()
+        if paradas_particionada(cur):
+            print("Partições:", ", ".join(garantir_particoes(cur, args.particoes)))
+            conn.commit()
+        else:
+            print("paradas não é particionada (use --particionar).")
+        cur.close()
+
+    conn.close()
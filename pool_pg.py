@@ -0,0 +1,212 @@
+import os
+import threading
+import time
+
+import psycopg2
+from psycopg2 import extensions
+
+# =====================================================================
+# POOL DE CONEXÕES POSTGRES (thread-safe)
+# =====================================================================
+#
+# Substitui o "abre conexão / fecha conexão" por chamada. Cada processo
+# (worker do gunicorn) tem o seu pool, criado de forma preguiçosa na
+# primeira requisição — assim nenhuma conexão atravessa um fork().
+
+
+class PoolEsgotado(Exception):
+    """Nenhuma conexão livre dentro do tempo de espera configurado."""
+
+
+class PoolPostgres:
+    def __init__(
+        self,
+        fabrica,
+        minimo: int = 1,
+        maximo: int = 10,
+        tempo_max_vida: float = 1800.0,
+        tempo_ocioso_check: float = 30.0,
+        timeout_checkout: float = 5.0,
+    ):
+        """
+        fabrica             -> função sem argumentos que abre uma conexão nova
+        minimo / maximo     -> tamanho do pool (conexões abertas simultâneas)
+        tempo_max_vida      -> segundos até a conexão ser reciclada
+        tempo_ocioso_check  -> conexões paradas há mais que isso fazem um
+                               SELECT 1 antes de serem entregues
+        timeout_checkout    -> quanto esperar por uma conexão livre
+        """
+        if maximo < 1 or minimo < 0 or minimo > maximo:
+            raise ValueError("Tamanho de pool inválido")
+
+        self._fabrica = fabrica
+        self.minimo = minimo
+        self.maximo = maximo
+        self.tempo_max_vida = tempo_max_vida
+        self.tempo_ocioso_check = tempo_ocioso_check
+        self.timeout_checkout = timeout_checkout
+
+        self._cond = threading.Condition()
+        self._livres = []  # [(conn, criada_em, usada_em)]
+        self._criada_em = {}  # id(conn) -> criada_em (conexões em uso)
+        self._total = 0
+        self._pid = os.getpid()
+
+    # -----------------------------------------------------------------
+    # INTERNOS
+    # -----------------------------------------------------------------
+
+    def _verifica_fork(self):
+        # Depois de um fork as conexões herdadas pertencem ao processo pai:
+        # esquece todas (sem fechar, para não derrubar o socket do pai).
+        if self._pid != os.getpid():
+            self._livres = []
+            self._criada_em = {}
+            self._total = 0
+            self._pid = os.getpid()
+
+    def _abrir(self):
+        conn = self._fabrica()
+        agora = time.monotonic()
+        return conn, agora, agora
+
+    @staticmethod
+    def _fechar_silencioso(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _saudavel(self, conn, criada_em, usada_em) -> bool:
+        if conn.closed:
+            return False
+        agora = time.monotonic()
+        if agora - criada_em > self.tempo_max_vida:
+            return False
+        if agora - usada_em > self.tempo_ocioso_check:
+            try:
+                cur = conn.cursor()
+                cur.execute("SELECT 1")
+                cur.close()
+                conn.rollback()
+            except psycopg2.Error:
+                return False
+        return True
+
+    # -----------------------------------------------------------------
+    # API
+    # -----------------------------------------------------------------
+
+    def obter(self):
+        """Retira uma conexão saudável do pool (abre uma nova se preciso)."""
+        limite = time.monotonic() + self.timeout_checkout
+
+        while True:
+            candidata = None
+            with self._cond:
+                self._verifica_fork()
+                while True:
+                    if self._livres:
+                        candidata = self._livres.pop()
+                        break
+                    if self._total < self.maximo:
+                        self._total += 1
+                        break
+                    restante = limite - time.monotonic()
+                    if restante <= 0:
+                        raise PoolEsgotado(
+                            f"Pool esgotado ({self.maximo} conexões em uso)"
+                        )
+                    self._cond.wait(restante)
+
+            if candidata is None:
+                break
+
+            # Testa fora do lock: o SELECT 1 pode demorar (rede, servidor)
+            conn, criada_em, usada_em = candidata
+            if self._saudavel(conn, criada_em, usada_em):
+                with self._cond:
+                    self._criada_em[id(conn)] = criada_em
+                return conn
+            self._fechar_silencioso(conn)
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+
+        # Abre fora do lock: o handshake pode demorar
+        try:
+            conn, criada_em, _ = self._abrir()
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+
+        with self._cond:
+            self._criada_em[id(conn)] = criada_em
+        return conn
+
+    def devolver(self, conn, descartar: bool = False):
+        """
+        Devolve a conexão ao pool. Transação pendente é desfeita; conexão
+        quebrada ou velha demais é fechada em vez de reaproveitada.
+        """
+        with self._cond:
+            if self._pid != os.getpid():
+                return
+            criada_em = self._criada_em.pop(id(conn), None)
+
+        if criada_em is None:
+            # Não saiu deste pool (ou o pool foi resetado)
+            self._fechar_silencioso(conn)
+            return
+
+        if not descartar and not conn.closed:
+            try:
+                status = conn.get_transaction_status()
+                if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                    descartar = True
+                elif status != extensions.TRANSACTION_STATUS_IDLE:
+                    conn.rollback()
+            except psycopg2.Error:
+                descartar = True
+
+        if not descartar:
+            descartar = conn.closed or (
+                time.monotonic() - criada_em > self.tempo_max_vida
+            )
+
+        with self._cond:
+            if descartar:
+                self._fechar_silencioso(conn)
+                self._total -= 1
+            else:
+                self._livres.append((conn, criada_em, time.monotonic()))
+            self._cond.notify()
+
+    def aquecer(self):
+        """Abre até `minimo` conexões antecipadamente."""
+        conns = []
+        try:
+            while len(conns) < self.minimo:
+                conns.append(self.obter())
+        finally:
+            for conn in conns:
+                self.devolver(conn)
+
+    def fechar_todas(self):
+        """Fecha as conexões livres (ao encerrar o processo)."""
+        with self._cond:
+            livres, self._livres = self._livres, []
+            self._total -= len(livres)
+        for conn, _, _ in livres:
+            self._fechar_silencioso(conn)
+
+    def estatisticas(self) -> dict:
+        with self._cond:
+            return {
+                "total": self._total,
+                "livres": len(self._livres),
+                "em_uso": len(self._criada_em),
+                "maximo": self.maximo,
+            }
@@ -0,0 +1,347 @@
+import argparse
+import asyncio
+import logging
+import os
+import struct
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from maquina_estados import validar_evento
+
+# =====================================================================
+# RECEPTOR COMPACTO (UDP / TCP) → mesmo processar_eventos() do /log
+# =====================================================================
+#
+# Alternativa ao POST /log para firmware/gateway que não quer pagar
+# conexão TCP + cabeçalhos HTTP + JSON a cada evento. Dois formatos:
+#
+#   binário (UDP, 14 bytes, big-endian, FRAME = "!BBHIIbB"):
+#       versão (1), tipo, id da máquina, seq, timestamp (epoch UTC, s),
+#       estadoLed (-1 = só heartbeat), motivo
+#   CSV (UDP, ou uma linha por evento numa conexão TCP):
+#       machine,seq,timestamp,estadoLed,motivo[,tipo]
+#       ex: Máquina 03,48213,1767261600,1,SETUP,MOTIVO
+#
+# tipo e motivo vão como código (TIPOS / MOTIVOS) no binário e como texto
+# no CSV; estadoLed vazio no CSV = heartbeat. seq faz o papel do ts_ms do
+# JSON (millis() serve): com o timestamp, identifica o evento para a
+# deduplicação (deduplicacao.py), então reenviar o mesmo frame é seguro.
+# timestamp 0 = hora do servidor (e sem deduplicação). O id da máquina do
+# frame binário vira nome por MAQUINA_ID_FORMATO. Um datagrama pode levar
+# vários frames (binários em sequência ou linhas CSV).
+#
+# Cada frame recebe um ack (ACK = "!BHIB" no binário, "OK,<seq>" no CSV)
+# DEPOIS do commit do lote em que entrou; sem ack o dispositivo reenvia.
+# Frame inválido recebe ERRO na hora (se der para ler o seq dele) e não
+# atrapalha os outros frames do mesmo datagrama.
+# Enquanto um lote é gravado, os frames que chegam formam o próximo (até
+# RECEPTOR_LOTE; RECEPTOR_ESPERA_MS > 0 ainda espera mais um pouco antes
+# de cada lote). Um único executor grava, então a ordem por máquina é a
+# de chegada. Roda como processo à parte (mais um "worker" do estado
+# compartilhado):
+#
+#   py receptor_compacto.py --udp 5005 --tcp 5006
+#
+# O benchmark_carga.py --udp faz o papel dos Arduinos.
+
+log = logging.getLogger("maroni.receptor")
+
+VERSAO = 1
+FRAME = struct.Struct("!BBHIIbB")
+ACK = struct.Struct("!BHIB")
+
+TIPOS = ("BOOT", "RUN_CYCLE", "MOTIVO")
+MOTIVOS = ("NONE", "SETUP", "MATERIAL", "MANUTENCAO", "ALMOCO")
+
+ACK_OK = 0
+ACK_INVALIDO = 1
+ACK_FALHA = 2  # não gravou (banco fora, fila cheia): reenviar
+STATUS_TEXTO = {ACK_OK: "OK", ACK_INVALIDO: "ERRO", ACK_FALHA: "FALHA"}
+
+MAQUINA_ID_FORMATO = os.environ.get("MAQUINA_ID_FORMATO", "Máquina {:02d}")
+RECEPTOR_LOTE = int(os.environ.get("RECEPTOR_LOTE", 500))
+RECEPTOR_ESPERA_MS = float(os.environ.get("RECEPTOR_ESPERA_MS", 0))
+RECEPTOR_MAX_PENDENTES = int(os.environ.get("RECEPTOR_MAX_PENDENTES", 20000))
+
+
+# ---------------------------------------------------------------------
+# FRAMES
+# ---------------------------------------------------------------------
+
+def codificar_binario(maquina_id: int, seq: int, timestamp: int, estado_led, motivo: str,
+                      tipo: str) -> bytes:
+    return FRAME.pack(
+        VERSAO,
+        TIPOS.index(tipo),
+        maquina_id,
+        seq,
+        timestamp,
+        -1 if estado_led is None else estado_led,
+        MOTIVOS.index(motivo),
+    )
+
+
+def codificar_csv(machine: str, seq: int, timestamp: int, estado_led, motivo: str,
+                  tipo: str) -> bytes:
+    led = "" if estado_led is None else str(estado_led)
+    return f"{machine},{seq},{timestamp},{led},{motivo},{tipo}\n".encode("utf-8")
+
+
+def ler_ack(dados: bytes):
+    """Ack recebido pelo cliente → (seq, status)."""
+    if dados[:1] == bytes([VERSAO]):
+        _, _, seq, status = ACK.unpack(dados[: ACK.size])
+        return seq, status
+    texto, seq = dados.decode("utf-8").strip().split(",")
+    return int(seq), {v: k for k, v in STATUS_TEXTO.items()}[texto]
+
+
+def para_log(machine: str, seq: int, timestamp: int, estado_led, motivo: str, tipo: str) -> dict:
+    """Frame → dict no formato do montaJSON() do sketch."""
+    dado = {"machine": machine, "ts_ms": seq, "tipo": tipo, "motivo": motivo, "origem": "compacto"}
+    if timestamp:
+        local = datetime.utcfromtimestamp(timestamp) - timedelta(hours=3)
+        dado["data_hora"] = local.strftime("%Y-%m-%d %H:%M:%S")
+    if estado_led is not None and estado_led >= 0:
+        dado["estadoLed"] = estado_led
+    return dado
+
+
+def ack_binario(maquina_id: int, seq: int):
+    return lambda status: ACK.pack(VERSAO, maquina_id, seq, status)
+
+
+def ack_csv(seq: int):
+    return lambda status: f"{STATUS_TEXTO[status]},{seq}\n".encode("utf-8")
+
+
+def ler_binario(dados: bytes) -> list:
+    """[(log, ack, erro)] de um datagrama com frames binários (ver ler_frames)."""
+    frames = []
+    for deslocamento in range(0, len(dados) - FRAME.size + 1, FRAME.size):
+        versao, tipo, maquina_id, seq, timestamp, estado_led, motivo = FRAME.unpack_from(
+            dados, deslocamento
+        )
+        ack = ack_binario(maquina_id, seq)
+        if versao != VERSAO or tipo >= len(TIPOS) or motivo >= len(MOTIVOS):
+            erro = f"frame binário inválido (versão {versao}, tipo {tipo}, motivo {motivo})"
+            frames.append((None, ack, erro))
+            continue
+        dado = para_log(
+            MAQUINA_ID_FORMATO.format(maquina_id),
+            seq,
+            timestamp,
+            estado_led,
+            MOTIVOS[motivo],
+            TIPOS[tipo],
+        )
+        frames.append((dado, ack, None))
+    if len(dados) % FRAME.size:
+        frames.append((None, None, f"{len(dados) % FRAME.size} byte(s) sobrando no datagrama"))
+    return frames
+
+
+def ler_csv(linha: str):
+    """(log, ack(status) -> bytes) de uma linha CSV."""
+    campos = [c.strip() for c in linha.strip().split(",")]
+    if len(campos) not in (5, 6) or not campos[0]:
+        raise ValueError(f"linha CSV inválida: {linha!r}")
+    machine, seq, timestamp, estado_led, motivo = campos[:5]
+    tipo = (campos[5] if len(campos) == 6 else "RUN_CYCLE").upper()
+    motivo = motivo.upper() or "NONE"
+    if motivo.isdigit():
+        motivo = MOTIVOS[int(motivo)]
+    seq = int(seq)
+    dado = para_log(
+        machine, seq, int(timestamp or 0), int(estado_led) if estado_led else None, motivo, tipo
+    )
+    # O que o banco recusaria vira ERRO aqui: FALHA faria o dispositivo reenviar para sempre
+    erro = validar_evento(dado)
+    if erro:
+        raise ValueError(erro)
+    return dado, ack_csv(seq)
+
+
+def ler_linha(linha: bytes):
+    """(log, ack, erro) de uma linha CSV ainda em bytes (ver ler_frames)."""
+    try:
+        dado, ack = ler_csv(linha.decode("utf-8"))
+    except (ValueError, IndexError, OverflowError, OSError) as e:
+        campos = linha.decode("utf-8", "replace").split(",")
+        seq = campos[1].strip() if len(campos) > 1 else ""
+        return None, ack_csv(int(seq)) if seq.isdigit() else None, str(e) or type(e).__name__
+    return dado, ack, None
+
+
+def ler_frames(dados: bytes) -> list:
+    """
+    Datagrama → [(log, ack, erro)], um por frame binário ou linha CSV.
+    Frame inválido vem com log None e o erro; ack None quando nem o seq
+    dele dá para ler.
+    """
+    if dados[:1] == bytes([VERSAO]):
+        return ler_binario(dados)
+    return [ler_linha(linha) for linha in dados.splitlines() if linha.strip()]
+
+
+# ---------------------------------------------------------------------
+# LOTES
+# ---------------------------------------------------------------------
+
+class ReceptorCompacto:
+    """
+    Junta frames de qualquer origem em lotes e chama aplicar(logs) (numa
+    thread, um lote por vez). aplicar levanta exceção se não gravou: os
+    frames do lote recebem ACK_FALHA.
+    """
+
+    def __init__(self, aplicar, lote_max: int = RECEPTOR_LOTE,
+                 espera_s: float = RECEPTOR_ESPERA_MS / 1000.0,
+                 max_pendentes: int = RECEPTOR_MAX_PENDENTES):
+        self.aplicar = aplicar
+        self.lote_max = lote_max
+        self.espera_s = espera_s
+        self.max_pendentes = max_pendentes
+        self._pendentes = []  # (log, responder(status))
+        self._tem_pendentes = asyncio.Event()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="receptor")
+
+        self.frames = 0
+        self.lotes = 0
+        self.invalidos = 0
+        self.recusados = 0
+
+    def receber(self, dado: dict, responder):
+        if len(self._pendentes) >= self.max_pendentes:
+            self.recusados += 1
+            responder(ACK_FALHA)
+            return
+        self.frames += 1
+        self._pendentes.append((dado, responder))
+        self._tem_pendentes.set()
+
+    async def loop_lotes(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            await self._tem_pendentes.wait()
+            if self.espera_s and len(self._pendentes) < self.lote_max:
+                await asyncio.sleep(self.espera_s)
+            lote = self._pendentes[: self.lote_max]
+            del self._pendentes[: self.lote_max]
+            if not self._pendentes:
+                self._tem_pendentes.clear()
+
+            status = ACK_OK
+            try:
+                await loop.run_in_executor(self._executor, self.aplicar, [d for d, _ in lote])
+            except Exception as e:
+                log.warning("Falha ao gravar lote de %d frame(s): %s", len(lote), e)
+                status = ACK_FALHA
+            self.lotes += 1
+            for _, responder in lote:
+                responder(status)
+
+
+class ProtocoloUdp(asyncio.DatagramProtocol):
+    def __init__(self, receptor: ReceptorCompacto):
+        self.receptor = receptor
+        self.transporte = None
+
+    def connection_made(self, transporte):
+        self.transporte = transporte
+
+    def datagram_received(self, dados, endereco):
+        for dado, ack, erro in ler_frames(dados):
+            if erro is None:
+                self.receptor.receber(
+                    dado, lambda status, ack=ack: self.transporte.sendto(ack(status), endereco)
+                )
+                continue
+            self.receptor.invalidos += 1
+            log.debug("Frame inválido de %s: %s", endereco, erro)
+            if ack is not None:
+                self.transporte.sendto(ack(ACK_INVALIDO), endereco)
+
+
+async def atender_tcp(receptor: ReceptorCompacto, leitor, escritor):
+    """Uma linha CSV por evento; cada linha recebe a sua linha de ack."""
+
+    def responder(ack):
+        def enviar(status):
+            if not escritor.is_closing():
+                escritor.write(ack(status))
+        return enviar
+
+    try:
+        while True:
+            linha = await leitor.readline()
+            if not linha:
+                break
+            dado, ack, erro = ler_linha(linha)
+            if erro is not None:
+                receptor.invalidos += 1
+                escritor.write(ack(ACK_INVALIDO) if ack else b"ERRO\n")
+                continue
+            receptor.receber(dado, responder(ack))
+    except ConnectionError:
+        pass
+    finally:
+        escritor.close()
+
+
+# ---------------------------------------------------------------------
+# PROCESSO
+# ---------------------------------------------------------------------
+
+async def servir(aplicar, porta_udp: int = None, porta_tcp: int = None, host: str = "0.0.0.0",
+                 relatorio_s: float = 60.0):
+    receptor = ReceptorCompacto(aplicar)
+    loop = asyncio.get_running_loop()
+    tarefas = [asyncio.create_task(receptor.loop_lotes())]
+    if porta_udp:
+        await loop.create_datagram_endpoint(
+            lambda: ProtocoloUdp(receptor), local_addr=(host, porta_udp)
+        )
+        log.info("Receptor UDP em %s:%d", host, porta_udp)
+    if porta_tcp:
+        servidor = await asyncio.start_server(
+            lambda l, e: atender_tcp(receptor, l, e), host, porta_tcp
+        )
+        tarefas.append(asyncio.create_task(servidor.serve_forever()))
+        log.info("Receptor TCP em %s:%d", host, porta_tcp)
+
+    while True:
+        await asyncio.sleep(relatorio_s)
+        log.info(
+            "Receptor: %d frames, %d lotes, %d inválidos, %d recusados",
+            receptor.frames, receptor.lotes, receptor.invalidos, receptor.recusados,
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Recebe eventos em frames UDP/TCP compactos")
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--udp", type=int, help="porta UDP (frames binários ou CSV)")
+    parser.add_argument("--tcp", type=int, help="porta TCP (linhas CSV)")
+    args = parser.parse_args()
+    if not (args.udp or args.tcp):
+        parser.error("informe --udp e/ou --tcp")
+
+    import app
+
+    def aplicar(dados):
+        with app.app.app_context():
+            app.arquivar_eventos(dados)
+            app.sinalizar_comunicacao(dados)
+            com_led = [d for d in dados if d.get("estadoLed") is not None]
+            if com_led:
+                app.processar_eventos(com_led)
+
+    # Tarefas de fundo de um worker (métricas, pendentes, vigia)
+    with app.app.app_context():
+        app.iniciar_processo()
+
+    try:
+        asyncio.run(servir(aplicar, args.udp, args.tcp, args.host))
+    except KeyboardInterrupt:
+        pass
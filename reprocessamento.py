@@ -0,0 +1,266 @@
+import logging
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from itertools import groupby
+
+import psycopg2
+from psycopg2.extras import execute_values
+
+from maquina_estados import maturar_plano, reduzir_eventos_maquina
+from migracoes import reconstruir_agregados
+
+# =====================================================================
+# REPROCESSAMENTO DAS PARADAS AUTO A PARTIR DE eventos_brutos
+# =====================================================================
+#
+# 1. Marca o maior id de eventos_brutos (o que chegar depois fica para o
+#    passo 3) e cria a tabela de trabalho paradas_reprocessadas.
+# 2. Um processo por máquina (ProcessPoolExecutor, spawn) lê os eventos
+#    dela em ordem (data_hora, ts_ms, id) por um cursor no servidor, em
+#    blocos, passa pela mesma reduzir_eventos_maquina() do /log e grava as
+#    paradas fechadas na tabela de trabalho. Devolve a parada que terminou
+#    aberta e o horário do 1º evento da máquina.
+# 3. Numa única transação, com paradas travada para escrita: aplica os
+#    eventos que chegaram durante o passo 2, troca as paradas AUTO de cada
+#    máquina (a partir do 1º evento bruto dela — o histórico anterior à
+#    tabela de eventos fica intacto, exceto parada ainda aberta) e
+#    recalcula paradas_agregado.
+#
+# Paradas MANUAL não são tocadas. Só um reprocessamento por vez (advisory
+# lock); um segundo pedido recebe ReprocessamentoEmAndamento.
+
+log = logging.getLogger("maroni.reprocessamento")
+
+CHAVE_TRAVA = 7_240_114  # pg_advisory_lock do reprocessamento
+
+SQL_LISTAR_MAQUINAS = """
+    WITH RECURSIVE m AS (
+        (SELECT machine FROM eventos_brutos ORDER BY machine LIMIT 1)
+        UNION ALL
+        SELECT (
+            SELECT e.machine FROM eventos_brutos e
+            WHERE e.machine > m.machine
+            ORDER BY e.machine
+            LIMIT 1
+        )
+        FROM m
+        WHERE m.machine IS NOT NULL
+    )
+    SELECT machine FROM m WHERE machine IS NOT NULL
+"""
+
+SQL_EVENTOS_MAQUINA = """
+    SELECT data_hora, ts_ms, tipo, estado_led, motivo
+    FROM eventos_brutos
+    WHERE machine = %s
+      AND id <= %s
+    ORDER BY data_hora, ts_ms, id
+"""
+
+SQL_EVENTOS_NOVOS = """
+    SELECT machine, data_hora, ts_ms, tipo, estado_led, motivo
+    FROM eventos_brutos
+    WHERE id > %s
+      AND machine = ANY(%s)
+    ORDER BY machine, data_hora, ts_ms, id
+"""
+
+SQL_INSERIR_TRABALHO = """
+    INSERT INTO paradas_reprocessadas (machine, reason, start_time, end_time, duration_minutes)
+    VALUES %s
+"""
+
+
+class ReprocessamentoEmAndamento(Exception):
+    """Outro reprocessamento está rodando (em qualquer worker)."""
+
+
+def _evento(linha) -> dict:
+    data_hora, ts_ms, tipo, estado_led, motivo = linha
+    return {
+        "tipo": tipo,
+        "motivo_bruto": motivo,
+        "estado_led": estado_led,
+        "agora": data_hora,
+        "ts_ms": ts_ms,
+    }
+
+
+def _reprocessar_maquina(parametros_conexao: dict, machine: str, marca: int,
+                         threshold_minutos: float, lote: int, janela_s: float = 0.0):
+    """Roda num processo do pool. Retorna (machine, primeiro, final, totais)."""
+    conn = psycopg2.connect(**parametros_conexao)
+    try:
+        leitura = conn.cursor(name=f"reproc_{os.getpid()}")
+        leitura.itersize = lote
+        leitura.execute(SQL_EVENTOS_MAQUINA, (machine, marca))
+        cur = conn.cursor()
+
+        aberta = None
+        primeiro = None
+        totais = {"eventos": 0, "fechadas": 0, "descartadas": 0}
+        while True:
+            linhas = leitura.fetchmany(lote)
+            if not linhas:
+                break
+            if primeiro is None:
+                primeiro = linhas[0][0]
+            plano = reduzir_eventos_maquina(
+                machine, [_evento(l) for l in linhas], aberta, threshold_minutos, janela_s
+            )
+            aberta = plano["final"]
+            totais["eventos"] += len(linhas)
+            totais["fechadas"] += len(plano["fechadas"])
+            totais["descartadas"] += plano["descartadas"]
+            if plano["fechadas"]:
+                execute_values(cur, SQL_INSERIR_TRABALHO, plano["fechadas"], page_size=1000)
+
+        leitura.close()
+        cur.close()
+        conn.commit()
+        return machine, primeiro, aberta, totais
+    finally:
+        conn.close()
+
+
+def _listar_maquinas(cur) -> list:
+    cur.execute(SQL_LISTAR_MAQUINAS)
+    return [linha[0] for linha in cur.fetchall()]
+
+
+def reprocessar_paradas(parametros_conexao: dict, threshold_minutos: float,
+                        processos: int = None, lote: int = 10000, maquinas: list = None,
+                        janela_s: float = 0.0) -> dict:
+    """
+    janela_s: a mesma janela de oscilação do /log (PARADA_OSCILACAO_S),
+    para o reprocessamento chegar às mesmas paradas.
+    """
+    inicio = time.monotonic()
+    conn = psycopg2.connect(**parametros_conexao)
+    cur = conn.cursor()
+    cur.execute("SELECT pg_try_advisory_lock(%s)", (CHAVE_TRAVA,))
+    if not cur.fetchone()[0]:
+        conn.close()
+        raise ReprocessamentoEmAndamento("Já existe um reprocessamento em andamento")
+
+    try:
+        # ---- 1) marca + tabela de trabalho --------------------------------
+        cur.execute("DROP TABLE IF EXISTS paradas_reprocessadas")
+        cur.execute("""
+        CREATE UNLOGGED TABLE paradas_reprocessadas (
+            machine          VARCHAR(50) NOT NULL,
+            reason           VARCHAR(100) NOT NULL,
+            start_time       TIMESTAMP NOT NULL,
+            end_time         TIMESTAMP,
+            duration_minutes NUMERIC(10,2)
+        )
+        """)
+        cur.execute("SELECT COALESCE(MAX(id), 0) FROM eventos_brutos")
+        marca = cur.fetchone()[0]
+        maquinas = list(maquinas) if maquinas else _listar_maquinas(cur)
+        conn.commit()
+
+        # ---- 2) uma máquina por processo ----------------------------------
+        primeiros, finais = {}, {}
+        totais = {"maquinas": len(maquinas), "eventos": 0, "fechadas": 0, "descartadas": 0}
+        processos = max(1, min(processos or os.cpu_count() or 1, len(maquinas) or 1))
+        with ProcessPoolExecutor(
+            max_workers=processos, mp_context=multiprocessing.get_context("spawn")
+        ) as executor:
+            futuros = [
+                executor.submit(
+                    _reprocessar_maquina,
+                    parametros_conexao, m, marca, threshold_minutos, lote, janela_s,
+                )
+                for m in maquinas
+            ]
+            for futuro in as_completed(futuros):
+                machine, primeiro, final, parcial = futuro.result()
+                if primeiro is not None:
+                    primeiros[machine] = primeiro
+                    finais[machine] = final
+                for chave, valor in parcial.items():
+                    totais[chave] += valor
+                log.info("Reprocessamento: %s pronta (%d eventos)", machine, parcial["eventos"])
+
+        # ---- 3) troca atômica ---------------------------------------------
+        cur.execute("LOCK TABLE paradas IN EXCLUSIVE MODE")
+
+        cur.execute(SQL_EVENTOS_NOVOS, (marca, list(primeiros)))
+        novos = 0
+        for machine, linhas in groupby(cur.fetchall(), key=lambda l: l[0]):
+            eventos = [_evento(l[1:]) for l in linhas]
+            plano = reduzir_eventos_maquina(
+                machine, eventos, finais.get(machine), threshold_minutos, janela_s
+            )
+            finais[machine] = plano["final"]
+            novos += len(eventos)
+            totais["fechadas"] += len(plano["fechadas"])
+            totais["descartadas"] += plano["descartadas"]
+            if plano["fechadas"]:
+                execute_values(cur, SQL_INSERIR_TRABALHO, plano["fechadas"], page_size=1000)
+        totais["eventos"] += novos
+
+        # Fim do histórico: fechamento provisório (janela de oscilação) fecha de vez
+        for machine, final in finais.items():
+            plano = {"fechar": None, "fechadas": [], "descartadas": 0, "final": final}
+            maturar_plano(machine, plano, threshold_minutos, janela_s)
+            finais[machine] = plano["final"]
+            totais["fechadas"] += len(plano["fechadas"])
+            totais["descartadas"] += plano["descartadas"]
+            if plano["fechadas"]:
+                execute_values(cur, SQL_INSERIR_TRABALHO, plano["fechadas"], page_size=1000)
+
+        abertas = [
+            (m, f["reason"], f["start_time"], None, None) for m, f in finais.items() if f
+        ]
+        if abertas:
+            execute_values(cur, SQL_INSERIR_TRABALHO, abertas, page_size=1000)
+
+        apagadas = 0
+        if primeiros:
+            execute_values(
+                cur,
+                """
+                DELETE FROM paradas p
+                USING (VALUES %s) AS d (machine, desde)
+                WHERE p.origem = 'AUTO'
+                  AND p.machine = d.machine
+                  AND (p.start_time >= d.desde OR p.end_time IS NULL)
+                """,
+                list(primeiros.items()),
+                template="(%s, %s::timestamp)",
+                page_size=len(primeiros),
+            )
+            apagadas = cur.rowcount
+            cur.execute("""
+            INSERT INTO paradas (machine, reason, origem, start_time, end_time, duration_minutes)
+            SELECT machine, reason, 'AUTO', start_time, end_time, duration_minutes
+            FROM paradas_reprocessadas
+            """)
+            reconstruir_agregados(cur, min(primeiros.values()))
+
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+    finally:
+        try:
+            cur.execute("DROP TABLE IF EXISTS paradas_reprocessadas")
+            cur.execute("SELECT pg_advisory_unlock(%s)", (CHAVE_TRAVA,))
+            conn.commit()
+        finally:
+            conn.close()
+
+    totais.update(
+        {
+            "eventos_durante": novos,
+            "abertas": len(abertas),
+            "paradas_substituidas": apagadas,
+            "threshold_minutos": threshold_minutos,
+            "segundos": round(time.monotonic() - inicio, 1),
+        }
+    )
+    return totais
@@ -0,0 +1,114 @@
+import argparse
+import os
+import time
+
+# Replay não publica no /api/stream, não usa a fila e não se re-arquiva
+os.environ.setdefault("EVENTOS_PUSH", "0")
+os.environ.setdefault("FILA_ESCRITA", "0")
+os.environ.setdefault("ARQUIVO_EVENTOS", "0")
+
+import app  # noqa: E402
+from arquivo_eventos import ler_eventos  # noqa: E402
+from maquina_estados import THRESHOLD_DESCARTE_MIN, obter_agora_do_log  # noqa: E402
+from migracoes import reconstruir_agregados  # noqa: E402
+
+# =====================================================================
+# REPLAY DO ARQUIVO DE EVENTOS → TABELA paradas
+# =====================================================================
+#
+# Lê os segmentos de ARQUIVO_EVENTOS_DIR em ordem de recebimento e passa
+# tudo pelo mesmo processar_eventos() do /log, em lotes.
+#
+#   py reprocessar_arquivo.py --limpar
+#       apaga TODAS as paradas AUTO e refaz a partir do arquivo inteiro
+#   py reprocessar_arquivo.py --limpar --desde 2025-11-01T03:00:00Z --threshold 0.5
+#       refaz só a partir de novembro (recebido_em em UTC) com outro threshold
+#
+# Sem --limpar os eventos são aplicados por cima do que já está no banco
+# (ex.: banco novo). Rode com o app parado: o replay não é atômico.
+
+
+def limpar_paradas_auto(desde):
+    conn = app.obter_conexao()
+    cur = conn.cursor()
+    if desde is None:
+        cur.execute("DELETE FROM paradas WHERE origem = 'AUTO'")
+    else:
+        cur.execute("DELETE FROM paradas WHERE origem = 'AUTO' AND start_time >= %s", (desde,))
+    apagadas = cur.rowcount
+    cur.execute("DELETE FROM machine_states")
+    conn.commit()
+    cur.close()
+    app.cache_paradas.invalidar()
+    app.estado_maquinas.limpar()
+    return apagadas
+
+
+def reprocessar(diretorio, desde=None, ate=None, threshold=THRESHOLD_DESCARTE_MIN,
+                lote=5000, limpar=False) -> dict:
+    total = {"eventos": 0, "ignorados": 0, "fechadas": 0, "descartadas": 0, "abertas": 0}
+    inicio = time.monotonic()
+    eventos = ler_eventos(diretorio, desde=desde, ate=ate)
+
+    pendentes = []
+    primeiro = None
+    for registro in eventos:
+        if primeiro is None:
+            primeiro = registro
+            if limpar:
+                # Paradas a partir do primeiro evento reproduzido (hora do Arduino)
+                corte = obter_agora_do_log(registro) if desde else None
+                print(f"{limpar_paradas_auto(corte)} parada(s) AUTO apagada(s).")
+        pendentes.append(registro)
+        if len(pendentes) >= lote:
+            _aplicar(pendentes, threshold, total)
+            pendentes = []
+            print(f"  {total['eventos']} eventos ({time.monotonic() - inicio:.0f}s)...")
+    if pendentes:
+        _aplicar(pendentes, threshold, total)
+
+    if limpar and primeiro is not None:
+        conn = app.obter_conexao()
+        cur = conn.cursor()
+        reconstruir_agregados(cur, obter_agora_do_log(primeiro) if desde else None)
+        conn.commit()
+        cur.close()
+
+    app.incrementar_versao_dados()
+    total["segundos"] = round(time.monotonic() - inicio, 1)
+    return total
+
+
+def _aplicar(dados, threshold, total):
+    resumo = app.processar_eventos(dados, threshold)
+    for chave in total:
+        total[chave] += resumo.get(chave, 0)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Refaz paradas a partir do arquivo de eventos")
+    parser.add_argument("--diretorio", default=app.ARQUIVO_EVENTOS_DIR)
+    parser.add_argument("--desde", help="recebido_em inicial, ISO UTC (ex: 2025-11-01T03:00:00Z)")
+    parser.add_argument("--ate", help="recebido_em final (exclusivo), ISO UTC")
+    parser.add_argument("--threshold", type=float, default=THRESHOLD_DESCARTE_MIN,
+                        help="minutos abaixo dos quais a parada AUTO é descartada")
+    parser.add_argument("--lote", type=int, default=5000, help="eventos por transação")
+    parser.add_argument("--limpar", action="store_true",
+                        help="apaga as paradas AUTO do período antes do replay")
+    parser.add_argument("--gravar-brutos", action="store_true",
+                        help="grava também em eventos_brutos (banco novo; senão duplicaria)")
+    args = parser.parse_args()
+    app.EVENTOS_BRUTOS = args.gravar_brutos
+    # O replay reaplica de propósito eventos que já passaram pelo /log
+    app.DEDUP_EVENTOS = False
+
+    with app.app.app_context():
+        resumo = reprocessar(
+            args.diretorio,
+            desde=args.desde,
+            ate=args.ate,
+            threshold=args.threshold,
+            lote=args.lote,
+            limpar=args.limpar,
+        )
+    print("Replay concluído:", resumo)
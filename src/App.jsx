@@ -84,6 +84,20 @@ const AppContainer = styled.div`
 
 const MONITORED_MACHINE = "Máquina 01";
 
+// Eventos do /api/stream que mudam algo mostrado no dashboard
+const STREAM_EVENTS = [
+  "versao",
+  "reconectado",
+  "estado_maquina",
+  "parada_aberta",
+  "parada_fechada",
+  "parada_descartada",
+  "motivo_alterado",
+  "parada_manual",
+  "reprocessado",
+  "agregados",
+];
+
 export default function App() {
   const API_BASE = import.meta.env.VITE_API_URL || "";
 
@@ -99,11 +113,15 @@ export default function App() {
 
   const [filterReason, setFilterReason] = useState(null);
 
+  const [online, setOnline] = useState(true);
+  const [lastUpdate, setLastUpdate] = useState(null);
+
   // -------------------------------------------------------------------
-  // BUSCAR /api/data
+  // BUSCAR /api/data (disparado pelo stream /api/stream)
   // -------------------------------------------------------------------
   useEffect(() => {
     let mounted = true;
+    let debounceId = null;
 
     const fetchData = async () => {
       try {
@@ -122,10 +140,13 @@ export default function App() {
           setPieDataApi(json.pie || null);
           setBarDataApi(json.bar || null);
           setError(null);
+          setOnline(true);
+          setLastUpdate(new Date());
         }
       } catch (err) {
         console.error(err);
         if (!mounted) return;
+        setOnline(false);
         setError(
           err.message.includes("Failed to fetch")
             ? "Erro de rede ao conectar com o backend."
@@ -134,11 +155,35 @@ export default function App() {
       }
     };
 
+    // Vários eventos em sequência (lote, parada + agregados) viram uma
+    // única busca; o ETag faz o navegador receber 304 se nada mudou.
+    const scheduleFetch = () => {
+      clearTimeout(debounceId);
+      debounceId = setTimeout(fetchData, 300);
+    };
+
     fetchData();
-    const id = setInterval(fetchData, 5000);
+
+    let source = null;
+    if (typeof EventSource !== "undefined") {
+      source = new EventSource(`${API_BASE}/api/stream`, {
+        withCredentials: true,
+      });
+      source.onopen = () => mounted && setOnline(true);
+      source.onerror = () => mounted && setOnline(false);
+      STREAM_EVENTS.forEach((type) =>
+        source.addEventListener(type, scheduleFetch)
+      );
+    }
+
+    // Rede de segurança caso o stream caia ou não exista
+    const id = setInterval(fetchData, source ? 60000 : 5000);
+
     return () => {
       mounted = false;
+      clearTimeout(debounceId);
       clearInterval(id);
+      if (source) source.close();
     };
   }, [API_BASE]);
 
@@ -225,6 +270,8 @@ export default function App() {
       <GlobalStyle />
 
       <Header
+        online={online}
+        lastCheck={lastUpdate}
         username={username}
         setIsLoggedIn={setIsLoggedIn}
         setShowStopForm={setShowStopForm}
@@ -1,4 +1,4 @@
-import React, { useEffect, useState } from "react";
+import React from "react";
 import styled from "styled-components";
 
 const HeaderContainer = styled.header`
@@ -81,10 +81,14 @@ const Button = styled.button`
   }
 `;
 
-export default function Header({ username, setIsLoggedIn, setShowStopForm }) {
-  const [online, setOnline] = useState(true);
-  const [lastCheck, setLastCheck] = useState(null);
-
+// online / lastCheck vêm do App, que acompanha o /api/stream
+export default function Header({
+  username,
+  setIsLoggedIn,
+  setShowStopForm,
+  online = true,
+  lastCheck = null,
+}) {
   const logout = async () => {
     try {
       const API_BASE = import.meta.env.VITE_API_URL || "";
@@ -98,29 +102,6 @@ export default function Header({ username, setIsLoggedIn, setShowStopForm }) {
     if (setIsLoggedIn) setIsLoggedIn(false);
   };
 
-  useEffect(() => {
-    const API_BASE = import.meta.env.VITE_API_URL || "";
-
-    const checkStatus = async () => {
-      try {
-        await fetch(`${API_BASE}/api/data`, {
-          method: "GET",
-          credentials: "include",
-        });
-        setOnline(true);
-      } catch (e) {
-        setOnline(false);
-      } finally {
-        setLastCheck(new Date());
-      }
-    };
-
-    checkStatus();
-    const interval = setInterval(checkStatus, 30000); // checa a cada 30s
-
-    return () => clearInterval(interval);
-  }, []);
-
   return (
     <HeaderContainer>
       <HeaderInfo>
@@ -0,0 +1,98 @@
+import os
+import sys
+
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+# =====================================================================
+# CONEXÃO FALSA (sem PostgreSQL)
+# =====================================================================
+#
+# Suficiente para o processar_eventos() do app rodar de ponta a ponta:
+# guarda o SQL executado e imita o INSERT ... ON CONFLICT DO NOTHING
+# RETURNING de eventos_chaves (chave só fica gravada no commit). As
+# demais consultas voltam vazias. banco.falhas[trecho] = n faz as n
+# próximas instruções com `trecho` levantarem OperationalError.
+
+class CursorFalso:
+    def __init__(self, banco):
+        self.banco = banco
+        self.connection = banco
+        self._valores = []
+        self._resultado = []
+
+    def mogrify(self, template, args):
+        self._valores.append(tuple(args))
+        return b"(...)"
+
+    def execute(self, sql, args=None):
+        texto = sql.decode("utf-8") if isinstance(sql, bytes) else sql
+        valores, self._valores = self._valores, []
+        for trecho, vezes in self.banco.falhas.items():
+            if vezes and trecho in texto:
+                self.banco.falhas[trecho] -= 1
+                raise psycopg2.OperationalError("falha simulada: " + trecho)
+        self.banco.executados.append((texto, valores or args))
+        self._resultado = []
+        if "INSERT INTO eventos_chaves" in texto:
+            gravadas = self.banco.chaves | self.banco.chaves_pendentes
+            self._resultado = [v for v in valores if v[0] not in gravadas]
+            self.banco.chaves_pendentes.update(v[0] for v in self._resultado)
+
+    def fetchall(self):
+        return self._resultado
+
+    def fetchone(self):
+        return self._resultado[0] if self._resultado else None
+
+    def close(self):
+        pass
+
+
+class BancoFalso:
+    encoding = "UTF8"
+
+    def __init__(self):
+        self.executados = []
+        self.chaves = set()
+        self.chaves_pendentes = set()
+        self.commits = 0
+        self.falhas = {}
+
+    def cursor(self):
+        return CursorFalso(self)
+
+    def commit(self):
+        self.chaves |= self.chaves_pendentes
+        self.chaves_pendentes = set()
+        self.commits += 1
+
+    def rollback(self):
+        self.chaves_pendentes = set()
+
+    def sql(self, trecho: str) -> list:
+        return [valores for texto, valores in self.executados if trecho in texto]
+
+
+@pytest.fixture
+def banco():
+    return BancoFalso()
+
+
+@pytest.fixture
+def app_sem_banco(monkeypatch, banco):
+    """Módulo app usando `banco`, com o cache/estado em memória limpo e sem tarefas de fundo."""
+    import app
+    from deduplicacao import FiltroDuplicados
+
+    monkeypatch.setattr(app, "obter_conexao", lambda: banco)
+    monkeypatch.setattr(app, "cadastrar_maquinas_novas", lambda nomes: None)
+    monkeypatch.setattr(app, "filtro_duplicados", FiltroDuplicados(1000))
+    monkeypatch.setitem(app._particionada, "valor", False)
+    monkeypatch.setitem(app._processo_iniciado, "pid", os.getpid())
+    for chave in app.cache_paradas.backend.itens():
+        app.cache_paradas.backend.apagar(chave)
+    return app
@@ -0,0 +1,56 @@
+from datetime import datetime
+
+from analise_paradas import TURNOS_PADRAO, calcular_disponibilidade, ler_turnos
+
+DESDE = datetime(2025, 11, 3)
+ATE = datetime(2025, 11, 5)
+
+
+class CursorParado:
+    """Devolve (machine, início do período, minutos parados, paradas)."""
+
+    def __init__(self, linhas):
+        self.linhas = linhas
+
+    def execute(self, sql, args):
+        self.args = args
+
+    def fetchall(self):
+        return self.linhas
+
+
+def test_maquina_sem_parada_aparece_com_disponibilidade_total():
+    cur = CursorParado([("Máquina 02", DESDE, 144.0, 3)])
+    resultado = calcular_disponibilidade(
+        cur, DESDE, ATE, "dia", ATE, ler_turnos(TURNOS_PADRAO),
+        cadastradas=["Máquina 01", "Máquina 02"],
+    )
+
+    assert sorted(resultado["totais"]) == ["Máquina 01", "Máquina 02"]
+    assert resultado["totais"]["Máquina 01"]["disponibilidade"] == 1.0
+    assert resultado["totais"]["Máquina 01"]["minutos_planejados"] == 2 * 24 * 60
+    assert resultado["maquinas"]["Máquina 02"][0]["disponibilidade"] == 0.9
+    assert cur.args["maquinas"] is None  # sem filtro: paradas de todas as máquinas
+
+
+def test_filtro_de_maquinas_ignora_o_cadastro():
+    cur = CursorParado([])
+    resultado = calcular_disponibilidade(
+        cur, DESDE, ATE, "dia", ATE, ler_turnos(TURNOS_PADRAO),
+        maquinas=["Máquina 05"], cadastradas=["Máquina 01"],
+    )
+    assert list(resultado["totais"]) == ["Máquina 05"]
+
+
+def test_api_analytics_sem_filtro_lista_o_cadastro(app_sem_banco, monkeypatch):
+    app = app_sem_banco
+    monkeypatch.setattr(app, "sincronizar_maquinas", lambda: None)
+    monkeypatch.setattr(app.registro_maquinas, "nomes", lambda: ["Máquina 01", "Máquina 02"])
+
+    resposta = app.app.test_client().get(
+        "/api/analytics?desde=2025-11-03T00:00:00&ate=2025-11-05T00:00:00"
+    )
+
+    assert resposta.status_code == 200
+    totais = resposta.get_json()["totais"]
+    assert {m: t["disponibilidade"] for m, t in totais.items()} == {"Máquina 01": 1.0, "Máquina 02": 1.0}
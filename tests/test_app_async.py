@@ -0,0 +1,57 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("asyncpg")
+pytest.importorskip("starlette")
+
+import app_async  # noqa: E402
+
+
+class ConexaoFalsa:
+    def __init__(self):
+        self.chamadas = []
+
+    async def execute(self, consulta, *args):
+        self.chamadas.append((consulta, args))
+
+    async def fetch(self, consulta, *args):
+        self.chamadas.append((consulta, args))
+        return [args]
+
+
+def test_para_asyncpg_numera_os_placeholders():
+    sql = "SELECT * FROM paradas WHERE machine = %s AND start_time < %s::timestamp"
+    assert app_async.para_asyncpg(sql) == (
+        "SELECT * FROM paradas WHERE machine = $1 AND start_time < $2::timestamp"
+    )
+
+
+def test_executar_valores_monta_o_template_e_pagina(monkeypatch):
+    monkeypatch.setattr(app_async, "MAX_PARAMETROS", 5)  # 2 linhas de 2 valores por página
+    con = ConexaoFalsa()
+    linhas = [("a", 1), ("b", 2), ("c", 3)]
+
+    resultado = asyncio.run(
+        app_async.executar_valores(
+            con, "INSERT INTO t (x, y) VALUES %s", linhas, template="(%s::text, %s)", fetch=True
+        )
+    )
+
+    assert con.chamadas == [
+        ("INSERT INTO t (x, y) VALUES ($1::text, $2), ($3::text, $4)", ("a", 1, "b", 2)),
+        ("INSERT INTO t (x, y) VALUES ($1::text, $2)", ("c", 3)),
+    ]
+    assert resultado == [("a", 1, "b", 2), ("c", 3)]
+
+
+def test_executar_valores_sem_linhas_nao_vai_ao_banco():
+    con = ConexaoFalsa()
+    assert asyncio.run(app_async.executar_valores(con, "INSERT INTO t VALUES %s", [])) == []
+    assert con.chamadas == []
+
+
+def test_template_padrao_tem_um_placeholder_por_coluna():
+    con = ConexaoFalsa()
+    asyncio.run(app_async.executar_valores(con, "INSERT INTO t VALUES %s", [(1, 2, 3)]))
+    assert con.chamadas == [("INSERT INTO t VALUES ($1, $2, $3)", (1, 2, 3))]
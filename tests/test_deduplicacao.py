@@ -0,0 +1,109 @@
+import psycopg2
+import pytest
+
+from deduplicacao import FiltroDuplicados, chave_evento, restantes
+from maquina_estados import interpretar_evento
+
+LOG = {
+    "machine": "Máquina 09",
+    "tipo": "RUN_CYCLE",
+    "estadoLed": 0,
+    "motivo": "NONE",
+    "data_hora": "2025-11-03 10:00:00",
+    "ts_ms": 125000,
+}
+
+
+def evento(**mudancas):
+    return interpretar_evento({**LOG, **mudancas})
+
+
+def test_chave_igual_para_reenvio_e_diferente_para_outro_evento():
+    assert chave_evento(evento()) == chave_evento(evento())
+    assert chave_evento(evento()) != chave_evento(evento(ts_ms=126000))
+    assert chave_evento(evento()) != chave_evento(evento(estadoLed=1))
+
+
+def test_evento_sem_ts_ms_nao_tem_chave():
+    assert chave_evento(evento(ts_ms=0)) is None
+
+
+def test_filtro_tira_repetidos_no_lote_e_os_ja_lembrados():
+    filtro = FiltroDuplicados(10)
+    a, b, sem_chave = evento(), evento(ts_ms=126000), evento(ts_ms=None)
+
+    novos, chaves, duplicados = filtro.filtrar([a, evento(), sem_chave, sem_chave])
+    assert novos == [a, sem_chave, sem_chave]
+    assert duplicados == 1
+    assert list(chaves) == [id(a)]
+
+    filtro.lembrar(chaves.values())
+    novos, chaves, duplicados = filtro.filtrar([evento(), b])
+    assert novos == [b]
+    assert duplicados == 1
+
+
+def test_filtro_respeita_capacidade():
+    filtro = FiltroDuplicados(2)
+    eventos = [evento(ts_ms=1000 * i) for i in range(1, 4)]
+    filtro.lembrar(chave_evento(ev) for ev in eventos)
+    assert len(filtro) == 2
+    # O mais antigo saiu do LRU e volta a ser aceito
+    novos, _, duplicados = filtro.filtrar([evento(ts_ms=1000)])
+    assert len(novos) == 1 and duplicados == 0
+
+
+def test_restantes_tira_so_as_chaves_que_o_banco_ja_tinha():
+    a, b, sem_chave = evento(), evento(ts_ms=126000), evento(ts_ms=0)
+    chaves = {id(a): chave_evento(a), id(b): chave_evento(b)}
+    novos, gravadas, duplicados = restantes([a, b, sem_chave], chaves, [(chave_evento(b),)])
+    assert novos == [b, sem_chave]
+    assert gravadas == [chave_evento(b)]
+    assert duplicados == 1
+
+
+def duplicados_contados(app) -> float:
+    series = app.metricas.snapshot()["maroni_eventos_duplicados_total"]["series"]
+    return sum(valor for _, valor in series)
+
+
+def test_mesmo_evento_duas_vezes_no_processar_eventos(app_sem_banco, banco):
+    app = app_sem_banco
+    antes = duplicados_contados(app)
+
+    primeiro = app.processar_eventos([dict(LOG)], threshold_minutos=0.1)
+    segundo = app.processar_eventos([dict(LOG)], threshold_minutos=0.1)
+
+    assert primeiro["duplicados"] == 0 and primeiro["eventos"] == 1
+    assert segundo["duplicados"] == 1 and segundo["eventos"] == 0
+    assert len(banco.sql("INSERT INTO eventos_brutos")) == 1
+    assert duplicados_contados(app) == antes + 1
+
+
+def test_reenvio_para_outro_worker_e_barrado_pelo_banco(app_sem_banco, banco, monkeypatch):
+    app = app_sem_banco
+    app.processar_eventos([dict(LOG)], threshold_minutos=0.1)
+
+    # Outro worker: LRU vazio, só eventos_chaves sabe que o evento já entrou
+    monkeypatch.setattr(app, "filtro_duplicados", FiltroDuplicados(1000))
+    resumo = app.processar_eventos([dict(LOG)], threshold_minutos=0.1)
+
+    assert resumo["duplicados"] == 1
+    assert len(banco.sql("INSERT INTO eventos_brutos")) == 1
+
+
+def test_estado_de_led_so_vale_depois_do_commit(app_sem_banco, banco):
+    app = app_sem_banco
+    parada = dict(LOG, tipo="STOP", estadoLed=1, motivo="FALTA_MATERIAL")
+    banco.falhas["INSERT INTO eventos_brutos"] = 1
+
+    with pytest.raises(psycopg2.OperationalError):
+        app.processar_eventos([parada], threshold_minutos=0.1)
+    banco.rollback()
+    assert app.estado_maquinas.obter(LOG["machine"]) is None
+
+    # A nova tentativa (fila) ainda vê a mudança e grava machine_states
+    app.processar_eventos([parada], threshold_minutos=0.1)
+    [linhas] = banco.sql("INSERT INTO machine_states")
+    assert [linha[:2] for linha in linhas] == [(LOG["machine"], 1)]
+    assert app.estado_maquinas.obter(LOG["machine"]) == 1
@@ -0,0 +1,129 @@
+import csv
+import io
+from datetime import datetime
+from decimal import Decimal
+
+import pytest
+
+from exportacao import COLUNAS, gerar_csv, gerar_exportacao, ler_blocos, montar_consulta
+
+LINHA = (
+    7, "Máquina 01", "Manutenção", "AUTO",
+    datetime(2025, 11, 3, 8, 0), None, Decimal("12.50"), datetime(2025, 11, 3, 8, 0, 5),
+)
+
+
+class CursorNomeado:
+    """Named cursor falso: entrega `linhas` em fetchmany(n)."""
+
+    def __init__(self, linhas):
+        self.linhas = list(linhas)
+        self.pedidos = []
+        self.fechado = False
+
+    def execute(self, sql, params):
+        self.sql, self.params = sql, params
+
+    def fetchmany(self, n):
+        self.pedidos.append(n)
+        lote, self.linhas = self.linhas[:n], self.linhas[n:]
+        return lote
+
+    def close(self):
+        self.fechado = True
+
+
+class ConexaoFalsa:
+    def __init__(self, linhas):
+        self.cur = CursorNomeado(linhas)
+        self.sessao = None
+        self.nome_cursor = None
+        self.rollbacks = 0
+        self.fechada = False
+
+    def set_session(self, **opcoes):
+        self.sessao = opcoes
+
+    def cursor(self, name=None):
+        self.nome_cursor = name
+        return self.cur
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.fechada = True
+
+
+def test_csv_comeca_com_bom_so_no_primeiro_pedaco():
+    pedacos = list(gerar_csv([[LINHA], [LINHA]]))
+    assert pedacos[0].startswith(b"\xef\xbb\xbf")
+    assert not any(p.startswith(b"\xef\xbb\xbf") for p in pedacos[1:])
+    texto = b"".join(pedacos).decode("utf-8-sig")
+    linhas = list(csv.reader(io.StringIO(texto)))
+    assert linhas[0] == list(COLUNAS)
+    assert linhas[1] == [
+        "7", "Máquina 01", "Manutenção", "AUTO",
+        "2025-11-03 08:00:00", "", "12.50", "2025-11-03 08:00:05",
+    ]
+    assert len(linhas) == 3
+
+
+def test_csv_entrega_um_pedaco_por_bloco_sem_ler_adiante():
+    lidos = []
+
+    def blocos():
+        for i in range(3):
+            lidos.append(i)
+            yield [LINHA] * (i + 1)
+
+    pedacos = gerar_csv(blocos())
+    assert next(pedacos).decode("utf-8-sig").startswith("id,machine")
+    assert lidos == []
+    primeiro = next(pedacos)
+    assert lidos == [0]
+    assert primeiro.count(b"\r\n") == 1
+    assert [p.count(b"\r\n") for p in pedacos] == [2, 3]
+
+
+def test_csv_com_separador_ponto_e_virgula():
+    texto = b"".join(gerar_exportacao("csv", [[LINHA]], ";")).decode("utf-8-sig")
+    assert texto.splitlines()[0] == ";".join(COLUNAS)
+    assert texto.splitlines()[1].startswith("7;Máquina 01;")
+
+
+def test_formato_desconhecido():
+    with pytest.raises(ValueError):
+        gerar_exportacao("xlsx", [])
+
+
+def test_ler_blocos_usa_cursor_no_servidor_e_fecha_a_conexao():
+    conn = ConexaoFalsa([LINHA] * 5)
+    blocos = list(ler_blocos(conn, {"machines": ["Máquina 01"], "origem": "AUTO"}, bloco=2))
+
+    assert [len(b) for b in blocos] == [2, 2, 1]
+    assert conn.nome_cursor == "exportacao_paradas"
+    assert conn.cur.itersize == 2
+    assert set(conn.cur.pedidos) == {2}
+    assert conn.cur.params == [["Máquina 01"], "AUTO"]
+    assert conn.sessao == {"readonly": True}
+    assert conn.cur.fechado and conn.rollbacks == 1 and conn.fechada
+
+
+def test_ler_blocos_fecha_a_conexao_se_o_cliente_desiste():
+    conn = ConexaoFalsa([LINHA] * 5)
+    blocos = ler_blocos(conn, {}, bloco=2)
+    next(blocos)
+    blocos.close()
+    assert conn.fechada
+
+
+def test_montar_consulta_so_filtra_o_que_veio():
+    sql, params = montar_consulta({})
+    assert "WHERE" not in sql and params == []
+
+    desde, ate = datetime(2025, 1, 1), datetime(2025, 2, 1)
+    sql, params = montar_consulta({"desde": desde, "ate": ate})
+    assert "start_time >= %s AND start_time < %s" in sql
+    assert params == [desde, ate]
+    assert sql.strip().endswith("ORDER BY start_time, id")
@@ -0,0 +1,180 @@
+import os
+import queue
+import subprocess
+import sys
+import time
+import zlib
+
+import pytest
+
+import fila_eventos
+from fila_eventos import FilaEscrita, aplicar_itens
+
+
+class Transitorio(Exception):
+    pass
+
+
+@pytest.fixture(autouse=True)
+def sem_espera(monkeypatch):
+    monkeypatch.setattr(fila_eventos.time, "sleep", lambda s: None)
+
+
+def aplicador(falhas=(), transitorias=0):
+    """aplicar() que grava os dados e recusa os que têm machine em `falhas`."""
+    aplicados = []
+    restantes = [transitorias]
+
+    def aplicar(dados):
+        if restantes[0]:
+            restantes[0] -= 1
+            raise Transitorio("banco fora do ar")
+        if any(d.get("machine") in falhas for d in dados):
+            raise ValueError("valor grande demais para a coluna")
+        aplicados.extend(dados)
+
+    return aplicar, aplicados
+
+
+def item(*maquinas):
+    return (time.time(), [{"machine": m, "estadoLed": 0} for m in maquinas])
+
+
+def test_erro_transitorio_repete_o_lote_inteiro():
+    aplicar, aplicados = aplicador(transitorias=2)
+    erros, descartados = aplicar_itens(aplicar, [item("A"), item("B")], (Transitorio,), "teste")
+    assert (erros, descartados) == (2, 0)
+    assert [d["machine"] for d in aplicados] == ["A", "B"]
+
+
+def test_erro_de_conteudo_descarta_so_o_item_ruim():
+    aplicar, aplicados = aplicador(falhas={"ruim"})
+    itens = [item("A"), item("ruim", "B"), item("C")]
+    erros, descartados = aplicar_itens(aplicar, itens, (Transitorio,), "teste")
+    assert descartados == 2  # o item inteiro (um /log/batch não é dividido)
+    assert erros == 2  # o lote e depois o item
+    assert [d["machine"] for d in aplicados] == ["A", "C"]
+
+
+def test_item_unico_ruim_e_descartado_sem_nova_tentativa():
+    aplicar, aplicados = aplicador(falhas={"ruim"})
+    assert aplicar_itens(aplicar, [item("ruim")], (Transitorio,), "teste") == (1, 1)
+    assert aplicados == []
+
+
+def test_fila_segue_depois_de_um_evento_ruim():
+    aplicar, aplicados = aplicador(falhas={"ruim"})
+    fila = FilaEscrita(aplicar, espera_lote_s=0.0, transitorios=(Transitorio,))
+    fila.enfileirar([{"machine": "ruim", "estadoLed": 1}])
+    fila.enfileirar([{"machine": "A", "estadoLed": 1}])
+
+    limite = time.monotonic() + 5
+    while fila.metricas()["profundidade"] and time.monotonic() < limite:
+        time.sleep(0.01)
+
+    metricas = fila.metricas()
+    assert metricas["profundidade"] == 0
+    assert metricas["descartados_total"] == 1
+    assert metricas["erros_total"] >= 1
+    assert [d["machine"] for d in aplicados] == ["A"]
+
+
+# ---------------------------------------------------------------------
+# FILA PARTICIONADA
+# ---------------------------------------------------------------------
+
+APLICADOS = []
+
+
+def aplicar_recusando(dados):
+    """Referência "modulo:funcao" para _loop_particao (importada como na partição)."""
+    if any(d.get("machine") == "ruim" for d in dados):
+        raise ValueError("valor grande demais para a coluna")
+    APLICADOS.append(dados)
+
+
+def test_particao_de_e_estavel_e_dentro_do_total():
+    maquinas = [f"Máquina {i:02d}" for i in range(1, 51)]
+    particoes = [fila_eventos.particao_de(m, 4) for m in maquinas]
+    assert particoes == [fila_eventos.particao_de(m, 4) for m in maquinas]
+    assert set(particoes) == {0, 1, 2, 3}
+    assert fila_eventos.particao_de(None, 4) == fila_eventos.particao_de("", 4)
+
+
+def test_particao_de_e_o_crc32_do_nome():
+    for machine in ("Máquina 01", "Injetora 7", "", "ç"):
+        esperado = zlib.crc32(machine.encode("utf-8")) % 6
+        assert fila_eventos.particao_de(machine, 6) == esperado
+
+
+def test_particao_de_nao_depende_do_hash_seed_do_processo():
+    # As partições rodam em processos spawn: hash() de str mudaria entre eles.
+    maquinas = [f"Máquina {i:02d}" for i in range(1, 21)]
+    codigo = (
+        "import fila_eventos, json\n"
+        f"print(json.dumps([fila_eventos.particao_de(m, 4) for m in {maquinas!r}]))"
+    )
+    raiz = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    saidas = []
+    for semente in ("1", "2"):
+        ambiente = dict(os.environ, PYTHONHASHSEED=semente, PYTHONPATH=raiz)
+        saida = subprocess.run(
+            [sys.executable, "-c", codigo], env=ambiente, capture_output=True, text=True, check=True
+        )
+        saidas.append(saida.stdout.strip())
+    esperado = str([fila_eventos.particao_de(m, 4) for m in maquinas])
+    assert saidas == [esperado, esperado]
+
+
+def test_enfileirar_divide_o_lote_pela_particao_de_cada_maquina(monkeypatch):
+    fila = fila_eventos.FilaParticionada("x:y", 4, maquina_de=lambda dado: dado["machine"])
+    filas = [queue.Queue() for _ in range(4)]
+    monkeypatch.setattr(fila, "_garantir_processos", lambda: None)
+    fila._filas = filas
+
+    dados = [{"machine": f"M{i % 5}", "seq": i} for i in range(20)]
+    fila.enfileirar(dados)
+
+    recebidos = {}
+    for indice, fila_particao in enumerate(filas):
+        while not fila_particao.empty():
+            _, parte = fila_particao.get_nowait()
+            for dado in parte:
+                assert fila_eventos.particao_de(dado["machine"], 4) == indice
+                recebidos.setdefault(dado["machine"], []).append(dado["seq"])
+    # Cada máquina inteira numa partição só, na ordem em que chegou
+    assert recebidos == {f"M{m}": list(range(m, 20, 5)) for m in range(5)}
+    assert sum(fila.metricas()["particoes"]) == 20
+
+
+def test_enfileirar_usa_o_nome_normalizado_da_maquina(monkeypatch):
+    fila = fila_eventos.FilaParticionada(
+        "x:y", 8, maquina_de=lambda dado: dado.get("machine") or "Máquina 01"
+    )
+    filas = [queue.Queue() for _ in range(8)]
+    monkeypatch.setattr(fila, "_garantir_processos", lambda: None)
+    fila._filas = filas
+
+    fila.enfileirar([{"estadoLed": 1}])
+    indice = fila_eventos.particao_de("Máquina 01", 8)
+    assert filas[indice].qsize() == 1
+    assert fila.metricas()["particoes"][indice] == 1
+
+
+def test_particao_segue_depois_de_um_evento_ruim():
+    entrada, concluidos = queue.Queue(), queue.Queue()
+    APLICADOS.clear()
+    entrada.put((time.time(), [{"machine": "ruim"}]))
+    entrada.put((time.time(), [{"machine": "A"}]))
+    entrada.put(None)
+
+    fila_eventos._loop_particao(
+        0, 1, "test_fila_eventos:aplicar_recusando", None, entrada, concluidos, 500, 0.0, (Transitorio,)
+    )
+
+    lotes = []
+    while not concluidos.empty():
+        lotes.append(concluidos.get_nowait())
+    assert sum(lote[1] for lote in lotes) == 2
+    assert sum(lote[5] for lote in lotes) == 1
+    assert APLICADOS == [[{"machine": "A"}]]
@@ -0,0 +1,64 @@
+from datetime import datetime
+
+from consultas_paradas import SQL_FECHAR_AUTO_LOTE, SQL_GRAVAR_ESTADOS, SQL_TRAVAR_MAQUINAS
+from gravacao_paradas import SQL_NOTIFICAR, instrucoes_plano
+
+INICIO = datetime(2025, 11, 3, 10, 0)
+FIM = datetime(2025, 11, 3, 10, 30)
+
+
+def rodar(instrucoes, respostas: dict):
+    """Executa o gerador devolvendo respostas[sql] às instruções com fetch."""
+    feitas, retorno = [], None
+    while True:
+        try:
+            instrucao = instrucoes.send(retorno)
+        except StopIteration as fim:
+            return feitas, fim.value
+        feitas.append(instrucao)
+        retorno = respostas.get(instrucao.sql, []) if instrucao.fetch else None
+
+
+def plano(**partes) -> dict:
+    return {"planos": {}, "para_fechar": [], "fechadas": [], "para_abrir": [], "descartadas": 0,
+            **partes}
+
+
+def test_fechamento_conta_fechadas_e_descartadas_e_vai_para_o_push():
+    p = plano(
+        planos={"M1": {}, "M2": {}},
+        para_fechar=[("M1", FIM, "Setup", 1.0), ("M2", FIM, "Setup", 1.0)],
+    )
+    resumo = {"fechadas": 0, "descartadas": 0}
+    push = []
+    linhas = [(1, "M1", "Setup", INICIO, 30.0, False), (2, "M2", "Setup", FIM, 0.2, True)]
+
+    feitas, abertas = rodar(
+        instrucoes_plano(p, resumo, push=push, particionada=True, publicar=False),
+        {SQL_FECHAR_AUTO_LOTE: linhas},
+    )
+
+    # A trava das máquinas vem antes de mexer nas paradas
+    assert feitas[0].sql == SQL_TRAVAR_MAQUINAS and feitas[0].linhas == (["M1", "M2"],)
+    assert not feitas[0].lote
+    assert resumo == {"fechadas": 1, "descartadas": 1}
+    assert abertas == []
+    assert [ev["tipo"] for ev in push[:2]] == ["parada_fechada", "parada_descartada"]
+    # Só a fechada soma nos agregados
+    assert any("paradas_agregado" in i.sql for i in feitas)
+
+
+def test_so_estado_de_led_inteiro_vai_para_machine_states_e_push_vira_notify():
+    estados = [("M1", 1, INICIO), ("M2", "?", INICIO)]
+    push = [{"tipo": "estado", "machine": "M1", "estadoLed": 1}]
+
+    feitas, _ = rodar(instrucoes_plano(plano(), {}, estados=estados, push=push), {})
+
+    assert [i.sql for i in feitas] == [SQL_GRAVAR_ESTADOS, SQL_NOTIFICAR]
+    assert feitas[0].linhas == [("M1", 1, INICIO)]
+    assert not feitas[1].lote
+
+
+def test_plano_vazio_sem_push_nao_gera_instrucao():
+    feitas, abertas = rodar(instrucoes_plano(plano(), {}), {})
+    assert feitas == [] and abertas == []
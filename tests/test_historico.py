@@ -0,0 +1,54 @@
+from datetime import datetime
+
+import pytest
+
+from consultas_paradas import (
+    codificar_cursor,
+    decodificar_cursor,
+    ler_filtros_historico,
+    montar_consulta_historico,
+    pagina_historico,
+)
+
+
+def linha(pid: int, minuto: int):
+    inicio = datetime(2025, 11, 3, 10, minuto)
+    return (pid, "Máquina 01", "Setup", "AUTO", inicio, None, None)
+
+
+def test_cursor_ida_e_volta():
+    inicio = datetime(2025, 11, 3, 10, 15, 30, 123456)
+    cursor = codificar_cursor(inicio, 42)
+    assert "=" not in cursor
+    assert decodificar_cursor(cursor) == (inicio, 42)
+
+
+@pytest.mark.parametrize("cursor", ["", "nao-e-base64!", codificar_cursor(datetime(2025, 1, 1), 1)[:-3]])
+def test_cursor_invalido(cursor):
+    with pytest.raises(ValueError):
+        decodificar_cursor(cursor)
+
+
+def test_consulta_pede_uma_linha_a_mais_e_continua_do_cursor():
+    inicio = datetime(2025, 11, 3, 10, 0)
+    sql, params = montar_consulta_historico({"machine": "Máquina 01"}, 20, (inicio, 7))
+    assert "(start_time, id) < (%s, %s)" in sql
+    assert "ORDER BY start_time DESC, id DESC" in sql
+    assert params == ("Máquina 01", inicio, 7, 21)
+
+
+def test_pagina_com_sobra_tem_proximo_cursor_da_ultima_linha():
+    linhas = [linha(3, 30), linha(2, 20), linha(1, 10)]
+
+    itens, proximo = pagina_historico(linhas, 2)
+    assert [i["id"] for i in itens] == [3, 2]
+    assert decodificar_cursor(proximo) == (linhas[1][4], 2)
+
+    itens, proximo = pagina_historico(linhas, 3)
+    assert len(itens) == 3 and proximo is None
+
+
+def test_filtros_de_data_invalidos():
+    with pytest.raises(ValueError):
+        ler_filtros_historico({"desde": "ontem"})
+    assert ler_filtros_historico({"machine": "", "origem": "AUTO"}) == {"origem": "AUTO"}
@@ -0,0 +1,48 @@
+from datetime import datetime
+
+from linha_do_tempo import calcular_linha_do_tempo
+
+DESDE = datetime(2025, 11, 3, 0, 0)
+ATE = datetime(2025, 11, 3, 6, 0)
+
+
+class CursorBaldes:
+    """Devolve (machine, balde, segundos parado, segundos desligada, motivo dominante)."""
+
+    def __init__(self, linhas):
+        self.linhas = linhas
+
+    def execute(self, sql, args):
+        self.args = args
+
+    def fetchall(self):
+        return self.linhas
+
+
+def test_baldes_iguais_viram_um_trecho():
+    cur = CursorBaldes(
+        [
+            ("M1", 0, 3600, 0, "Setup"),
+            ("M1", 1, 3600, 0, "Setup"),
+            ("M1", 2, 600, 1800, "Falha"),
+        ]
+    )
+    agora = datetime(2025, 11, 3, 4, 30)
+    resultado = calcular_linha_do_tempo(cur, DESDE, ATE, 6, agora, ["M1", "M2"])
+
+    assert cur.args["passo_s"] == 3600
+    assert resultado["maquinas"]["M1"]["trechos"] == [
+        [0, 2, "STOP", "Setup", 1.0],
+        [2, 1, "OFF", "Falha", 0.17],
+        [3, 2, "RUN", None, 0.0],  # o balde 4 só tem 30 min decorridos
+        [5, 1, None, None, None],  # futuro
+    ]
+    assert resultado["maquinas"]["M1"]["minutos_parada"] == 130.0
+    assert resultado["maquinas"]["M2"]["trechos"] == [[0, 5, "RUN", None, 0.0], [5, 1, None, None, None]]
+    assert resultado["maquinas"]["M2"]["fracao_parada"] == 0.0
+
+
+def test_empate_favorece_stop():
+    cur = CursorBaldes([("M1", 0, 1800, 0, "Setup")])
+    resultado = calcular_linha_do_tempo(cur, DESDE, ATE, 6, ATE, ["M1"])
+    assert resultado["maquinas"]["M1"]["trechos"][0] == [0, 1, "STOP", "Setup", 0.5]
@@ -0,0 +1,69 @@
+import pytest
+
+from maquina_estados import validar_evento
+
+VALIDO = {"machine": "Máquina 01", "tipo": "MOTIVO", "estadoLed": 1, "motivo": "SETUP", "ts_ms": 5000}
+
+
+@pytest.mark.parametrize(
+    "mudancas",
+    [
+        {"motivo": 5},
+        {"tipo": ["RUN_CYCLE"]},
+        {"machine": ["Máquina 01"]},
+        {"machine": "M" * 51},
+        {"motivo": "X" * 101},
+        {"estadoLed": {"valor": 1}},
+        {"estadoLed": 40000},
+        {"ts_ms": 2 ** 64},
+    ],
+)
+def test_validar_evento_recusa_o_que_o_banco_nao_aceita(mudancas):
+    assert validar_evento({**VALIDO, **mudancas})
+
+
+@pytest.mark.parametrize(
+    "mudancas",
+    [{}, {"machine": None}, {"estadoLed": None}, {"ts_ms": "abc"}, {"data_hora": "lixo"}, {"machine": "M" * 50}],
+)
+def test_validar_evento_aceita_logs_do_firmware(mudancas):
+    assert validar_evento({**VALIDO, **mudancas}) is None
+
+
+def test_validar_evento_recusa_o_que_nao_e_objeto():
+    assert validar_evento(["Máquina 01", 1])
+
+
+@pytest.fixture
+def cliente(app_sem_banco, monkeypatch):
+    enfileirados = []
+    monkeypatch.setattr(app_sem_banco, "FILA_ESCRITA", True)
+    monkeypatch.setattr(app_sem_banco.fila_escrita, "enfileirar", enfileirados.append)
+    monkeypatch.setattr(app_sem_banco, "arquivar_eventos", lambda dados: None)
+    monkeypatch.setattr(app_sem_banco, "sinalizar_comunicacao", lambda dados: None)
+    cliente = app_sem_banco.app.test_client()
+    cliente.enfileirados = enfileirados
+    return cliente
+
+
+@pytest.mark.parametrize(
+    "dado",
+    [{**VALIDO, "motivo": 5}, {**VALIDO, "machine": ["A"]}, {**VALIDO, "machine": "M" * 51}, [1, 2]],
+)
+def test_log_malformado_volta_400_sem_entrar_na_fila(cliente, dado):
+    resposta = cliente.post("/log", json=dado)
+    assert resposta.status_code == 400
+    assert cliente.enfileirados == []
+
+
+def test_lote_com_um_evento_malformado_volta_400(cliente):
+    resposta = cliente.post("/log/batch", json=[VALIDO, {**VALIDO, "tipo": 3}])
+    assert resposta.status_code == 400
+    assert "Evento 1" in resposta.get_json()["msg"]
+    assert cliente.enfileirados == []
+
+
+def test_log_valido_entra_na_fila(cliente):
+    assert cliente.post("/log", json=VALIDO).status_code == 202
+    assert cliente.post("/log/batch", json=[VALIDO, VALIDO]).status_code == 202
+    assert len(cliente.enfileirados) == 2
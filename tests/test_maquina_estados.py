@@ -0,0 +1,117 @@
+from datetime import datetime, timedelta
+
+from maquina_estados import (
+    MOTIVO_SEM_COMUNICACAO,
+    TIPO_SEM_COMUNICACAO,
+    aberta_do_cache,
+    agrupar_eventos,
+    pendencia_vencida,
+    planejar_paradas,
+)
+
+T0 = datetime(2025, 11, 3, 8, 0, 0)
+M = "Máquina 01"
+THRESHOLD = 0.1  # min (6 s)
+
+
+def log(segundos: float, estado_led: int, tipo: str = "RUN_CYCLE", motivo: str = "NONE",
+        machine: str = M) -> dict:
+    return {
+        "machine": machine,
+        "tipo": tipo,
+        "estadoLed": estado_led,
+        "motivo": motivo,
+        "data_hora": (T0 + timedelta(seconds=segundos)).strftime("%Y-%m-%d %H:%M:%S"),
+        "ts_ms": int(segundos * 1000) + 1,
+    }
+
+
+def planejar(logs, abertas=None, janela_s=0.0, agora_s=None):
+    _, por_maquina, _ = agrupar_eventos(logs)
+    agora = None if agora_s is None else T0 + timedelta(seconds=agora_s)
+    return planejar_paradas(por_maquina, abertas or {}, THRESHOLD, janela_s, agora)
+
+
+def persistida(reason="Sem motivo", inicio_s=0, parada_id=7):
+    return aberta_do_cache(
+        {"id": parada_id, "reason": reason, "start_time": (T0 + timedelta(seconds=inicio_s)).isoformat()}
+    )
+
+
+def test_parada_que_abre_e_fecha_no_lote_vira_uma_fechada():
+    plano = planejar([log(0, 1), log(30, 1, "MOTIVO", "SETUP"), log(300, 0)])
+    assert plano["fechadas"] == [(M, "Setup", T0, T0 + timedelta(seconds=300), 5.0)]
+    assert plano["para_fechar"] == [] and plano["para_abrir"] == []
+
+
+def test_piscada_abaixo_do_threshold_e_descartada():
+    plano = planejar([log(0, 1), log(2, 0)])
+    assert plano["descartadas"] == 1
+    assert plano["fechadas"] == []
+
+
+def test_parada_nova_fica_pendente_ate_o_threshold():
+    pendente = planejar([log(0, 1)], agora_s=2)
+    assert pendente["para_abrir"] == []
+    assert pendente["planos"][M]["final"]["persistida"] is False
+
+    vencida = planejar([log(0, 1)], agora_s=10)
+    assert vencida["para_abrir"] == [(M, "Sem motivo", T0)]
+
+
+def test_led_verde_fecha_a_parada_ja_gravada():
+    plano = planejar([log(120, 0)], abertas={M: persistida()})
+    assert plano["para_fechar"] == [(M, T0 + timedelta(seconds=120), "Sem motivo", THRESHOLD)]
+
+
+def test_motivo_troca_a_parada_gravada():
+    plano = planejar([log(60, 1, "MOTIVO", "MANUTENCAO")], abertas={M: persistida()})
+    assert plano["para_abrir"] == [(M, "Manutenção", T0)]
+    assert plano["para_fechar"] == []
+
+
+def test_evento_que_nao_muda_nada_nao_gera_escrita():
+    plano = planejar([log(60, 1)], abertas={M: persistida()})
+    assert (plano["para_abrir"], plano["para_fechar"], plano["fechadas"]) == ([], [], [])
+
+
+def test_oscilacao_dentro_da_janela_e_uma_parada_so():
+    logs = [log(0, 1), log(60, 0), log(70, 1), log(200, 0)]
+    plano = planejar(logs, janela_s=30, agora_s=500)
+    assert plano["fechadas"] == [(M, "Sem motivo", T0, T0 + timedelta(seconds=200), 200 / 60.0)]
+
+    # Sem janela, o mesmo sinal são duas paradas
+    plano = planejar(logs)
+    assert len(plano["fechadas"]) == 2
+
+
+def test_fechamento_provisorio_espera_a_janela():
+    plano = planejar([log(0, 1), log(60, 0)], janela_s=30, agora_s=70)
+    final = plano["planos"][M]["final"]
+    assert final["fim"] == T0 + timedelta(seconds=60)
+    assert plano["fechadas"] == [] and plano["para_abrir"] == []
+
+
+def test_sem_comunicacao_abre_e_o_proximo_evento_fecha():
+    plano = planejar([log(0, 1, TIPO_SEM_COMUNICACAO), log(600, 0)])
+    assert plano["fechadas"] == [(M, MOTIVO_SEM_COMUNICACAO, T0, T0 + timedelta(seconds=600), 10.0)]
+
+
+def test_maquinas_sao_independentes():
+    plano = planejar([log(0, 1), log(0, 1, machine="Máquina 02"), log(60, 0)], agora_s=120)
+    assert [f[0] for f in plano["fechadas"]] == [M]
+    assert plano["para_abrir"] == [("Máquina 02", "Sem motivo", T0)]
+
+
+def test_pendencia_vencida():
+    agora = T0 + timedelta(seconds=10)
+    pendente = {"id": None, "reason": "Sem motivo", "start_time": T0.isoformat(), "fim": None}
+    assert pendencia_vencida(pendente, agora, THRESHOLD, 30)
+    assert not pendencia_vencida(pendente, T0 + timedelta(seconds=2), THRESHOLD, 30)
+
+    fechando = {**pendente, "id": 7, "fim": (T0 + timedelta(seconds=5)).isoformat()}
+    assert not pendencia_vencida(fechando, agora, THRESHOLD, 30)
+    assert pendencia_vencida(fechando, T0 + timedelta(seconds=40), THRESHOLD, 30)
+
+    assert not pendencia_vencida({**pendente, "id": 7}, agora, THRESHOLD, 30)
+    assert not pendencia_vencida(None, agora, THRESHOLD, 30)
@@ -0,0 +1,148 @@
+from datetime import datetime
+
+import pytest
+
+import migracoes
+from migracoes import MIGRACOES, aplicar_migracoes, garantir_particoes, particionar_paradas
+
+
+class Agora(datetime):
+    """datetime com now() fixo em 15/11/2025."""
+
+    @classmethod
+    def now(cls, tz=None):
+        return cls(2025, 11, 15, 10, 30)
+
+
+@pytest.fixture(autouse=True)
+def relogio(monkeypatch):
+    monkeypatch.setattr(migracoes, "datetime", Agora)
+
+
+class CursorMigracao:
+    """Guarda o SQL (espaços normalizados) e responde pelo último."""
+
+    def __init__(self, aplicadas=(), particionada=False, mais_antiga=None):
+        self.aplicadas = list(aplicadas)
+        self.particionada = particionada
+        self.mais_antiga = mais_antiga
+        self.executados = []
+        self.ultimo = ""
+
+    def execute(self, sql, params=None):
+        self.ultimo = " ".join(sql.split())
+        self.executados.append((self.ultimo, params))
+
+    def fetchone(self):
+        if "pg_partitioned_table" in self.ultimo:
+            return (self.particionada,)
+        return (self.mais_antiga,)
+
+    def fetchall(self):
+        return [(nome,) for nome in self.aplicadas]
+
+    def close(self):
+        pass
+
+    def sqls(self):
+        return [sql for sql, _ in self.executados]
+
+
+class ConexaoMigracao:
+    def __init__(self, cur):
+        self.cur = cur
+        self.commits = 0
+
+    def cursor(self):
+        return self.cur
+
+    def commit(self):
+        self.commits += 1
+
+
+# ---------------------------------------------------------------------
+# MIGRAÇÕES
+# ---------------------------------------------------------------------
+
+def test_aplica_so_as_pendentes_em_ordem_uma_transacao_cada():
+    nomes = [nome for nome, _ in MIGRACOES]
+    cur = CursorMigracao(aplicadas=nomes[:3])
+    conn = ConexaoMigracao(cur)
+
+    assert aplicar_migracoes(conn) == nomes[3:]
+    registradas = [
+        params[0] for sql, params in cur.executados if sql.startswith("INSERT INTO schema_migracoes")
+    ]
+    assert registradas == nomes[3:]
+    assert conn.commits == 1 + len(nomes[3:])  # schema_migracoes + uma por migração
+
+
+def test_nada_pendente():
+    cur = CursorMigracao(aplicadas=[nome for nome, _ in MIGRACOES])
+    assert aplicar_migracoes(ConexaoMigracao(cur)) == []
+    assert len(cur.executados) == 2
+
+
+# ---------------------------------------------------------------------
+# PARTIÇÕES MENSAIS
+# ---------------------------------------------------------------------
+
+def test_garantir_particoes_vira_o_ano():
+    cur = CursorMigracao()
+
+    criadas = garantir_particoes(cur, meses_a_frente=3)
+
+    assert criadas == ["paradas_p202511", "paradas_p202512", "paradas_p202601", "paradas_p202602"]
+    faixas = [params for _, params in cur.executados]
+    assert faixas[1] == (datetime(2025, 12, 1), datetime(2026, 1, 1))
+    # cada partição começa onde a anterior termina
+    assert all(a[1] == b[0] for a, b in zip(faixas, faixas[1:]))
+    assert all(
+        sql.startswith(f"CREATE TABLE IF NOT EXISTS {nome} PARTITION OF paradas")
+        for (sql, _), nome in zip(cur.executados, criadas)
+    )
+
+
+def test_garantir_particoes_desde_um_mes_antigo():
+    cur = CursorMigracao()
+    criadas = garantir_particoes(cur, meses_a_frente=0, desde=datetime(2025, 8, 20, 14, 0))
+    assert criadas == ["paradas_p202508", "paradas_p202509", "paradas_p202510", "paradas_p202511"]
+    assert cur.executados[0][1] == (datetime(2025, 8, 1), datetime(2025, 9, 1))
+
+
+def test_particionar_copia_depois_de_criar_as_particoes_desde_a_mais_antiga():
+    cur = CursorMigracao(mais_antiga=datetime(2025, 9, 3, 7, 0))
+    conn = ConexaoMigracao(cur)
+
+    assert particionar_paradas(conn, meses_a_frente=1) is True
+
+    sqls = cur.sqls()
+
+    def posicao(inicio):
+        return next(i for i, s in enumerate(sqls) if s.startswith(inicio))
+
+    ordem = [
+        posicao("LOCK TABLE paradas IN ACCESS EXCLUSIVE MODE"),
+        posicao("ALTER TABLE paradas RENAME TO paradas_legado"),
+        posicao("CREATE TABLE paradas ("),
+        posicao("CREATE TABLE paradas_p_default PARTITION OF paradas DEFAULT"),
+        posicao("CREATE TABLE IF NOT EXISTS paradas_p202509"),
+        posicao("CREATE TABLE IF NOT EXISTS paradas_p202512"),
+        posicao("INSERT INTO paradas (id,"),
+        posicao("DROP TABLE paradas_legado"),
+        posicao("CREATE INDEX ix_paradas_auto_aberta"),
+    ]
+    assert ordem == sorted(ordem)
+    assert "PARTITION BY RANGE (start_time)" in sqls[ordem[2]]
+    assert "PRIMARY KEY (id, start_time)" in sqls[ordem[2]]
+    # índice único não existe em tabela particionada: o app trava por máquina
+    assert not any(s.startswith("CREATE UNIQUE INDEX") for s in sqls)
+    assert conn.commits == 1
+
+
+def test_particionar_de_novo_nao_faz_nada():
+    cur = CursorMigracao(particionada=True)
+    conn = ConexaoMigracao(cur)
+
+    assert particionar_paradas(conn) is False
+    assert len(cur.executados) == 1 and conn.commits == 0
@@ -0,0 +1,76 @@
+import threading
+
+import psycopg2
+from psycopg2 import extensions
+
+from pool_pg import PoolPostgres
+
+
+class ConexaoFalsa:
+    def __init__(self, ao_testar=None):
+        self.closed = False
+        self.testes = 0
+        self.ao_testar = ao_testar
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql):
+        self.testes += 1
+        if self.ao_testar:
+            self.ao_testar()
+
+    def rollback(self):
+        pass
+
+    def get_transaction_status(self):
+        return extensions.TRANSACTION_STATUS_IDLE
+
+    def close(self):
+        self.closed = True
+
+
+def test_select_1_roda_fora_do_lock():
+    conexoes = []
+    pool = PoolPostgres(lambda: conexoes[-1], maximo=2, tempo_ocioso_check=0)
+    outra_thread = []
+
+    def ao_testar():
+        # Outra thread consegue usar o pool enquanto o SELECT 1 roda
+        t = threading.Thread(target=lambda: outra_thread.append(pool.estatisticas()))
+        t.start()
+        t.join(timeout=1)
+        assert outra_thread, "SELECT 1 rodou com o lock do pool"
+
+    conexoes.append(ConexaoFalsa(ao_testar))
+    conn = pool.obter()
+    pool.devolver(conn)
+    assert pool.obter() is conn and conn.testes == 1
+
+
+def test_conexao_que_falha_no_teste_e_trocada():
+    conexoes = [ConexaoFalsa()]
+    pool = PoolPostgres(lambda: conexoes.pop(0), maximo=1, tempo_ocioso_check=0)
+    velha = pool.obter()
+    pool.devolver(velha)
+
+    def falhar():
+        raise psycopg2.OperationalError("servidor reiniciou")
+
+    velha.ao_testar = falhar
+    conexoes.append(ConexaoFalsa())
+    nova = pool.obter()
+    assert nova is not velha and velha.closed
+    assert pool.estatisticas()["total"] == 1
+
+
+def test_aquecer_abre_o_minimo_e_fechar_todas_fecha():
+    abertas = []
+    pool = PoolPostgres(lambda: abertas.append(ConexaoFalsa()) or abertas[-1], minimo=3, maximo=5)
+    pool.aquecer()
+    assert len(abertas) == 3
+    assert pool.estatisticas() == {"total": 3, "livres": 3, "em_uso": 0, "maximo": 5}
+
+    pool.fechar_todas()
+    assert all(c.closed for c in abertas)
+    assert pool.estatisticas()["total"] == 0
@@ -0,0 +1,102 @@
+import pytest
+
+import receptor_compacto as rc
+
+
+def test_frame_binario_ida_e_volta():
+    frame = rc.codificar_binario(3, 48213, 1767261600, 1, "SETUP", "MOTIVO")
+    assert len(frame) == rc.FRAME.size == 14
+
+    [(dado, ack, erro)] = rc.ler_frames(frame)
+    assert erro is None
+    assert dado == {
+        "machine": rc.MAQUINA_ID_FORMATO.format(3),
+        "ts_ms": 48213,
+        "tipo": "MOTIVO",
+        "motivo": "SETUP",
+        "origem": "compacto",
+        "data_hora": "2026-01-01 07:00:00",
+        "estadoLed": 1,
+    }
+    assert rc.ler_ack(ack(rc.ACK_OK)) == (48213, rc.ACK_OK)
+
+
+def test_varios_frames_binarios_num_datagrama():
+    frames = b"".join(
+        rc.codificar_binario(i, i * 10, 0, None if i == 2 else 0, "NONE", "RUN_CYCLE") for i in (1, 2)
+    )
+    primeiro, segundo = (dado for dado, _, _ in rc.ler_frames(frames))
+    assert primeiro["estadoLed"] == 0 and "data_hora" not in primeiro
+    assert "estadoLed" not in segundo  # -1 = só heartbeat
+
+
+def test_csv_ida_e_volta():
+    linha = rc.codificar_csv("Máquina 03", 7, 1767261600, 0, "NONE", "RUN_CYCLE")
+    [(dado, ack, _)] = rc.ler_frames(linha)
+    assert (dado["machine"], dado["ts_ms"], dado["estadoLed"], dado["tipo"]) == ("Máquina 03", 7, 0, "RUN_CYCLE")
+    assert ack(rc.ACK_FALHA) == b"FALHA,7\n"
+    assert rc.ler_ack(ack(rc.ACK_FALHA)) == (7, rc.ACK_FALHA)
+
+
+def test_csv_motivo_por_codigo_e_tipo_padrao():
+    dado, _ = rc.ler_csv("Máquina 03,8,0,1,1")
+    assert dado["motivo"] == "SETUP" and dado["tipo"] == "RUN_CYCLE"
+
+
+@pytest.mark.parametrize(
+    "dados, seq",
+    [
+        (b"\x01" + b"\x00" * 10, None),  # binário truncado
+        (b"\x01\x09" + b"\x00" * 12, 0),  # tipo inexistente
+        (b"Maquina 03,abc,0,1,NONE\n", None),
+        (b"so,tres,campos\n", None),
+        (b"Maquina 03,5,0,1,9\n", 5),  # motivo inexistente
+        (("M" * 51 + ",6,0,1,NONE\n").encode("utf-8"), 6),  # machine maior que a coluna
+        (b"M\xe1quina 03,7,0,1,NONE\n", 7),  # não é UTF-8
+    ],
+)
+def test_frames_invalidos(dados, seq):
+    [(dado, ack, erro)] = rc.ler_frames(dados)
+    assert dado is None and erro
+    if seq is None:
+        assert ack is None
+    else:
+        assert rc.ler_ack(ack(rc.ACK_INVALIDO)) == (seq, rc.ACK_INVALIDO)
+
+
+class TransporteFalso:
+    def __init__(self):
+        self.enviados = []
+
+    def sendto(self, dados, endereco):
+        self.enviados.append((dados, endereco))
+
+
+def test_udp_responde_erro_ao_frame_ruim_e_segue_com_os_bons():
+    recebidos = []
+    receptor = rc.ReceptorCompacto(aplicar=None)
+    receptor.receber = lambda dado, responder: recebidos.append((dado, responder))
+    protocolo = rc.ProtocoloUdp(receptor)
+    protocolo.connection_made(TransporteFalso())
+
+    datagrama = b"".join(
+        [
+            rc.codificar_csv("Máquina 01", 1, 0, 1, "SETUP", "MOTIVO"),
+            b"Maquina 02,2,0,1,9\n",  # motivo inexistente
+            b"lixo\n",  # nem o seq dá para ler
+            rc.codificar_csv("Máquina 03", 3, 0, 0, "NONE", "RUN_CYCLE"),
+        ]
+    )
+    protocolo.datagram_received(datagrama, ("10.0.0.9", 5005))
+
+    assert [dado["machine"] for dado, _ in recebidos] == ["Máquina 01", "Máquina 03"]
+    assert receptor.invalidos == 2
+    assert protocolo.transporte.enviados == [(b"ERRO,2\n", ("10.0.0.9", 5005))]
+
+    # O ack dos bons sai só depois do lote (aqui, na mão)
+    for _, responder in recebidos:
+        responder(rc.ACK_OK)
+    assert [rc.ler_ack(d) for d, _ in protocolo.transporte.enviados[1:]] == [
+        (1, rc.ACK_OK),
+        (3, rc.ACK_OK),
+    ]
@@ -0,0 +1,267 @@
+from concurrent.futures import Future
+from datetime import datetime, timedelta
+
+import pytest
+
+import reprocessamento
+from reprocessamento import ReprocessamentoEmAndamento, reprocessar_paradas
+
+T0 = datetime(2025, 11, 3, 8, 0, 0)
+M = "Máquina 01"
+THRESHOLD = 0.1  # min (6 s)
+
+
+def bruto(segundos: float, estado_led: int, tipo: str = "RUN_CYCLE", motivo: str = "NONE"):
+    """Linha de eventos_brutos como SQL_EVENTOS_MAQUINA devolve."""
+    return (T0 + timedelta(seconds=segundos), int(segundos * 1000) + 1, tipo, estado_led, motivo)
+
+
+def texto(sql: str) -> str:
+    return " ".join(sql.split())
+
+
+class CursorReproc:
+    """Cursor falso do reprocessamento: guarda o SQL e responde pelo último."""
+
+    def __init__(self, linhas=(), novos=(), maquinas=(), travado=False, marca=100):
+        self.linhas = list(linhas)
+        self.novos = list(novos)
+        self.maquinas = list(maquinas)
+        self.travado = travado
+        self.marca = marca
+        self.executados = []
+        self.rowcount = 0
+        self.ultimo = ""
+
+    def execute(self, sql, params=None):
+        self.ultimo = texto(sql)
+        self.executados.append((self.ultimo, params))
+        if self.ultimo.startswith("DELETE FROM paradas p"):
+            self.rowcount = 4
+
+    def fetchone(self):
+        if "pg_try_advisory_lock" in self.ultimo:
+            return (not self.travado,)
+        return (self.marca,)
+
+    def fetchall(self):
+        if "id > %s" in self.ultimo:
+            return self.novos
+        return [(m,) for m in self.maquinas]
+
+    def fetchmany(self, n):
+        lote, self.linhas = self.linhas[:n], self.linhas[n:]
+        return lote
+
+    def close(self):
+        pass
+
+    def sqls(self):
+        return [sql for sql, _ in self.executados]
+
+
+class ConexaoReproc:
+    def __init__(self, cur):
+        self.cur = cur
+        self.commits = 0
+        self.rollbacks = 0
+        self.fechada = False
+
+    def cursor(self, name=None):
+        return self.cur
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def close(self):
+        self.fechada = True
+
+
+class ExecutorSincrono:
+    """ProcessPoolExecutor no mesmo processo (os workers spawn não veriam os monkeypatch)."""
+
+    def __init__(self, **_):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        return False
+
+    def submit(self, funcao, *args):
+        futuro = Future()
+        futuro.set_result(funcao(*args))
+        return futuro
+
+
+@pytest.fixture
+def banco(monkeypatch):
+    """Troca connect/execute_values; execute_values vira um execute com as linhas."""
+    def conectar(cur):
+        conn = ConexaoReproc(cur)
+        monkeypatch.setattr(reprocessamento.psycopg2, "connect", lambda **_: conn)
+        return conn
+
+    def execute_values(cur, sql, linhas, **_):
+        cur.execute(sql, list(linhas))
+
+    monkeypatch.setattr(reprocessamento, "execute_values", execute_values)
+    monkeypatch.setattr(reprocessamento, "ProcessPoolExecutor", ExecutorSincrono)
+    return conectar
+
+
+def inseridas(cur):
+    return [
+        linha
+        for sql, params in cur.executados
+        if sql.startswith("INSERT INTO paradas_reprocessadas")
+        for linha in params
+    ]
+
+
+# ---------------------------------------------------------------------
+# UMA MÁQUINA (passo 2)
+# ---------------------------------------------------------------------
+
+EVENTOS = [
+    bruto(0, 1),
+    bruto(30, 1, "MOTIVO", "SETUP"),
+    bruto(300, 0),
+    bruto(400, 1),
+    bruto(402, 0),  # piscada: descartada
+    bruto(500, 1, "MOTIVO", "SETUP"),
+]
+
+
+@pytest.mark.parametrize("lote", [1, 2, 4, 100])
+def test_blocos_do_cursor_nao_mudam_o_resultado(banco, lote):
+    cur = CursorReproc(EVENTOS)
+    banco(cur)
+
+    machine, primeiro, final, totais = reprocessamento._reprocessar_maquina(
+        {}, M, 100, THRESHOLD, lote
+    )
+
+    assert (machine, primeiro) == (M, T0)
+    assert inseridas(cur) == [(M, "Setup", T0, T0 + timedelta(seconds=300), 5.0)]
+    assert final["reason"] == "Setup"
+    assert final["start_time"] == T0 + timedelta(seconds=500)
+    assert totais == {"eventos": 6, "fechadas": 1, "descartadas": 1}
+    assert cur.executados[0] == (texto(reprocessamento.SQL_EVENTOS_MAQUINA), (M, 100))
+
+
+def test_maquina_sem_eventos_ate_a_marca(banco):
+    banco(CursorReproc([]))
+    assert reprocessamento._reprocessar_maquina({}, M, 0, THRESHOLD, 10) == (
+        M, None, None, {"eventos": 0, "fechadas": 0, "descartadas": 0},
+    )
+
+
+# ---------------------------------------------------------------------
+# TROCA (passo 3)
+# ---------------------------------------------------------------------
+
+def resultado_maquinas(monkeypatch, resultados):
+    """_reprocessar_maquina devolve o passo 2 pronto de cada máquina."""
+    monkeypatch.setattr(
+        reprocessamento,
+        "_reprocessar_maquina",
+        lambda _p, machine, *args: resultados[machine],
+    )
+
+
+def test_eventos_durante_o_reprocessamento_continuam_a_parada_final(banco, monkeypatch):
+    aberta = {"reason": "Setup", "start_time": T0, "persistida": False, "alterada": True}
+    resultado_maquinas(monkeypatch, {
+        M: (M, T0, aberta, {"eventos": 2, "fechadas": 0, "descartadas": 0}),
+        "Vazia": ("Vazia", None, None, {"eventos": 0, "fechadas": 0, "descartadas": 0}),
+    })
+    cur = CursorReproc(novos=[(M, *bruto(300, 0)), (M, *bruto(600, 1))])
+    conn = banco(cur)
+
+    totais = reprocessar_paradas({}, THRESHOLD, maquinas=[M, "Vazia"])
+
+    # o que chegou depois da marca fecha a aberta do passo 2 e abre outra
+    assert inseridas(cur) == [
+        (M, "Setup", T0, T0 + timedelta(seconds=300), 5.0),
+        (M, "Sem motivo", T0 + timedelta(seconds=600), None, None),
+    ]
+    assert (totais["eventos"], totais["eventos_durante"]) == (4, 2)
+    assert (totais["fechadas"], totais["abertas"]) == (1, 1)
+    assert totais["paradas_substituidas"] == 4
+    novos = next(p for s, p in cur.executados if "id > %s" in s)
+    assert novos == (100, [M])  # máquina sem eventos não entra na troca
+    assert conn.rollbacks == 0 and conn.fechada
+
+
+def test_troca_apaga_antes_de_inserir_e_recalcula_agregados_depois(banco, monkeypatch):
+    desde = T0 + timedelta(hours=5)
+    resultado_maquinas(monkeypatch, {
+        M: (M, desde, None, {"eventos": 1, "fechadas": 0, "descartadas": 0}),
+        "M2": ("M2", T0, None, {"eventos": 1, "fechadas": 0, "descartadas": 0}),
+    })
+    cur = CursorReproc()
+    banco(cur)
+
+    reprocessar_paradas({}, THRESHOLD, maquinas=[M, "M2"])
+
+    sqls = cur.sqls()
+
+    def posicao(inicio):
+        return next(i for i, s in enumerate(sqls) if s.startswith(inicio))
+
+    ordem = [
+        posicao("CREATE UNLOGGED TABLE paradas_reprocessadas"),
+        posicao("SELECT COALESCE(MAX(id), 0) FROM eventos_brutos"),
+        posicao("LOCK TABLE paradas IN EXCLUSIVE MODE"),
+        posicao("SELECT machine, data_hora"),
+        posicao("DELETE FROM paradas p"),
+        posicao("INSERT INTO paradas (machine"),
+        posicao("DELETE FROM paradas_agregado"),
+        posicao("SELECT pg_advisory_unlock"),
+    ]
+    assert ordem == sorted(ordem)
+    apagar = cur.executados[posicao("DELETE FROM paradas p")][1]
+    assert sorted(apagar) == [("M2", T0), (M, desde)]
+    # agregados a partir do dia do primeiro evento mais antigo
+    assert cur.executados[posicao("DELETE FROM paradas_agregado")][1] == (T0.replace(hour=0),)
+
+
+def test_falha_na_troca_desfaz_e_solta_a_trava(banco, monkeypatch):
+    resultado_maquinas(monkeypatch, {
+        M: (M, T0, None, {"eventos": 1, "fechadas": 0, "descartadas": 0}),
+    })
+
+    class CursorQuebra(CursorReproc):
+        def execute(self, sql, params=None):
+            super().execute(sql, params)
+            if self.ultimo.startswith("DELETE FROM paradas p"):
+                raise RuntimeError("falha simulada")
+
+    cur = CursorQuebra()
+    conn = banco(cur)
+
+    with pytest.raises(RuntimeError):
+        reprocessar_paradas({}, THRESHOLD, maquinas=[M])
+
+    assert conn.rollbacks == 1 and conn.fechada
+    assert not any(s.startswith("INSERT INTO paradas (machine") for s in cur.sqls())
+    assert cur.sqls()[-2:] == [
+        "DROP TABLE IF EXISTS paradas_reprocessadas",
+        "SELECT pg_advisory_unlock(%s)",
+    ]
+
+
+def test_segundo_reprocessamento_e_recusado(banco):
+    cur = CursorReproc(travado=True)
+    conn = banco(cur)
+
+    with pytest.raises(ReprocessamentoEmAndamento):
+        reprocessar_paradas({}, THRESHOLD, maquinas=[M])
+
+    assert conn.fechada
+    assert cur.sqls() == ["SELECT pg_try_advisory_lock(%s)"]
@@ -0,0 +1,100 @@
+from types import SimpleNamespace
+
+import pytest
+
+import vigia_comunicacao
+from estado_compartilhado import criar_backend
+from vigia_comunicacao import VigiaComunicacao
+
+SILENCIO_S = 120
+
+
+class Relogio:
+    def __init__(self):
+        self.agora = 1000.0
+
+    def time(self):
+        return self.agora
+
+
+@pytest.fixture
+def relogio(monkeypatch):
+    relogio = Relogio()
+    monkeypatch.setattr(vigia_comunicacao, "time", SimpleNamespace(time=relogio.time))
+    return relogio
+
+
+def criar_vigia(monkeypatch, backend=None, deve_vigiar=None):
+    silenciadas = []
+    vigia = VigiaComunicacao(
+        backend or criar_backend("memoria"),
+        SILENCIO_S,
+        lambda machine, registro: silenciadas.append((machine, registro)),
+        deve_vigiar=deve_vigiar,
+    )
+    monkeypatch.setattr(vigia, "_garantir_thread", lambda: None)  # sem thread: _verificar na mão
+    return vigia, silenciadas
+
+
+def test_sinal_empurra_o_prazo(monkeypatch, relogio):
+    vigia, _ = criar_vigia(monkeypatch)
+    vigia.sinal("M1", "2025-11-03 10:00:00", 5000, 0)
+    assert vigia._prazos["M1"] == relogio.agora + SILENCIO_S
+
+    relogio.agora += 30
+    vigia.sinal("M1", "2025-11-03 10:00:30", 35000, None)  # heartbeat mantém o LED
+    assert vigia._prazos["M1"] == relogio.agora + SILENCIO_S
+    assert vigia.backend.obter("visto:M1")["estado"] == 0
+
+
+def test_prazo_vencido_marca_sem_comunicacao_uma_vez(monkeypatch, relogio):
+    vigia, silenciadas = criar_vigia(monkeypatch)
+    vigia.sinal("M1", "2025-11-03 10:00:00", 5000, 1)
+
+    relogio.agora += SILENCIO_S + 1
+    vigia._verificar("M1")
+    vigia._verificar("M1")
+
+    assert [(m, r["ts_ms"], r["estado"]) for m, r in silenciadas] == [("M1", 5000, 1)]
+    assert vigia.silenciadas() == ["M1"]
+
+
+def test_outro_worker_ouviu_a_maquina(monkeypatch, relogio):
+    backend = criar_backend("memoria")
+    vigia, silenciadas = criar_vigia(monkeypatch, backend)
+    outro, _ = criar_vigia(monkeypatch, backend)
+    vigia.sinal("M1", "2025-11-03 10:00:00", 5000, 0)
+
+    relogio.agora += SILENCIO_S / 2
+    outro.sinal("M1", "2025-11-03 10:01:00", 65000, 0)
+    relogio.agora += SILENCIO_S / 2 + 1
+    vigia._verificar("M1")
+
+    assert silenciadas == []
+    assert vigia._prazos["M1"] == backend.obter("visto:M1")["t"] + SILENCIO_S
+
+
+@pytest.mark.parametrize("estado, vigiar", [(2, True), (0, False)])
+def test_desligada_ou_fora_do_turno_nao_e_marcada(monkeypatch, relogio, estado, vigiar):
+    vigia, silenciadas = criar_vigia(monkeypatch, deve_vigiar=lambda machine: vigiar)
+    vigia.sinal("M1", "2025-11-03 10:00:00", 5000, estado)
+    relogio.agora += SILENCIO_S + 1
+    vigia._verificar("M1")
+    assert silenciadas == []
+
+
+def test_reconexao_so_para_heartbeat_ou_log_sem_led(monkeypatch, relogio):
+    vigia, _ = criar_vigia(monkeypatch)
+    vigia.sinalizar([{"machine": "M1", "estadoLed": 1, "ts_ms": 5000}], "M?", "2025-11-03 10:00:00")
+    vigia.sinalizar([{"machine": "M2", "estadoLed": 0, "ts_ms": 6000}], "M?", "2025-11-03 10:00:00")
+    relogio.agora += SILENCIO_S + 1
+    vigia._verificar("M1")
+    vigia._verificar("M2")
+
+    # M1 volta só com heartbeat: reconexão com o LED de antes. M2 volta
+    # com estadoLed, que já fecha a parada sozinho.
+    reconexoes = vigia.sinalizar(
+        [{"machine": "M1"}, {"machine": "M2", "estadoLed": 0}], "M?", "2025-11-03 10:05:00"
+    )
+    assert reconexoes == [("M1", 1, "2025-11-03 10:05:00", 0)]
+    assert vigia.silenciadas() == []
@@ -0,0 +1,194 @@
+import heapq
+import logging
+import os
+import threading
+import time
+
+# =====================================================================
+# VIGIA DE COMUNICAÇÃO (heartbeat → parada "Sem comunicação")
+# =====================================================================
+#
+# Cada log ou heartbeat de uma máquina empurra o prazo dela para
+# agora + silencio_s. Os prazos ficam num heap (uma entrada por máquina,
+# a mais próxima no topo) e uma thread por processo dorme até o próximo
+# vencer — nada de varrer máquinas nem consultar o banco.
+#
+# Com vários workers, cada um só vê parte do tráfego: o último sinal de
+# cada máquina fica no estado compartilhado ("visto:<machine>", gravado
+# no máximo a cada silencio_s/4 por máquina e processo). Quando um prazo
+# local vence, a thread confere essa chave; se outro worker ouviu a
+# máquina, só reagenda. Se não, marca "silenciada" e chama ao_silenciar(),
+# que gera o evento SEM_COMUNICACAO (ver maquina_estados.py). O próximo
+# sinal da máquina devolve o registro de quando ela silenciou para quem
+# chamou sinal(), que gera o evento de reconexão quando o sinal não for um
+# log com estadoLed (esse já fecha a parada sozinho).
+#
+# Máquina desligada (LED 2) ou fora do turno (deve_vigiar) não é marcada.
+
+log = logging.getLogger("maroni.vigia")
+
+PREFIXO = "visto:"
+
+
+class VigiaComunicacao:
+    def __init__(self, backend, silencio_s: float, ao_silenciar, deve_vigiar=None):
+        self.backend = backend
+        self.silencio_s = silencio_s
+        self.ao_silenciar = ao_silenciar
+        self.deve_vigiar = deve_vigiar or (lambda machine: True)
+
+        self._cond = threading.Condition()
+        self._heap = []  # (prazo, machine), no máximo uma entrada por máquina
+        self._prazos = {}  # machine -> prazo atual (pode ser maior que o do heap)
+        self._gravado = {}  # machine -> (time.time(), estado) da última gravação
+        self._thread = None
+        self._pid = None
+
+        self.silenciadas_total = 0
+
+    # -----------------------------------------------------------------
+    # SINAIS (chamados pelas requisições)
+    # -----------------------------------------------------------------
+
+    def sinal(self, machine: str, data_hora: str, ts_ms: int, estado):
+        """
+        Registra que a máquina falou agora. data_hora/ts_ms/estado: do
+        último log dela (estado None = heartbeat sem LED, mantém o anterior).
+        Se ela estava marcada como sem comunicação, retorna o registro de
+        quando silenciou ({data_hora, ts_ms, estado, ...}); senão None.
+        """
+        self._garantir_thread()
+        agora = time.time()
+        chave = PREFIXO + machine
+        registro = self.backend.obter(chave)
+        silenciada = bool(registro and registro.get("silenciada"))
+        if estado is None:
+            estado = registro.get("estado") if registro else None
+
+        gravado = self._gravado.get(machine)
+        if (
+            silenciada
+            or registro is None
+            or gravado is None
+            or gravado[1] != estado
+            or agora - gravado[0] >= self.silencio_s / 4
+        ):
+            self.backend.gravar(
+                chave,
+                {"t": agora, "data_hora": data_hora, "ts_ms": ts_ms, "estado": estado, "silenciada": False},
+            )
+            self._gravado[machine] = (agora, estado)
+
+        self._agendar(machine, agora + self.silencio_s)
+        return registro if silenciada else None
+
+    def sinalizar(self, dados: list, maquina_padrao: str, agora_texto: str) -> list:
+        """
+        sinal() com o último log de cada máquina de um lote (/log, /log/batch,
+        /heartbeat). Retorna [(machine, estado, data_hora, ts_ms)] das que
+        estavam sem comunicação e voltaram só com log sem estadoLed /
+        heartbeat: para essas, quem chamou gera o evento de reconexão.
+        """
+        ultimos = {}
+        for dado in dados:
+            if not isinstance(dado, dict):
+                continue
+            machine = dado.get("machine") or maquina_padrao
+            estado = dado.get("estadoLed")
+            anterior = ultimos.get(machine)
+            if not isinstance(estado, int):
+                estado = anterior["estado"] if anterior else None
+            ultimos[machine] = {"dado": dado, "estado": estado}
+
+        reconexoes = []
+        for machine, ultimo in ultimos.items():
+            dado = ultimo["dado"]
+            data_hora = dado.get("data_hora") or agora_texto
+            try:
+                ts_ms = int(dado.get("ts_ms") or 0)
+            except (ValueError, TypeError):
+                ts_ms = 0
+            silenciada = self.sinal(machine, data_hora, ts_ms, ultimo["estado"])
+            if silenciada and ultimo["estado"] is None and silenciada.get("estado") in (0, 1):
+                reconexoes.append((machine, silenciada["estado"], data_hora, ts_ms))
+        return reconexoes
+
+    def acompanhar(self, machines):
+        """Agenda máquinas que este processo ainda não ouviu (ex.: ao subir)."""
+        self._garantir_thread()
+        prazo = time.time() + self.silencio_s
+        for machine in machines:
+            if machine not in self._prazos:
+                self._agendar(machine, prazo)
+
+    def silenciadas(self) -> list:
+        return sorted(
+            chave[len(PREFIXO):]
+            for chave, registro in self.backend.itens(PREFIXO).items()
+            if registro.get("silenciada")
+        )
+
+    def _agendar(self, machine: str, prazo: float):
+        with self._cond:
+            anterior = self._prazos.get(machine)
+            self._prazos[machine] = prazo
+            if anterior is None:
+                heapq.heappush(self._heap, (prazo, machine))
+                if self._heap[0][1] == machine:
+                    self._cond.notify()
+            # Se já estava no heap, a entrada antiga é corrigida quando vencer
+
+    # -----------------------------------------------------------------
+    # THREAD
+    # -----------------------------------------------------------------
+
+    def _garantir_thread(self):
+        if self._pid == os.getpid():
+            return
+        with self._cond:
+            if self._pid == os.getpid():
+                return
+            self._heap = []
+            self._prazos = {}
+            self._gravado = {}
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._loop, name="vigia-comunicacao", daemon=True)
+            self._thread.start()
+
+    def _loop(self):
+        while True:
+            with self._cond:
+                while not self._heap or self._heap[0][0] > time.time():
+                    espera = self._heap[0][0] - time.time() if self._heap else None
+                    self._cond.wait(espera)
+                prazo, machine = heapq.heappop(self._heap)
+                atual = self._prazos.get(machine)
+                if atual is not None and atual > prazo:
+                    heapq.heappush(self._heap, (atual, machine))
+                    continue
+                del self._prazos[machine]
+
+            try:
+                self._verificar(machine)
+            except Exception:
+                log.exception("Vigia: falha ao verificar %s", machine)
+
+    def _verificar(self, machine: str):
+        agora = time.time()
+        chave = PREFIXO + machine
+        registro = self.backend.obter(chave)
+        if registro is None or registro.get("silenciada") or registro.get("estado") not in (0, 1):
+            return  # nunca falou, já marcada ou desligada: volta com o próximo sinal
+
+        ultimo = registro["t"]
+        if agora - ultimo < self.silencio_s:
+            self._agendar(machine, ultimo + self.silencio_s)  # outro worker ouviu
+            return
+        if not self.deve_vigiar(machine):
+            self._agendar(machine, agora + self.silencio_s)
+            return
+
+        self.backend.gravar(chave, {**registro, "silenciada": True})
+        self.silenciadas_total += 1
+        log.warning("%s sem comunicação há %.0fs", machine, agora - ultimo)
+        self.ao_silenciar(machine, registro)